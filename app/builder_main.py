@@ -1,22 +1,25 @@
-import csv
-import json
-import hashlib
 import logging
 import os
-from io import StringIO
-from typing import Dict, Optional
+import pickle
+import tempfile
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
-from fastapi import FastAPI, File, HTTPException, UploadFile
-from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.responses import FileResponse, HTMLResponse, RedirectResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from pydantic import ValidationError
+from starlette.background import BackgroundTask
 
-from .models import FormsConfig
+from .models import FormsConfig, KnowledgeBaseConfig
 from .google_oauth import (
     build_google_flow,
     build_oauth_state,
     credentials_to_token,
     parse_oauth_state,
 )
+from .config import env_bool
+from .db import pool_stats
 from .seed import load_seed_config
 from .storage import (
     get_agent_id,
@@ -25,27 +28,54 @@ from .storage import (
     get_thread_messages,
     get_oauth_credential,
     list_form_submissions,
+    stream_form_submissions,
     list_knowledge_bases,
     list_threads,
+    get_trace,
     list_traces,
     list_versions,
     list_agents,
     get_usage_metrics,
+    list_usage_rollups,
     publish_config,
     delete_oauth_credential,
     upsert_draft_config,
     upsert_oauth_credential,
     create_knowledge_base,
+    update_knowledge_base_settings,
+    KB_QUANTIZATION_MODES,
     add_kb_document,
-    search_kb_documents,
+    KbFilePlan,
+    KbFileSync,
+    kb_file_sync,
     delete_knowledge_base,
+    get_kb_deletion_status,
+    get_kb_profiles,
     delete_kb_file,
     list_kb_files,
     list_kb_file_chunks,
+    get_kb_build,
+    list_kb_builds,
 )
-from .cache import build_cache_key, cache_get, cache_set, get_redis
-from .embeddings import embed_text
-from .kb import chunk_text, read_text_from_upload
+from .embeddings import default_embedding_model, embed_text, embed_texts
+from .retrieval import search_knowledge_base, search_knowledge_bases
+from .kb import (
+    content_hash,
+    ensure_supported_upload,
+    file_digest,
+    estimate_tokens,
+    iter_chunks,
+    iter_parsed_documents,
+    shutdown_parse_pool,
+    stage_uploads,
+)
+from .kb_index import resume_kb_indexes, start_kb_index
+from .kb_purge import resume_kb_purges, start_kb_purge
+from .kb_rebuild import resume_kb_rebuilds, start_kb_rebuild
+from .log_retention import start_log_maintenance
+from .kb_snapshot import export_kb_snapshot, import_kb_snapshot
+from .submission_export import EXPORT_FORMATS, encode_submissions, field_columns
+from .minhash import NearDuplicateIndex, band_keys, signature
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -61,18 +91,36 @@ app.add_middleware(
 )
 
 
-def _env_bool(name: str, default: bool = False) -> bool:
-    value = os.getenv(name)
-    if value is None:
-        return default
-    return value.strip().lower() in {"1", "true", "yes", "on"}
-
-
 @app.on_event("startup")
 async def ensure_seed_config() -> None:
     _ensure_draft_config()
 
 
+@app.on_event("startup")
+def resume_kb_deletions() -> None:
+    resume_kb_purges()
+
+
+@app.on_event("startup")
+def resume_kb_builds() -> None:
+    resume_kb_rebuilds()
+
+
+@app.on_event("startup")
+def resume_kb_index_builds() -> None:
+    resume_kb_indexes()
+
+
+@app.on_event("startup")
+def start_log_partition_maintenance() -> None:
+    start_log_maintenance()
+
+
+@app.on_event("shutdown")
+def stop_parse_pool() -> None:
+    shutdown_parse_pool()
+
+
 def _ensure_draft_config() -> None:
     tenant_id = get_tenant_id()
     agent_id = get_agent_id()
@@ -97,10 +145,11 @@ def runtime_settings():
         "TENANT_ID": os.getenv("TENANT_ID", ""),
         "AGENT_ID": os.getenv("AGENT_ID", ""),
         "CACHE_TTL_SECONDS": int(os.getenv("CACHE_TTL_SECONDS", "900")),
+        "KB_CACHE_TTL_SECONDS": int(os.getenv("KB_CACHE_TTL_SECONDS", "86400")),
         "EMBEDDING_MODEL": os.getenv("EMBEDDING_MODEL", ""),
         "LLM_MODEL": os.getenv("LLM_MODEL", ""),
-        "LLM_ROUTING_ENABLED": _env_bool("LLM_ROUTING_ENABLED", False),
-        "LLM_EXTRACTION_ENABLED": _env_bool("LLM_EXTRACTION_ENABLED", False),
+        "LLM_ROUTING_ENABLED": env_bool("LLM_ROUTING_ENABLED", False),
+        "LLM_EXTRACTION_ENABLED": env_bool("LLM_EXTRACTION_ENABLED", False),
         "AZURE_OPENAI_ENDPOINT": os.getenv("AZURE_OPENAI_ENDPOINT", ""),
         "AZURE_OPENAI_API_VERSION": os.getenv("AZURE_OPENAI_API_VERSION", ""),
         "AZURE_OPENAI_DEPLOYMENT": os.getenv("AZURE_OPENAI_DEPLOYMENT", ""),
@@ -121,6 +170,24 @@ def usage_stats():
     return metrics
 
 
+@app.get("/stats/db-pool")
+def db_pool_stats():
+    return pool_stats()
+
+
+@app.get("/stats/usage/rollups")
+def usage_rollups(granularity: str = "day", since: Optional[datetime] = None, until: Optional[datetime] = None):
+    tenant_id = get_tenant_id()
+    agent_id = get_agent_id()
+    if since is None:
+        since = datetime.now(timezone.utc) - timedelta(days=7)
+    try:
+        rollups = list_usage_rollups(tenant_id, agent_id, granularity, since, until)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return {"granularity": granularity, "rollups": rollups}
+
+
 @app.get("/agents")
 def list_agents_endpoint():
     tenant_id = get_tenant_id()
@@ -189,24 +256,79 @@ def get_published_version(version: int):
 
 
 @app.get("/threads")
-def list_chat_threads():
+def list_chat_threads(
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    completed: Optional[bool] = None,
+    form_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
     tenant_id = get_tenant_id()
     agent_id = get_agent_id()
-    return {"threads": list_threads(tenant_id, agent_id)}
+    try:
+        return list_threads(
+            tenant_id,
+            agent_id,
+            limit=limit,
+            cursor=cursor,
+            completed=completed,
+            form_id=form_id,
+            since=since,
+            until=until,
+        )
+    except RuntimeError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
 
 
 @app.get("/threads/{thread_id}/messages")
-def list_chat_messages(thread_id: str):
+def list_chat_messages(thread_id: str, limit: int = 200, cursor: Optional[str] = None):
     tenant_id = get_tenant_id()
     agent_id = get_agent_id()
-    return {"thread_id": thread_id, "messages": get_thread_messages(tenant_id, agent_id, thread_id)}
+    try:
+        page = get_thread_messages(tenant_id, agent_id, thread_id, limit=limit, cursor=cursor)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return {"thread_id": thread_id, **page}
 
 
 @app.get("/traces")
-def list_trace_logs(thread_id: str | None = None):
+def list_trace_logs(
+    thread_id: str | None = None,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    status: Optional[str] = None,
+):
     tenant_id = get_tenant_id()
     agent_id = get_agent_id()
-    return {"traces": list_traces(tenant_id, agent_id, thread_id=thread_id)}
+    try:
+        return list_traces(
+            tenant_id,
+            agent_id,
+            thread_id=thread_id,
+            limit=limit,
+            cursor=cursor,
+            since=since,
+            until=until,
+            status=status,
+        )
+    except RuntimeError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+@app.get("/traces/{trace_id}")
+def get_trace_log(trace_id: str):
+    tenant_id = get_tenant_id()
+    agent_id = get_agent_id()
+    try:
+        trace = get_trace(tenant_id, agent_id, trace_id)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    if not trace:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return trace
 
 
 @app.get("/submissions")
@@ -217,12 +339,12 @@ def list_submissions(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     limit: int = 50,
-    offset: int = 0,
+    cursor: Optional[str] = None,
 ):
     tenant_id = get_tenant_id()
     agent_id = get_agent_id()
-    return {
-        "items": list_form_submissions(
+    try:
+        return list_form_submissions(
             tenant_id,
             agent_id,
             form_id=form_id,
@@ -231,9 +353,10 @@ def list_submissions(
             start_date=start_date,
             end_date=end_date,
             limit=limit,
-            offset=offset,
+            cursor=cursor,
         )
-    }
+    except RuntimeError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
 
 
 @app.get("/submissions/export")
@@ -243,51 +366,26 @@ def export_submissions(
     delivery_type: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
+    format: str = "csv",
 ):
     tenant_id = get_tenant_id()
     agent_id = get_agent_id()
-    items = list_form_submissions(
-        tenant_id,
-        agent_id,
-        form_id=form_id,
-        thread_id=thread_id,
-        delivery_type=delivery_type,
-        start_date=start_date,
-        end_date=end_date,
-        limit=1000,
-        offset=0,
-    )
-    output = StringIO()
-    writer = csv.writer(output)
-    headers = [
-        "id",
-        "created_at",
-        "form_id",
-        "form_name",
-        "thread_id",
-        "delivery_type",
-        "delivery_status",
-        "delivery_target",
-        "payload",
-    ]
-    writer.writerow(headers)
-    for item in items:
-        writer.writerow(
-            [
-                item.get("id"),
-                item.get("created_at"),
-                item.get("form_id"),
-                item.get("form_name"),
-                item.get("thread_id"),
-                item.get("delivery_type"),
-                item.get("delivery_status"),
-                item.get("delivery_target"),
-                json.dumps(item.get("payload", {})),
-            ]
+    forms = (get_draft_config(tenant_id, agent_id) or {}).get("forms")
+    try:
+        items = stream_form_submissions(
+            tenant_id,
+            agent_id,
+            form_id=form_id,
+            thread_id=thread_id,
+            delivery_type=delivery_type,
+            start_date=start_date,
+            end_date=end_date,
         )
-    output.seek(0)
-    response = StreamingResponse(iter([output.getvalue()]), media_type="text/csv")
-    response.headers["Content-Disposition"] = "attachment; filename=submissions.csv"
+        body = encode_submissions(items, format, field_columns(forms, form_id))
+    except RuntimeError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    response = StreamingResponse(body, media_type=EXPORT_FORMATS[format])
+    response.headers["Content-Disposition"] = f"attachment; filename=submissions.{format}"
     return response
 
 
@@ -372,15 +470,151 @@ def create_kb(payload: Dict):
         raise HTTPException(status_code=400, detail="name is required")
     description = payload.get("description", "")
     provider = payload.get("provider", "pgvector")
-    kb_id = create_knowledge_base(tenant_id, name, description, provider)
+    quantization = _validate_quantization(payload.get("quantization", "none"))
+    embedding_model, embedding_dimensions = _validate_embedding_spec(payload)
+    kb_id = create_knowledge_base(
+        tenant_id,
+        name,
+        description,
+        provider,
+        quantization=quantization,
+        embedding_model=embedding_model,
+        embedding_dimensions=embedding_dimensions,
+    )
     return {"id": kb_id}
 
 
+@app.patch("/knowledge-bases/{kb_id}")
+def update_kb(kb_id: int, payload: Dict):
+    tenant_id = get_tenant_id()
+    quantization = _validate_quantization(payload["quantization"]) if "quantization" in payload else None
+    embedding_model, embedding_dimensions = _validate_embedding_spec(payload)
+    try:
+        updated = update_knowledge_base_settings(
+            tenant_id,
+            kb_id,
+            quantization=quantization,
+            embedding_model=embedding_model,
+            embedding_dimensions=embedding_dimensions,
+        )
+    except RuntimeError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    if not updated:
+        raise HTTPException(status_code=404, detail="Knowledge base not found")
+    # A new quantization mode applies once its index is built in the background; searches keep the old one until then.
+    start_kb_index(tenant_id, kb_id)
+    return {"id": kb_id, "quantization_pending": quantization is not None}
+
+
+def _validate_embedding_spec(payload: Dict) -> Tuple[Optional[str], Optional[int]]:
+    """Per-KB embedding model and optional truncated dimensions (text-embedding-3 models)."""
+    model = payload.get("embedding_model") or None
+    dimensions = payload.get("embedding_dimensions") or None
+    if dimensions is not None:
+        try:
+            dimensions = int(dimensions)
+        except (TypeError, ValueError) as exc:
+            raise HTTPException(status_code=400, detail="embedding_dimensions must be an integer") from exc
+        if dimensions <= 0:
+            raise HTTPException(status_code=400, detail="embedding_dimensions must be positive")
+        # Dimensions are only requested for an explicit model; pin the current default.
+        model = model or default_embedding_model()
+    return model, dimensions
+
+
+def _validate_quantization(value: str) -> str:
+    if value not in KB_QUANTIZATION_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"quantization must be one of: {', '.join(KB_QUANTIZATION_MODES)}",
+        )
+    return value
+
+
 @app.delete("/knowledge-bases/{kb_id}")
 def delete_kb(kb_id: int):
     tenant_id = get_tenant_id()
-    delete_knowledge_base(tenant_id, kb_id)
-    return {"status": "ok"}
+    if not delete_knowledge_base(tenant_id, kb_id) and get_kb_deletion_status(tenant_id, kb_id) is None:
+        raise HTTPException(status_code=404, detail="Knowledge base not found")
+    start_kb_purge(tenant_id, kb_id)
+    return {"status": "deleting", "kb_id": kb_id}
+
+
+@app.post("/knowledge-bases/{kb_id}/rebuild")
+def rebuild_kb(kb_id: int, payload: Optional[Dict] = None):
+    """Re-chunk/re-embed into a shadow build and switch to it once it passes the recall check."""
+    tenant_id = get_tenant_id()
+    payload = payload or {}
+    settings: Dict[str, Any] = {}
+    if "quantization" in payload:
+        settings["quantization"] = _validate_quantization(payload["quantization"])
+    if "embedding_model" in payload or "embedding_dimensions" in payload:
+        settings["embedding_model"], settings["embedding_dimensions"] = _validate_embedding_spec(payload)
+    for key in ("chunk_size", "chunk_overlap"):
+        if key in payload:
+            try:
+                settings[key] = int(payload[key])
+            except (TypeError, ValueError) as exc:
+                raise HTTPException(status_code=400, detail=f"{key} must be an integer") from exc
+    try:
+        build = start_kb_rebuild(tenant_id, kb_id, settings)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return build
+
+
+@app.get("/knowledge-bases/{kb_id}/builds")
+def list_kb_builds_endpoint(kb_id: int):
+    tenant_id = get_tenant_id()
+    return {"items": list_kb_builds(tenant_id, kb_id)}
+
+
+@app.get("/knowledge-bases/{kb_id}/builds/{build_id}")
+def get_kb_build_endpoint(kb_id: int, build_id: int):
+    tenant_id = get_tenant_id()
+    build = get_kb_build(tenant_id, build_id)
+    if build is None or build["kb_id"] != kb_id:
+        raise HTTPException(status_code=404, detail="Build not found")
+    return build
+
+
+@app.get("/knowledge-bases/{kb_id}/snapshot")
+def export_kb_snapshot_endpoint(kb_id: int, dtype: str = "float32"):
+    tenant_id = get_tenant_id()
+    target = tempfile.NamedTemporaryFile(prefix="kb-snapshot-", suffix=".zip", delete=False)
+    try:
+        with target:
+            export_kb_snapshot(tenant_id, kb_id, target, dtype=dtype)
+    except RuntimeError as exc:
+        os.unlink(target.name)
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return FileResponse(
+        target.name,
+        media_type="application/zip",
+        filename=f"kb-{kb_id}-snapshot.zip",
+        background=BackgroundTask(os.unlink, target.name),
+    )
+
+
+@app.post("/knowledge-bases/import")
+def import_kb_snapshot_endpoint(file: UploadFile = File(...), name: Optional[str] = Form(None)):
+    tenant_id = get_tenant_id()
+    try:
+        result = import_kb_snapshot(tenant_id, file.file, name=name)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    start_kb_index(tenant_id, result["id"])
+    return result
+
+
+@app.get("/knowledge-bases/{kb_id}/deletion")
+def kb_deletion_status(kb_id: int):
+    tenant_id = get_tenant_id()
+    status = get_kb_deletion_status(tenant_id, kb_id)
+    if status is None:
+        # Purged KBs are removed entirely.
+        raise HTTPException(status_code=404, detail="Knowledge base not found")
+    return status
 
 
 @app.get("/knowledge-bases/{kb_id}/files")
@@ -410,39 +644,286 @@ def add_kb_doc(kb_id: int, payload: Dict):
         raise HTTPException(status_code=400, detail="content is required")
     metadata = payload.get("metadata")
     try:
-        embedding = embed_text(content)
+        profile = get_kb_profiles(tenant_id, [kb_id]).get(kb_id)
+        if profile is None:
+            raise RuntimeError("Knowledge base not found.")
+        model, dimensions = profile["embedding"]
+        embedding = embed_text(content, model=model, dimensions=dimensions)
+        doc_id = add_kb_document(tenant_id, kb_id, content, embedding, metadata=metadata)
     except RuntimeError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
-    doc_id = add_kb_document(tenant_id, kb_id, content, embedding, metadata=metadata)
     return {"id": doc_id}
 
 
 @app.post("/knowledge-bases/{kb_id}/upload")
-async def upload_kb_doc(kb_id: int, file: UploadFile = File(...)):
+def upload_kb_doc(kb_id: int, file: UploadFile = File(...)):
     tenant_id = get_tenant_id()
-    content = await file.read()
+    filename = file.filename or ""
     try:
-        text = read_text_from_upload(file.filename or "", content)
+        ensure_supported_upload(filename)
+        results, _ = _ingest_uploads(tenant_id, kb_id, [file])
     except RuntimeError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
-    chunks = chunk_text(text)
-    if not chunks:
+    if not results or not results[0]["chunks"]:
         raise HTTPException(status_code=400, detail="No content extracted from file.")
-    indexed = 0
-    for idx, chunk in enumerate(chunks):
-        try:
-            embedding = embed_text(chunk)
-        except RuntimeError as exc:
-            raise HTTPException(status_code=400, detail=str(exc)) from exc
-        add_kb_document(
-            tenant_id,
-            kb_id,
-            chunk,
-            embedding,
-            metadata={"filename": file.filename, "chunk_index": idx},
-        )
-        indexed += 1
-    return {"indexed": indexed}
+    result = dict(results[0])
+    result.pop("filename", None)
+    return result
+
+
+@app.post("/knowledge-bases/{kb_id}/upload/bulk")
+def upload_kb_docs(kb_id: int, files: List[UploadFile] = File(...)):
+    tenant_id = get_tenant_id()
+    try:
+        results, skipped = _ingest_uploads(tenant_id, kb_id, files)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return {
+        "indexed": sum(item["indexed"] for item in results),
+        "files": results,
+        "skipped": skipped,
+    }
+
+
+def _ingest_uploads(tenant_id: str, kb_id: int, files: List[UploadFile]):
+    """Stage uploads to disk, parse them in the process pool and stream pages into indexing."""
+    with tempfile.TemporaryDirectory(prefix="kb-upload-") as workdir:
+        documents, skipped = stage_uploads(workdir, [(file.filename or "", file.file) for file in files])
+        results = []
+        for filename, path, pages in iter_parsed_documents(documents):
+            file_hash, byte_size = file_digest(path)
+            plan = KbFilePlan(tenant_id, kb_id, filename)
+            with _ChunkSpool(workdir) as spool:
+                chunks = iter_chunks(pages, plan.chunk_size, plan.chunk_overlap)
+                duplicates = _embed_chunks(plan, filename, chunks, spool)
+                with kb_file_sync(
+                    tenant_id, kb_id, filename, byte_size=byte_size, file_hash=file_hash, plan=plan
+                ) as sync:
+                    _write_chunks(sync, spool)
+            results.append({"filename": filename, **sync.stats(), "duplicates": duplicates})
+    if any(item["added"] for item in results):
+        # First upload fixes the KB's dimensions; build its compact index in the background if one is configured.
+        start_kb_index(tenant_id, kb_id)
+    return results, skipped
+
+
+def _embed_batch_size() -> int:
+    return max(1, int(os.getenv("KB_EMBED_BATCH_SIZE", "64")))
+
+
+class _ChunkSpool:
+    """One file's chunks staged on disk between embedding and the locked write, so memory stays bounded."""
+
+    def __init__(self, directory: str) -> None:
+        self._file = tempfile.TemporaryFile(dir=directory)
+
+    def __enter__(self) -> "_ChunkSpool":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._file.close()
+
+    def append(self, kind: str, doc: Optional[Dict[str, Any]]) -> None:
+        pickle.dump((kind, doc), self._file, pickle.HIGHEST_PROTOCOL)
+
+    def __iter__(self) -> Iterator[Tuple[str, Optional[Dict[str, Any]]]]:
+        self._file.seek(0)
+        while True:
+            try:
+                yield pickle.load(self._file)
+            except EOFError:
+                return
+
+
+def _embed_chunks(
+    plan: KbFilePlan,
+    filename: str,
+    chunks: Iterable[Dict[str, Any]],
+    spool: _ChunkSpool,
+) -> Dict[str, int]:
+    """Embed streamed chunks whose content hash is new and stage every chunk in ``spool``.
+
+    Runs outside any transaction, against the stored hashes in ``plan``.
+    Near-duplicates (within the upload or of other files in the KB) are dropped
+    or linked before embedding. Embedding happens in bounded batches so memory
+    does not grow with file size. Returns the near-duplicate report.
+    """
+    batch_size = _embed_batch_size()
+    duplicates = _DuplicateFilter()
+    batch: List[Dict[str, Any]] = []
+    for chunk in chunks:
+        doc = {
+            "content": chunk["content"],
+            "content_hash": content_hash(chunk["content"]),
+            "metadata": _chunk_metadata(filename, chunk),
+        }
+        original = duplicates.prepare(doc)
+        if plan.claim(doc["content_hash"]):
+            spool.append("keep", doc)
+            duplicates.accept(doc)
+            continue
+        if original is not None:
+            duplicates.skip(spool, doc, original)
+            continue
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            _embed_chunk_batch(plan, batch, duplicates, spool)
+            batch = []
+    if batch:
+        _embed_chunk_batch(plan, batch, duplicates, spool)
+    return duplicates.report
+
+
+def _write_chunks(sync: KbFileSync, spool: _ChunkSpool) -> None:
+    """Apply the staged chunks inside the file's sync transaction.
+
+    Chunks are diffed again against the rows current under the lock; the rare
+    chunk the plan expected to reuse but whose row is gone is embedded here.
+    """
+    batch_size = _embed_batch_size()
+    added: List[Dict[str, Any]] = []
+    missing: List[Dict[str, Any]] = []
+    for kind, doc in spool:
+        if doc is None:
+            sync.skip()
+            continue
+        doc_id = sync.claim(doc["content_hash"])
+        if doc_id is not None:
+            sync.keep(doc_id, doc["metadata"])
+            continue
+        (missing if kind == "keep" else added).append(doc)
+        if len(added) >= batch_size:
+            sync.add(added)
+            added = []
+        if len(missing) >= batch_size:
+            _embed_docs(sync, missing)
+            sync.add(missing)
+            missing = []
+    if missing:
+        _embed_docs(sync, missing)
+    if added or missing:
+        sync.add(added + missing)
+
+
+def _chunk_metadata(filename: str, chunk: Dict[str, Any]) -> Dict[str, Any]:
+    metadata: Dict[str, Any] = {"filename": filename, "chunk_index": chunk["chunk_index"]}
+    if chunk["page_start"] is not None:
+        metadata["page_start"] = chunk["page_start"]
+        metadata["page_end"] = chunk["page_end"]
+    return metadata
+
+
+def _embed_docs(spec: Any, docs: List[Dict[str, Any]]) -> None:
+    """Set ``embedding`` on each doc with the KB's model and dimensions (``spec`` is a plan or a sync)."""
+    embeddings = embed_texts(
+        [doc["content"] for doc in docs],
+        model=spec.embedding_model,
+        dimensions=spec.embedding_dimensions,
+    )
+    for doc, embedding in zip(docs, embeddings):
+        doc["embedding"] = embedding
+
+
+def _embed_chunk_batch(
+    plan: KbFilePlan,
+    batch: List[Dict[str, Any]],
+    duplicates: "_DuplicateFilter",
+    spool: _ChunkSpool,
+) -> None:
+    originals = duplicates.match_existing(plan, batch)
+    fresh = []
+    for idx, doc in enumerate(batch):
+        # Earlier chunks of this batch only become originals once accepted, so check them here too.
+        original = originals.get(idx) or duplicates.match(doc)
+        if original is not None:
+            duplicates.skip(spool, doc, original)
+        else:
+            duplicates.accept(doc)
+            fresh.append(doc)
+    if not fresh:
+        return
+    _embed_docs(plan, fresh)
+    duplicates.embedding_bytes = 4 * len(fresh[0]["embedding"])
+    for doc in fresh:
+        spool.append("add", doc)
+
+
+class _DuplicateFilter:
+    """MinHash/LSH near-duplicate detection for one upload.
+
+    KB_DEDUP_MODE is ``drop`` (default: skip the chunk), ``link`` (store it without
+    an embedding, pointing at the original's content hash) or ``off``.
+    """
+
+    def __init__(self) -> None:
+        mode = os.getenv("KB_DEDUP_MODE", "drop").strip().lower()
+        self.mode = mode if mode in {"drop", "link", "off"} else "drop"
+        self.index = NearDuplicateIndex(float(os.getenv("KB_DEDUP_THRESHOLD", "0.85")))
+        self.embedding_bytes = 4 * 1536
+        self.report = {"chunks": 0, "tokens": 0, "bytes": 0}
+
+    def prepare(self, doc: Dict[str, Any]) -> Optional[str]:
+        """Attach the signature and return the content hash of an earlier accepted near-duplicate in this upload."""
+        if self.mode == "off":
+            return None
+        doc["minhash"] = signature(doc["content"])
+        doc["lsh_bands"] = band_keys(doc["minhash"])
+        return self.match(doc)
+
+    def match(self, doc: Dict[str, Any]) -> Optional[str]:
+        if self.mode == "off":
+            return None
+        return self.index.match(doc["minhash"], doc["lsh_bands"])
+
+    def accept(self, doc: Dict[str, Any]) -> None:
+        """Record a chunk that will be stored, so later chunks of the upload can be matched against it."""
+        if self.mode != "off":
+            self.index.add(doc["minhash"], doc["content_hash"], doc["lsh_bands"])
+
+    def match_existing(self, plan: KbFilePlan, batch: List[Dict[str, Any]]) -> Dict[int, str]:
+        if self.mode == "off":
+            return {}
+        keys = [key for doc in batch for key in doc["lsh_bands"]]
+        existing = NearDuplicateIndex(self.index.threshold)
+        for candidate in plan.near_duplicate_candidates(keys):
+            if candidate["minhash"]:
+                existing.add(candidate["minhash"], candidate["content_hash"], candidate["lsh_bands"])
+        originals = {}
+        for idx, doc in enumerate(batch):
+            original = existing.match(doc["minhash"], doc["lsh_bands"])
+            if original is not None:
+                originals[idx] = original
+        return originals
+
+    def skip(self, spool: _ChunkSpool, doc: Dict[str, Any], original: str) -> None:
+        content_bytes = len(doc["content"].encode("utf-8"))
+        self.report["chunks"] += 1
+        self.report["tokens"] += estimate_tokens(doc["content"])
+        self.report["bytes"] += self.embedding_bytes + (content_bytes if self.mode == "drop" else 0)
+        if self.mode == "link":
+            spool.append("add", {**doc, "embedding": None, "metadata": {**doc["metadata"], "duplicate_of": original}})
+        else:
+            spool.append("skip", None)
+
+
+@app.post("/knowledge-bases/search")
+def search_kbs(payload: Dict):
+    tenant_id = get_tenant_id()
+    query = payload.get("query")
+    if not query:
+        raise HTTPException(status_code=400, detail="query is required")
+    try:
+        refs = KnowledgeBaseConfig.model_validate({"knowledge_bases": payload.get("knowledge_bases")}).knowledge_bases
+    except ValidationError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    if not refs:
+        raise HTTPException(status_code=400, detail="knowledge_bases is required")
+    limit = int(payload.get("limit", 5))
+    try:
+        results, cached = search_knowledge_bases(tenant_id, {ref.id: ref.weight for ref in refs}, query, limit=limit)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return {"results": results, "cached": cached}
 
 
 @app.post("/knowledge-bases/{kb_id}/search")
@@ -452,19 +933,8 @@ def search_kb(kb_id: int, payload: Dict):
     if not query:
         raise HTTPException(status_code=400, detail="query is required")
     limit = int(payload.get("limit", 5))
-    cache = get_redis()
-    query_hash = hashlib.sha256(query.encode("utf-8")).hexdigest()
-    cache_key = build_cache_key("kb", tenant_id, "builder", 0, "public", str(kb_id), query_hash)
-    if cache:
-        cached = cache_get(cache, cache_key)
-        if cached is not None:
-            return {"results": cached, "cached": True}
     try:
-        embedding = embed_text(query)
+        results, cached = search_knowledge_base(tenant_id, kb_id, query, limit=limit)
     except RuntimeError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
-    results = search_kb_documents(tenant_id, kb_id, embedding, limit=limit)
-    if cache:
-        ttl = int(os.getenv("CACHE_TTL_SECONDS", "900"))
-        cache_set(cache, cache_key, results, ttl)
-    return {"results": results, "cached": False}
+    return {"results": results, "cached": cached}
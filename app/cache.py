@@ -1,6 +1,6 @@
 import json
 import os
-from typing import Any, Optional
+from typing import Any, Dict, Optional
 
 import redis
 
@@ -30,3 +30,13 @@ def cache_get(redis_client: redis.Redis, key: str) -> Optional[Any]:
 def cache_set(redis_client: redis.Redis, key: str, value: Any, ttl_seconds: int) -> None:
     payload = json.dumps(value)
     redis_client.setex(key, ttl_seconds, payload)
+
+
+def build_kb_cache_key(tenant: str, generations: Dict[int, int], kind: str, *parts: str) -> str:
+    """Key for KB-derived data; bumping any covered KB's generation orphans every older entry."""
+    scope = ",".join(f"{kb_id}@{generation}" for kb_id, generation in sorted(generations.items()))
+    return build_cache_key("kb", tenant, scope, 0, "public", kind, *parts)
+
+
+def kb_cache_ttl() -> int:
+    return int(os.getenv("KB_CACHE_TTL_SECONDS", "86400"))
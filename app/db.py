@@ -1,29 +1,127 @@
 import os
+import threading
+import time
+from collections import deque
 from contextlib import contextmanager
-from typing import Generator
+from typing import Any, Dict, Generator, Optional
 
 from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
 
 
 _ENGINE = None
 _SESSION_FACTORY = None
+_READ_ENGINE = None
+_READ_SESSION_FACTORY = None
+# Engines are built lazily; threads starting together must not each build their own pool.
+_INIT_LOCK = threading.Lock()
 
 
-def _build_engine():
-    dsn = os.getenv("POSTGRES_DSN")
+class _PoolStats:
+    """Checkout counters for one pool; waits keep the last 1024 samples for percentiles."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+        self.waits: deque = deque(maxlen=1024)
+
+    def record(self, wait_ms: float, timed_out: bool) -> None:
+        with self.lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_ms_total += wait_ms
+            self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+            self.waits.append(wait_ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            waits = sorted(self.waits)
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_ms_avg": round(self.wait_ms_total / self.checkouts, 3) if self.checkouts else 0.0,
+                "wait_ms_p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3) if waits else 0.0,
+                "wait_ms_max": round(self.wait_ms_max, 3),
+            }
+
+
+class _TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.stats = _PoolStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.stats.record(0.0, timed_out=True)
+            raise
+        self.stats.record((time.perf_counter() - started) * 1000, timed_out=False)
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def _setting(name: str, default: str, read: bool) -> str:
+    """DB_<name>, overridden for the replica engine by DB_READ_<name>."""
+    value = os.getenv(f"DB_{name}", default)
+    return os.getenv(f"DB_READ_{name}", value) if read else value
+
+
+def _build_engine(dsn: Optional[str] = None, read: bool = False):
+    dsn = dsn or os.getenv("POSTGRES_DSN")
     if not dsn:
         raise RuntimeError("POSTGRES_DSN is required to start the service.")
-    return create_engine(dsn, pool_pre_ping=True)
+    connect_args = {}
+    statement_timeout = int(_setting("STATEMENT_TIMEOUT_MS", "0", read))
+    if statement_timeout > 0:
+        connect_args["options"] = f"-c statement_timeout={statement_timeout}"
+    return create_engine(
+        dsn,
+        poolclass=_TimedQueuePool,
+        pool_pre_ping=True,
+        pool_size=int(_setting("POOL_SIZE", "5", read)),
+        max_overflow=int(_setting("MAX_OVERFLOW", "10", read)),
+        pool_timeout=float(_setting("POOL_TIMEOUT_SECONDS", "30", read)),
+        pool_recycle=int(_setting("POOL_RECYCLE_SECONDS", "-1", read)),
+        connect_args=connect_args,
+    )
 
 
 def get_engine():
     global _ENGINE
     if _ENGINE is None:
-        _ENGINE = _build_engine()
+        with _INIT_LOCK:
+            if _ENGINE is None:
+                _ENGINE = _build_engine()
     return _ENGINE
 
 
+def get_read_engine():
+    """Engine for POSTGRES_READ_DSN (a replica), or the primary engine when it is not set."""
+    global _READ_ENGINE
+    if _READ_ENGINE is None:
+        dsn = os.getenv("POSTGRES_READ_DSN")
+        engine = get_engine() if not dsn else None
+        with _INIT_LOCK:
+            if _READ_ENGINE is None:
+                _READ_ENGINE = engine or _build_engine(dsn, read=True)
+    return _READ_ENGINE
+
+
 def get_session_factory():
     global _SESSION_FACTORY
     if _SESSION_FACTORY is None:
@@ -31,6 +129,13 @@ def get_session_factory():
     return _SESSION_FACTORY
 
 
+def get_read_session_factory():
+    global _READ_SESSION_FACTORY
+    if _READ_SESSION_FACTORY is None:
+        _READ_SESSION_FACTORY = sessionmaker(bind=get_read_engine(), expire_on_commit=False)
+    return _READ_SESSION_FACTORY
+
+
 @contextmanager
 def session_scope() -> Generator[Session, None, None]:
     session_factory = get_session_factory()
@@ -43,3 +148,30 @@ def session_scope() -> Generator[Session, None, None]:
         raise
     finally:
         session.close()
+
+
+@contextmanager
+def read_session_scope() -> Generator[Session, None, None]:
+    """Session for reads that tolerate replica lag (listings, exports, stats); never commits."""
+    session = get_read_session_factory()()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Pool occupancy and checkout-wait metrics of the primary engine and, if configured, the replica."""
+    engines = {"primary": get_engine()}
+    if get_read_engine() is not engines["primary"]:
+        engines["replica"] = get_read_engine()
+    stats = {}
+    for name, engine in engines.items():
+        pool = engine.pool
+        stats[name] = {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(0, pool.overflow()),
+            **pool.stats.snapshot(),
+        }
+    return stats
@@ -1,7 +1,21 @@
 from datetime import datetime
 
-from sqlalchemy import BigInteger, DateTime, Integer, String, Text, UniqueConstraint, func
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    SmallInteger,
+    String,
+    Text,
+    UniqueConstraint,
+    func,
+    text,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from pgvector.sqlalchemy import Vector
 
@@ -18,6 +32,7 @@ class AgentDraft(Base):
     tenant_id: Mapped[str] = mapped_column(String(64), index=True)
     agent_id: Mapped[str] = mapped_column(String(128), index=True)
     config: Mapped[dict] = mapped_column(JSONB)
+    row_version: Mapped[int] = mapped_column(BigInteger, default=1, server_default="1")
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
 
@@ -38,27 +53,97 @@ class ThreadState(Base):
     __table_args__ = (UniqueConstraint("tenant_id", "agent_id", "version", "thread_id", name="uq_thread_states"),)
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
-    tenant_id: Mapped[str] = mapped_column(String(64), index=True)
-    agent_id: Mapped[str] = mapped_column(String(128), index=True)
-    version: Mapped[int] = mapped_column(Integer, index=True)
-    thread_id: Mapped[str] = mapped_column(String(128), index=True)
+    tenant_id: Mapped[str] = mapped_column(String(64))
+    agent_id: Mapped[str] = mapped_column(String(128))
+    version: Mapped[int] = mapped_column(Integer)
+    thread_id: Mapped[str] = mapped_column(String(128))
     state: Mapped[dict] = mapped_column(JSONB)
+    # Bumped by every upsert; writers can pass the version they read to detect concurrent updates.
+    row_version: Mapped[int] = mapped_column(BigInteger, default=1, server_default="1")
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
 
 class ChatLog(Base):
     __tablename__ = "chat_logs"
-    __table_args__ = ()
-
-    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
-    tenant_id: Mapped[str] = mapped_column(String(64), index=True)
-    agent_id: Mapped[str] = mapped_column(String(128), index=True)
-    version: Mapped[int] = mapped_column(Integer, index=True)
-    thread_id: Mapped[str] = mapped_column(String(128), index=True)
+    __table_args__ = (
+        Index("ix_chat_logs_thread_page", "tenant_id", "agent_id", "thread_id", "created_at", "id"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    tenant_id: Mapped[str] = mapped_column(String(64))
+    agent_id: Mapped[str] = mapped_column(String(128))
+    version: Mapped[int] = mapped_column(Integer)
+    thread_id: Mapped[str] = mapped_column(String(128))
     role: Mapped[str] = mapped_column(String(32))
     content: Mapped[str] = mapped_column(Text)
     state: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    # Monthly range partitions (see log_retention); the partition key is part of the primary key.
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), primary_key=True, server_default=func.now()
+    )
+
+
+class AgentActivity(Base):
+    """Latest chat activity per agent, maintained by log_chat so listings never scan chat_logs."""
+
+    __tablename__ = "agent_activity"
+    __table_args__ = (UniqueConstraint("tenant_id", "agent_id", name="uq_agent_activity"),)
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    tenant_id: Mapped[str] = mapped_column(String(64))
+    agent_id: Mapped[str] = mapped_column(String(128))
+    last_activity: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+
+class ThreadSummary(Base):
+    """One row per thread, upserted by log_chat; thread listings page through it instead of chat_logs."""
+
+    __tablename__ = "thread_summaries"
+    __table_args__ = (
+        UniqueConstraint("tenant_id", "agent_id", "thread_id", name="uq_thread_summaries"),
+        Index("ix_thread_summaries_activity", "tenant_id", "agent_id", text("last_activity DESC"), text("id DESC")),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    tenant_id: Mapped[str] = mapped_column(String(64))
+    agent_id: Mapped[str] = mapped_column(String(128))
+    thread_id: Mapped[str] = mapped_column(String(128))
+    version: Mapped[int] = mapped_column(Integer)
+    message_count: Mapped[int] = mapped_column(Integer, default=0)
+    current_form_id: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    completed: Mapped[bool] = mapped_column(Boolean, default=False)
+    last_activity: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+
+class UsageRollup(Base):
+    """Usage counters per tenant/agent/version and hour, day or all time ("all", bucket at the epoch)."""
+
+    __tablename__ = "usage_rollups"
+    __table_args__ = (
+        UniqueConstraint("tenant_id", "agent_id", "granularity", "bucket", "version", name="uq_usage_rollups"),
+        Index("ix_usage_rollups_tenant_bucket", "tenant_id", "granularity", "bucket"),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    tenant_id: Mapped[str] = mapped_column(String(64))
+    agent_id: Mapped[str] = mapped_column(String(128))
+    version: Mapped[int] = mapped_column(Integer)
+    granularity: Mapped[str] = mapped_column(String(8))
+    bucket: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    requests: Mapped[int] = mapped_column(BigInteger, default=0)
+    sessions: Mapped[int] = mapped_column(BigInteger, default=0)
+    new_sessions: Mapped[int] = mapped_column(BigInteger, default=0)
+    llm_calls: Mapped[int] = mapped_column(BigInteger, default=0)
+    prompt_tokens: Mapped[int] = mapped_column(BigInteger, default=0)
+    completion_tokens: Mapped[int] = mapped_column(BigInteger, default=0)
+    total_tokens: Mapped[int] = mapped_column(BigInteger, default=0)
+    kb_queries: Mapped[int] = mapped_column(BigInteger, default=0)
+    submissions: Mapped[int] = mapped_column(BigInteger, default=0)
+    speculative_used: Mapped[int] = mapped_column(BigInteger, default=0)
+    speculative_wasted: Mapped[int] = mapped_column(BigInteger, default=0)
+    # HyperLogLog registers over thread ids; daily rows only.
+    sessions_sketch: Mapped[list[int] | None] = mapped_column(ARRAY(SmallInteger), nullable=True)
 
 
 class AuditLog(Base):
@@ -76,53 +161,178 @@ class AuditLog(Base):
 
 class KnowledgeBase(Base):
     __tablename__ = "knowledge_bases"
-    __table_args__ = (UniqueConstraint("tenant_id", "name", name="uq_kb_tenant_name"),)
+    __table_args__ = (
+        Index(
+            "uq_kb_tenant_name",
+            "tenant_id",
+            "name",
+            unique=True,
+            postgresql_where=text("deleted_at IS NULL"),
+        ),
+    )
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
     tenant_id: Mapped[str] = mapped_column(String(64), index=True)
     name: Mapped[str] = mapped_column(String(128))
     description: Mapped[str] = mapped_column(Text, default="")
     provider: Mapped[str] = mapped_column(String(32), default="pgvector")
+    quantization: Mapped[str] = mapped_column(String(16), default="none")
+    # Mode the KB switches to once its index is built (see kb_index); searches keep using ``quantization`` until then.
+    pending_quantization: Mapped[str | None] = mapped_column(String(16), nullable=True)
+    embedding_model: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    # Size of the stored vectors (requested, or observed on the first upload).
+    embedding_dimensions: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # Truncation asked of the provider (text-embedding-3 ``dimensions``); None embeds at the model's native size.
+    requested_dimensions: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    chunk_size: Mapped[int] = mapped_column(Integer, default=1200)
+    chunk_overlap: Mapped[int] = mapped_column(Integer, default=200)
+    generation: Mapped[int] = mapped_column(BigInteger, default=0)
+    active_build: Mapped[int] = mapped_column(BigInteger, default=0)
+    deleted_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    purge_total: Mapped[int] = mapped_column(BigInteger, default=0)
+    purged: Mapped[int] = mapped_column(BigInteger, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+class KbFile(Base):
+    __tablename__ = "kb_files"
+    __table_args__ = (UniqueConstraint("tenant_id", "kb_id", "filename", name="uq_kb_files"),)
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    tenant_id: Mapped[str] = mapped_column(String(64), index=True)
+    kb_id: Mapped[int] = mapped_column(BigInteger, index=True)
+    filename: Mapped[str] = mapped_column(String(512))
+    chunk_count: Mapped[int] = mapped_column(Integer, default=0)
+    byte_size: Mapped[int] = mapped_column(BigInteger, default=0)
+    content_hash: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    generation: Mapped[int] = mapped_column(BigInteger, default=0)
+    indexed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+class KbBuild(Base):
+    __tablename__ = "kb_builds"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    tenant_id: Mapped[str] = mapped_column(String(64), index=True)
+    kb_id: Mapped[int] = mapped_column(BigInteger, index=True)
+    source_build: Mapped[int] = mapped_column(BigInteger, default=0)
+    status: Mapped[str] = mapped_column(String(16), default="building")
+    settings: Mapped[dict] = mapped_column(JSONB)
+    progress: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
+    validation: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
 
 class KnowledgeDocument(Base):
     __tablename__ = "knowledge_documents"
+    __table_args__ = (
+        Index("ix_knowledge_documents_lsh_bands", "lsh_bands", postgresql_using="gin"),
+        Index("ix_knowledge_documents_kb_build", "kb_id", "build_id"),
+    )
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
     tenant_id: Mapped[str] = mapped_column(String(64), index=True)
     kb_id: Mapped[int] = mapped_column(BigInteger, index=True)
+    file_id: Mapped[int | None] = mapped_column(BigInteger, ForeignKey("kb_files.id"), index=True, nullable=True)
+    build_id: Mapped[int] = mapped_column(BigInteger, default=0)
     content: Mapped[str] = mapped_column(Text)
     doc_metadata: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
     embedding: Mapped[list[float] | None] = mapped_column(Vector(), nullable=True)
+    content_hash: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    file_version: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    minhash: Mapped[list[int] | None] = mapped_column(ARRAY(BigInteger), nullable=True)
+    lsh_bands: Mapped[list[int] | None] = mapped_column(ARRAY(BigInteger), nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
 
 class TraceLog(Base):
     __tablename__ = "trace_logs"
-
-    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
-    tenant_id: Mapped[str] = mapped_column(String(64), index=True)
-    agent_id: Mapped[str] = mapped_column(String(128), index=True)
-    version: Mapped[int] = mapped_column(Integer, index=True)
-    thread_id: Mapped[str] = mapped_column(String(128), index=True)
+    __table_args__ = (
+        Index("ix_trace_logs_page", "tenant_id", "agent_id", text("created_at DESC"), text("id DESC")),
+        Index(
+            "ix_trace_logs_thread_page", "tenant_id", "agent_id", "thread_id", text("created_at DESC"), text("id DESC")
+        ),
+        Index(
+            "ix_trace_logs_errors",
+            "tenant_id",
+            "agent_id",
+            text("created_at DESC"),
+            text("id DESC"),
+            postgresql_where=text("status = 'error'"),
+        ),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    tenant_id: Mapped[str] = mapped_column(String(64))
+    agent_id: Mapped[str] = mapped_column(String(128))
+    version: Mapped[int] = mapped_column(Integer)
+    thread_id: Mapped[str] = mapped_column(String(128))
     trace_id: Mapped[str] = mapped_column(String(128), index=True)
-    data: Mapped[dict] = mapped_column(JSONB)
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    status: Mapped[str] = mapped_column(String(16), server_default="ok")
+    latency_ms: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    prompt_tokens: Mapped[int] = mapped_column(Integer, server_default="0")
+    completion_tokens: Mapped[int] = mapped_column(Integer, server_default="0")
+    total_tokens: Mapped[int] = mapped_column(Integer, server_default="0")
+    nodes: Mapped[list[str]] = mapped_column(ARRAY(String(64)), server_default="{}")
+    input_preview: Mapped[str | None] = mapped_column(Text, nullable=True)
+    output_preview: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # Full trace document of rows written before payloads were offloaded to trace_payloads.
+    data: Mapped[dict | None] = mapped_column(JSONB, nullable=True, deferred=True)
+    # Monthly range partitions (see log_retention); the partition key is part of the primary key.
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), primary_key=True, server_default=func.now()
+    )
+
+
+class TracePayload(Base):
+    """Compressed trace document of one ``trace_logs`` row, partitioned by month like it."""
+
+    __tablename__ = "trace_payloads"
+    __table_args__ = (
+        Index("ix_trace_payloads_agent", "tenant_id", "agent_id"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+    trace_id: Mapped[str] = mapped_column(String(128), primary_key=True)
+    tenant_id: Mapped[str] = mapped_column(String(64))
+    agent_id: Mapped[str] = mapped_column(String(128))
+    codec: Mapped[str] = mapped_column(String(16))
+    raw_bytes: Mapped[int] = mapped_column(Integer)
+    payload: Mapped[bytes] = mapped_column(LargeBinary)
+    # Same value as the trace_logs row's created_at, so both expire with the same month.
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), primary_key=True, server_default=func.now()
+    )
 
 
 class FormSubmission(Base):
     __tablename__ = "form_submissions"
-    __table_args__ = ()
+    __table_args__ = (
+        Index("ix_form_submissions_page", "tenant_id", "agent_id", text("created_at DESC"), text("id DESC")),
+        Index(
+            "ix_form_submissions_form_page", "tenant_id", "agent_id", "form_id", text("created_at DESC"), text("id DESC")
+        ),
+        Index(
+            "ix_form_submissions_thread_page",
+            "tenant_id",
+            "agent_id",
+            "thread_id",
+            text("created_at DESC"),
+            text("id DESC"),
+        ),
+    )
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
-    tenant_id: Mapped[str] = mapped_column(String(64), index=True)
-    agent_id: Mapped[str] = mapped_column(String(128), index=True)
-    version: Mapped[int] = mapped_column(Integer, index=True)
-    thread_id: Mapped[str] = mapped_column(String(128), index=True)
-    form_id: Mapped[str] = mapped_column(String(128), index=True)
+    tenant_id: Mapped[str] = mapped_column(String(64))
+    agent_id: Mapped[str] = mapped_column(String(128))
+    version: Mapped[int] = mapped_column(Integer)
+    thread_id: Mapped[str] = mapped_column(String(128))
+    form_id: Mapped[str] = mapped_column(String(128))
     form_name: Mapped[str] = mapped_column(String(256))
-    delivery_type: Mapped[str] = mapped_column(String(32), index=True)
+    delivery_type: Mapped[str] = mapped_column(String(32))
     payload: Mapped[dict] = mapped_column(JSONB)
     delivery_target: Mapped[str | None] = mapped_column(String(512), nullable=True)
     delivery_status: Mapped[str] = mapped_column(String(32), default="pending")
@@ -139,5 +349,6 @@ class OAuthCredential(Base):
     agent_id: Mapped[str] = mapped_column(String(128), index=True)
     provider: Mapped[str] = mapped_column(String(64), index=True)
     token: Mapped[dict] = mapped_column(JSONB)
+    row_version: Mapped[int] = mapped_column(BigInteger, default=1, server_default="1")
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -1,10 +1,10 @@
 import os
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple
 
 from openai import OpenAI, AzureOpenAI
 
 
-def embed_text(text: str) -> List[float]:
+def _client_and_model(model_override: Optional[str] = None) -> Tuple[OpenAI, str]:
     azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
     azure_key = os.getenv("AZURE_OPENAI_API_KEY")
     if azure_endpoint and azure_key:
@@ -13,14 +13,40 @@ def embed_text(text: str) -> List[float]:
             api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-10-21"),
             azure_endpoint=azure_endpoint,
         )
-        model = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT")
+        model = model_override or os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT")
         if not model:
             raise RuntimeError("AZURE_OPENAI_EMBEDDING_DEPLOYMENT is required for embeddings.")
     else:
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise RuntimeError("OPENAI_API_KEY or AZURE_OPENAI_API_KEY is required to embed content.")
-        model = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+        model = model_override or os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
         client = OpenAI(api_key=api_key)
-    response = client.embeddings.create(model=model, input=text)
+    return client, model
+
+
+def default_embedding_model() -> str:
+    if os.getenv("AZURE_OPENAI_ENDPOINT") and os.getenv("AZURE_OPENAI_API_KEY"):
+        return os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", "")
+    return os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+
+
+def _dimension_args(dimensions: Optional[int]) -> Dict[str, Any]:
+    # text-embedding-3 models shorten vectors server-side (Matryoshka truncation + renormalisation).
+    return {"dimensions": dimensions} if dimensions else {}
+
+
+def embed_text(text: str, model: Optional[str] = None, dimensions: Optional[int] = None) -> List[float]:
+    client, model = _client_and_model(model)
+    response = client.embeddings.create(model=model, input=text, **_dimension_args(dimensions))
     return list(response.data[0].embedding)
+
+
+def embed_texts(texts: List[str], model: Optional[str] = None, dimensions: Optional[int] = None) -> List[List[float]]:
+    """Embed a batch of texts in one request, preserving input order."""
+    if not texts:
+        return []
+    client, model = _client_and_model(model)
+    response = client.embeddings.create(model=model, input=texts, **_dimension_args(dimensions))
+    ordered = sorted(response.data, key=lambda item: item.index)
+    return [list(item.embedding) for item in ordered]
@@ -1,13 +1,16 @@
 import os
 import time
-from typing import Dict, Optional, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
 
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import END, StateGraph
 
-from .embeddings import embed_text
+from .config import env_bool
+from .kb_context import build_context, default_context_budget
 from .llm import (
     answer_with_context,
+    chat_model,
     explain_validation_error,
     explain_validator_failure,
     extract_fields,
@@ -15,7 +18,70 @@ from .llm import (
     select_intent,
 )
 from .models import AgentState, FieldDefinition, FormsConfig, KnowledgeBaseConfig, ToolsConfig, ValidatorDefinition
-from .storage import get_tenant_id, list_knowledge_bases, search_kb_documents
+from .retrieval import answer_scope, cache_answer, get_cached_answer, search_knowledge_bases
+from .storage import get_kb_profiles, get_tenant_id
+
+
+def _knowledge_base_weights(knowledge_config: KnowledgeBaseConfig) -> Optional[Dict[int, float]]:
+    """KBs to search with their weights: the configured list, the single configured KB, or None for every KB."""
+    if knowledge_config.knowledge_bases:
+        return {ref.id: ref.weight for ref in knowledge_config.knowledge_bases}
+    if knowledge_config.knowledge_base_id:
+        return {knowledge_config.knowledge_base_id: 1.0}
+    return None
+
+
+def _resolve_knowledge_bases(
+    tenant_id: str, configured: Optional[Dict[int, float]]
+) -> Tuple[Dict[int, float], Dict[int, Dict[str, object]]]:
+    """Weights and profiles of the KBs to search, in one query.
+
+    The profile read is needed for cache generations anyway, so "every KB of the
+    tenant" is resolved by it too instead of listing KBs on each question.
+    """
+    if configured is None:
+        profiles = get_kb_profiles(tenant_id)
+        return {kb_id: 1.0 for kb_id in profiles}, profiles
+    return configured, get_kb_profiles(tenant_id, list(configured))
+
+
+_SPECULATION_POOL: Optional[ThreadPoolExecutor] = None
+
+
+def _speculation_pool() -> ThreadPoolExecutor:
+    global _SPECULATION_POOL
+    if _SPECULATION_POOL is None:
+        workers = max(1, int(os.getenv("KB_SPECULATION_WORKERS", "4")))
+        _SPECULATION_POOL = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="kb-speculate")
+    return _SPECULATION_POOL
+
+
+def _speculation_enabled() -> bool:
+    return env_bool("KB_SPECULATIVE_RETRIEVAL", True)
+
+
+def _retrieve_knowledge(
+    tenant_id: str, configured: Optional[Dict[int, float]], message: str, scope: str
+) -> Dict[str, Any]:
+    """Everything general_responder needs from the KBs: a cached answer, or search results."""
+    kb_weights, profiles = _resolve_knowledge_bases(tenant_id, configured)
+    retrieval: Dict[str, Any] = {
+        "kb_weights": kb_weights,
+        "generations": {kb_id: profile["generation"] for kb_id, profile in profiles.items()},
+        "cached_answer": None,
+        "results": [],
+        "error": None,
+    }
+    if not kb_weights:
+        return retrieval
+    retrieval["cached_answer"] = get_cached_answer(tenant_id, scope, retrieval["generations"], kb_weights, message)
+    if retrieval["cached_answer"]:
+        return retrieval
+    try:
+        retrieval["results"], _ = search_knowledge_bases(tenant_id, kb_weights, message, limit=4, profiles=profiles)
+    except Exception as exc:
+        retrieval["error"] = f"KB search failed: {exc}"
+    return retrieval
 
 
 def _ensure_defaults(state: AgentState) -> AgentState:
@@ -33,10 +99,10 @@ def _ensure_defaults(state: AgentState) -> AgentState:
     return state
 
 
-def _trace_node_event(state: AgentState, node: str, phase: str, payload: Dict[str, object]) -> None:
-    state.setdefault("trace_events", []).append(
-        {"node": node, "phase": phase, "ts": time.time(), **payload}
-    )
+def _trace_node_event(state: AgentState, node: str, phase: str, payload: Dict[str, object]) -> Dict[str, object]:
+    event = {"node": node, "phase": phase, "ts": time.time(), **payload}
+    state.setdefault("trace_events", []).append(event)
+    return event
 
 
 def _validate_field(
@@ -261,10 +327,25 @@ def build_graph(
     forms_config: FormsConfig,
     tools_config: ToolsConfig,
     knowledge_config: Optional[KnowledgeBaseConfig] = None,
+    agent_id: Optional[str] = None,
 ):
     """Return a LangGraph app plus checkpointer."""
     workflow = StateGraph(AgentState)
     memory = MemorySaver()
+    configured_kbs = _knowledge_base_weights(knowledge_config) if knowledge_config else None
+    kb_enabled = bool(
+        knowledge_config and knowledge_config.enable_knowledge_base and knowledge_config.provider == "pgvector"
+    )
+    context_budget = default_context_budget()
+    if knowledge_config and knowledge_config.context_token_budget is not None:
+        context_budget = knowledge_config.context_token_budget
+    # Cached KB answers are only reused by the same agent with the same answer settings.
+    kb_answer_scope = answer_scope(
+        agent_id, {"kbs": configured_kbs, "context_token_budget": context_budget, "model": chat_model(), "limit": 4}
+    )
+    # Retrieval started while the intent LLM call runs, per thread: (message, future, started_at).
+    # Futures stay out of the state, which is checkpointed and persisted.
+    speculations: Dict[str, Tuple[str, Future, float]] = {}
 
     def _looks_like_question(message: str) -> bool:
         msg = (message or "").strip().lower()
@@ -321,7 +402,70 @@ def build_graph(
         )
         return state
 
+    def _start_speculation(state: AgentState) -> None:
+        message = (state.get("last_user_message") or "").strip()
+        if not kb_enabled or not forms_config.intents or not _speculation_enabled():
+            return
+        if not _looks_like_question(message):
+            return
+        # Mirrors _route_intent: a completed form is reset, otherwise only in-form questions go general.
+        in_form = state.get("current_form_id") and not (state.get("completed") and not state.get("awaiting_field"))
+        if in_form and not _should_route_general_while_in_form(state, message):
+            return
+        future = _speculation_pool().submit(
+            _retrieve_knowledge, get_tenant_id(), configured_kbs, message, kb_answer_scope
+        )
+        speculations[state.get("thread_id") or ""] = (message, future, time.perf_counter())
+
+    def _take_speculation(state: AgentState, message: str) -> Optional[Dict[str, Any]]:
+        speculation = speculations.pop(state.get("thread_id") or "", None)
+        if speculation is None:
+            return None
+        speculated_message, future, started = speculation
+        if speculated_message != message:
+            future.cancel()
+            return None
+        waited = time.perf_counter()
+        retrieval = future.result()
+        _trace_node_event(
+            state,
+            "general_responder",
+            "event",
+            {
+                "event": "speculative_retrieval",
+                "outcome": "used",
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+                "waited_ms": round((time.perf_counter() - waited) * 1000, 1),
+            },
+        )
+        return retrieval
+
+    def _discard_speculation(state: AgentState) -> None:
+        speculation = speculations.pop(state.get("thread_id") or "", None)
+        if speculation is None:
+            return
+        _, future, started = speculation
+        _trace_node_event(
+            state,
+            "intent_router",
+            "event",
+            {
+                "event": "speculative_retrieval",
+                "outcome": "wasted",
+                # A cancelled future never ran; otherwise its embedding and search were thrown away.
+                "cancelled": future.cancel(),
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            },
+        )
+
     def intent_router(state: AgentState) -> AgentState:
+        _start_speculation(state)
+        routed = _route_intent(state)
+        if not routed.get("general_query") or routed.get("reply"):
+            _discard_speculation(routed)
+        return routed
+
+    def _route_intent(state: AgentState) -> AgentState:
         state = _ensure_defaults(dict(state))
         _trace_node_event(
             state,
@@ -514,41 +658,68 @@ def build_graph(
             )
             return state
 
-        if knowledge_config and knowledge_config.enable_knowledge_base and knowledge_config.provider == "pgvector":
-            kb_id = knowledge_config.knowledge_base_id
-            if not kb_id:
-                tenant_id = get_tenant_id()
-                kbs = list_knowledge_bases(tenant_id)
-                kb_id = kbs[0]["id"] if kbs else None
-            if kb_id:
-                try:
-                    embedding = embed_text(message)
-                    results = search_kb_documents(get_tenant_id(), kb_id, embedding, limit=4)
-                except Exception as exc:
+        if kb_enabled:
+            tenant_id = get_tenant_id()
+            retrieval = _take_speculation(state, message) or _retrieve_knowledge(
+                tenant_id, configured_kbs, message, kb_answer_scope
+            )
+            kb_weights, generations = retrieval["kb_weights"], retrieval["generations"]
+            kb_ids = sorted(kb_weights)
+            if kb_weights:
+                cached_answer = retrieval["cached_answer"]
+                if cached_answer:
+                    state["reply"] = cached_answer["reply"]
                     _trace_node_event(
                         state,
                         "general_responder",
                         "event",
-                        {"event": "kb_search_failed", "error": f"KB search failed: {exc}"},
+                        {"event": "kb_answer", "kb_ids": kb_ids, "results": cached_answer["results"], "cached": True},
                     )
-                    results = []
+                    _trace_node_event(
+                        state,
+                        "general_responder",
+                        "end",
+                        {"output": {"reply": state.get("reply"), "kb_ids": kb_ids}},
+                    )
+                    return state
+                if retrieval["error"]:
+                    _trace_node_event(
+                        state,
+                        "general_responder",
+                        "event",
+                        {"event": "kb_search_failed", "error": retrieval["error"]},
+                    )
+                results = retrieval["results"]
                 if results:
-                    context = "\n\n".join([r["content"] for r in results])
+                    context, used, context_stats = build_context(results, context_budget, chat_model())
+                    # Recorded before the LLM call so the context sizing is traced even when the call fails.
+                    context_event = _trace_node_event(
+                        state, "general_responder", "event", {"event": "kb_context", **context_stats}
+                    )
                     try:
                         answer, meta = answer_with_context(message, context)
+                        context_event["prompt_tokens"] = (meta.get("usage") or {}).get("prompt_tokens")
                         if answer:
                             state["reply"] = answer
+                            cache_answer(
+                                tenant_id,
+                                kb_answer_scope,
+                                generations,
+                                kb_weights,
+                                message,
+                                {"reply": answer, "results": used},
+                            )
                             _trace_node_event(
                                 state,
                                 "general_responder",
                                 "event",
-                                {"event": "kb_answer", "kb_id": kb_id, "results": results, "llm": meta},
+                                {"event": "kb_answer", "kb_ids": kb_ids, "results": used, "llm": meta},
                             )
                             _trace_node_event(
                                 state,
                                 "general_responder",
                                 "end",
-                                {"output": {"reply": state.get("reply"), "kb_id": kb_id}},
+                                {"output": {"reply": state.get("reply"), "kb_ids": kb_ids}},
                             )
                             return state
                     except Exception as exc:
@@ -569,13 +740,13 @@ def build_graph(
                         state,
                         "general_responder",
                         "event",
-                        {"event": "kb_fallback", "kb_id": kb_id, "results": results},
+                        {"event": "kb_fallback", "kb_ids": kb_ids, "results": results},
                     )
                     _trace_node_event(
                         state,
                         "general_responder",
                         "end",
-                        {"output": {"reply": state.get("reply"), "kb_id": kb_id}},
+                        {"output": {"reply": state.get("reply"), "kb_ids": kb_ids}},
                     )
                     return state
 
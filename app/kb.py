@@ -1,5 +1,21 @@
+import hashlib
 import io
-from typing import List
+import itertools
+import multiprocessing
+import os
+import shutil
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+DEFAULT_SEPARATORS = ["\n\n", "\n", " ", ""]
+TEXT_BLOCK_CHARS = 64 * 1024
+SUPPORTED_EXTENSIONS = (".txt", ".md", ".pdf")
+
+_PARSE_POOL: Optional[ProcessPoolExecutor] = None
+
+Page = Tuple[Optional[int], str]
 
 
 def chunk_text(
@@ -10,82 +26,339 @@ def chunk_text(
 ) -> List[str]:
     if not text:
         return []
-    splitters = separators or ["\n\n", "\n", " ", ""]
-    parts = _recursive_split(text, splitters, chunk_size)
-    return _merge_with_overlap(parts, chunk_size, overlap)
+    return [chunk["content"] for chunk in iter_chunks([(None, text)], chunk_size, overlap, separators)]
+
+
+def iter_chunks(
+    pages: Iterable[Page],
+    chunk_size: int = 1200,
+    overlap: int = 200,
+    separators: List[str] | None = None,
+) -> Iterator[Dict[str, Any]]:
+    """Stream chunks from ``(page_number, text)`` pairs without joining the document.
+
+    Each chunk is a dict with ``content``, ``chunk_index``, ``page_start`` and
+    ``page_end`` (page numbers are ``None`` for sources without pages).
+    """
+    splitters = separators or DEFAULT_SEPARATORS
+    parts = (
+        (page, part)
+        for page, text in pages
+        if text
+        for part in _recursive_split(text, splitters, chunk_size)
+    )
+    for idx, (content, page_start, page_end) in enumerate(_merge_with_overlap(parts, chunk_size, overlap)):
+        yield {"content": content, "chunk_index": idx, "page_start": page_start, "page_end": page_end}
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_digest(path: str) -> Tuple[str, int]:
+    """Return ``(sha256 hex digest, size in bytes)`` of a file, read in blocks."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as stream:
+        for block in iter(lambda: stream.read(1024 * 1024), b""):
+            digest.update(block)
+            size += len(block)
+    return digest.hexdigest(), size
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return (len(text) + 3) // 4
+
 
+def _iter_split(text: str, sep: str) -> Iterator[str]:
+    start = 0
+    while True:
+        end = text.find(sep, start)
+        if end == -1:
+            yield text[start:]
+            return
+        yield text[start:end]
+        start = end + len(sep)
 
-def _recursive_split(text: str, separators: List[str], chunk_size: int) -> List[str]:
+
+def _recursive_split(text: str, separators: List[str], chunk_size: int) -> Iterator[str]:
     if not separators:
-        return [text]
+        yield text
+        return
     sep = separators[0]
-    if sep:
-        splits = text.split(sep)
-    else:
-        splits = list(text)
+    if not sep:
+        # An unbroken run; _merge_with_overlap cuts it into contiguous chunk-sized windows.
+        yield text
+        return
     if len(separators) == 1:
-        return splits
+        yield from _iter_split(text, sep)
+        return
 
-    results: List[str] = []
-    for chunk in splits:
+    for chunk in _iter_split(text, sep):
         if len(chunk) > chunk_size:
-            results.extend(_recursive_split(chunk, separators[1:], chunk_size))
+            yield from _recursive_split(chunk, separators[1:], chunk_size)
         else:
-            results.append(chunk)
-    return results
+            yield chunk
+
 
+def _merge_with_overlap(
+    parts: Iterable[Tuple[Optional[int], str]],
+    chunk_size: int,
+    overlap: int,
+) -> Iterator[Tuple[str, Optional[int], Optional[int]]]:
+    """Join parts into chunks of at most ``chunk_size`` characters, each carrying up to ``overlap`` of the last.
 
-def _merge_with_overlap(parts: List[str], chunk_size: int, overlap: int) -> List[str]:
-    chunks: List[str] = []
+    Parts longer than a chunk are cut into contiguous windows, so no space is inserted inside unbroken text.
+    """
+    overlap = max(0, min(overlap, chunk_size - 1))
     current: List[str] = []
     current_len = 0
+    glued = False
+    first_page: Optional[int] = None
+    last_page: Optional[int] = None
 
-    for part in parts:
+    for page, part in parts:
         segment = part.strip()
-        if not segment:
-            continue
-        projected = current_len + len(segment) + (1 if current else 0)
-        if projected <= chunk_size:
-            current.append(segment)
-            current_len = projected
-            continue
-        if current:
-            chunk = " ".join(current).strip()
-            if chunk:
-                chunks.append(chunk)
-            if overlap > 0:
-                overlap_text = chunk[-overlap:] if chunk else ""
-                current = [overlap_text, segment] if overlap_text else [segment]
-                current_len = len(overlap_text) + (1 if overlap_text else 0) + len(segment)
+        pos = 0
+        while pos < len(segment):
+            remaining = len(segment) - pos
+            joiner = 1 if current and not glued else 0
+            room = chunk_size - current_len - joiner
+            cut = room < remaining and room > 0 and (not current or glued or remaining > chunk_size)
+            if room >= remaining or cut:
+                piece = segment[pos : pos + room]
+                if not current:
+                    first_page = page
+                if glued:
+                    current[-1] += piece
+                else:
+                    current.append(piece)
+                current_len += joiner + len(piece)
+                last_page = page
+                pos += len(piece)
+                glued = False
+                if not cut:
+                    continue
+            chunk = " ".join(current)
+            yield chunk, first_page, last_page
+            tail = chunk[-overlap:] if overlap else ""
+            if not cut and remaining <= chunk_size:
+                # Trim the overlap so the carried text, a space and the next part still fit one chunk.
+                keep = chunk_size - remaining - 1
+                tail = tail[-keep:] if keep > 0 else ""
+            if tail and len(tail) + 1 < chunk_size:
+                # A cut run continues straight after the chunk, so its overlap is carried without a space.
+                current, current_len, glued = [tail], len(tail), cut
+                first_page = last_page
             else:
-                current = [segment]
-                current_len = len(segment)
-        else:
-            chunks.append(segment[:chunk_size].strip())
-            remainder = segment[chunk_size:].strip()
-            if remainder:
-                current = [remainder]
-                current_len = len(remainder)
-            else:
-                current = []
-                current_len = 0
+                current, current_len, glued = [], 0, False
 
     if current:
-        final_chunk = " ".join(current).strip()
-        if final_chunk:
-            chunks.append(final_chunk)
-    return chunks
+        yield " ".join(current), first_page, last_page
 
 
-def read_text_from_upload(filename: str, content: bytes) -> str:
-    if filename.lower().endswith((".txt", ".md")):
-        return content.decode("utf-8", errors="ignore").replace("\x00", "")
+def is_supported_upload(filename: str) -> bool:
+    return filename.lower().endswith(SUPPORTED_EXTENSIONS)
+
+
+def ensure_supported_upload(filename: str) -> None:
+    if not is_supported_upload(filename):
+        raise RuntimeError("Unsupported file type. Use .txt, .md, or .pdf")
+
+
+def iter_upload_pages(filename: str, source: Union[bytes, BinaryIO]) -> Iterator[Page]:
+    """Yield ``(page_number, text)`` pairs from an upload one page (or text block) at a time."""
+    ensure_supported_upload(filename)
+    stream = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
     if filename.lower().endswith(".pdf"):
-        try:
-            from pypdf import PdfReader
-        except Exception as exc:  # pragma: no cover
-            raise RuntimeError("pypdf is required for PDF uploads.") from exc
-        reader = PdfReader(io.BytesIO(content))
-        text = "\n".join(page.extract_text() or "" for page in reader.pages)
-        return text.replace("\x00", "")
-    raise RuntimeError("Unsupported file type. Use .txt, .md, or .pdf")
+        return _iter_pdf_pages(stream)
+    return _iter_text_blocks(stream)
+
+
+def _iter_text_blocks(stream: BinaryIO) -> Iterator[Page]:
+    reader = io.TextIOWrapper(stream, encoding="utf-8", errors="ignore", newline="")
+    block: List[str] = []
+    block_len = 0
+    try:
+        for line in reader:
+            block.append(line)
+            block_len += len(line)
+            # Prefer cutting on paragraph breaks so the separators still see whole paragraphs.
+            if block_len >= TEXT_BLOCK_CHARS and (not line.strip() or block_len >= 4 * TEXT_BLOCK_CHARS):
+                yield None, "".join(block).replace("\x00", "")
+                block = []
+                block_len = 0
+        if block:
+            yield None, "".join(block).replace("\x00", "")
+    finally:
+        reader.detach()
+
+
+def _pdf_reader(source: Union[str, BinaryIO]):
+    try:
+        from pypdf import PdfReader
+    except Exception as exc:  # pragma: no cover
+        raise RuntimeError("pypdf is required for PDF uploads.") from exc
+    return PdfReader(source)
+
+
+def _iter_pdf_pages(stream: BinaryIO, start: int = 0, end: Optional[int] = None) -> Iterator[Page]:
+    reader = _pdf_reader(stream)
+    stop = len(reader.pages) if end is None else min(end, len(reader.pages))
+    for idx in range(start, stop):
+        yield idx + 1, (reader.pages[idx].extract_text() or "").replace("\x00", "")
+
+
+def read_text_from_upload(filename: str, content: bytes) -> str:
+    return "\n".join(text for _, text in iter_upload_pages(filename, content))
+
+
+def stage_uploads(workdir: str, uploads: Iterable[Tuple[str, BinaryIO]]) -> Tuple[List[Tuple[str, str]], List[Dict[str, str]]]:
+    """Copy uploads (expanding .zip archives) into ``workdir`` so parser processes can open them by path.
+
+    Returns ``(documents, skipped)`` where documents are ``(filename, path)`` pairs.
+    """
+    max_archive_bytes = int(os.getenv("KB_ARCHIVE_MAX_BYTES", str(512 * 1024 * 1024)))
+    documents: List[Tuple[str, str]] = []
+    skipped: List[Dict[str, str]] = []
+
+    def _copy(name: str, source: BinaryIO) -> None:
+        path = os.path.join(workdir, str(len(documents)))
+        with open(path, "wb") as target:
+            shutil.copyfileobj(source, target)
+        documents.append((name, path))
+
+    for filename, stream in uploads:
+        if filename.lower().endswith(".zip"):
+            try:
+                archive = zipfile.ZipFile(stream)
+            except zipfile.BadZipFile as exc:
+                raise RuntimeError(f"Invalid zip archive: {filename}") from exc
+            with archive:
+                members = [member for member in archive.infolist() if not member.is_dir()]
+                if sum(member.file_size for member in members) > max_archive_bytes:
+                    raise RuntimeError(f"Archive {filename} exceeds the {max_archive_bytes} byte limit.")
+                for member in members:
+                    if not is_supported_upload(member.filename):
+                        skipped.append({"filename": member.filename, "error": "Unsupported file type"})
+                        continue
+                    with archive.open(member) as source:
+                        _copy(member.filename, source)
+        elif is_supported_upload(filename):
+            _copy(filename, stream)
+        else:
+            skipped.append({"filename": filename, "error": "Unsupported file type"})
+    return documents, skipped
+
+
+def _parse_workers() -> int:
+    return int(os.getenv("KB_PARSE_WORKERS", "0")) or (os.cpu_count() or 1)
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    global _PARSE_POOL
+    if _PARSE_POOL is None:
+        workers = _parse_workers()
+        # spawn keeps workers independent of the server's threads and open connections.
+        _PARSE_POOL = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return _PARSE_POOL
+
+
+def shutdown_parse_pool() -> None:
+    global _PARSE_POOL
+    if _PARSE_POOL is not None:
+        _PARSE_POOL.shutdown(wait=False, cancel_futures=True)
+        _PARSE_POOL = None
+
+
+def _pdf_page_count(path: str) -> int:
+    try:
+        return len(_pdf_reader(path).pages)
+    except RuntimeError:
+        raise
+    except Exception as exc:
+        raise RuntimeError(f"Failed to read PDF: {exc}") from exc
+
+
+def _parse_pdf_range(path: str, start: int, end: int) -> List[Page]:
+    try:
+        with open(path, "rb") as stream:
+            return list(_iter_pdf_pages(stream, start, end))
+    except RuntimeError:
+        raise
+    except Exception as exc:
+        raise RuntimeError(f"Failed to parse PDF pages {start + 1}-{end}: {exc}") from exc
+
+
+def _text_shard_bounds(path: str, shard_bytes: int) -> List[Tuple[int, int]]:
+    """Byte ranges of about ``shard_bytes``, each ending after a newline so no line or UTF-8 sequence is split."""
+    size = os.path.getsize(path)
+    bounds: List[Tuple[int, int]] = []
+    start = 0
+    with open(path, "rb") as stream:
+        while start < size:
+            end = start + shard_bytes
+            if end < size:
+                stream.seek(end)
+                for block in iter(lambda: stream.read(64 * 1024), b""):
+                    newline = block.find(b"\n")
+                    if newline != -1:
+                        end += newline + 1
+                        break
+                    end += len(block)
+            end = min(end, size)
+            bounds.append((start, end))
+            start = end
+    return bounds
+
+
+def _parse_text_range(path: str, start: int, end: int) -> List[Page]:
+    with open(path, "rb") as stream:
+        stream.seek(start)
+        return list(_iter_text_blocks(io.BytesIO(stream.read(end - start))))
+
+
+def _plan_parse_tasks(
+    pool: ProcessPoolExecutor,
+    documents: List[Tuple[str, str]],
+) -> Iterator[Tuple[int, Callable[..., List[Page]], Tuple[Any, ...]]]:
+    shard_pages = max(1, int(os.getenv("KB_PDF_SHARD_PAGES", "50")))
+    shard_bytes = max(64 * 1024, int(os.getenv("KB_TEXT_SHARD_BYTES", str(4 * 1024 * 1024))))
+    pdf_indexes = [idx for idx, (filename, _) in enumerate(documents) if filename.lower().endswith(".pdf")]
+    page_counts = dict(zip(pdf_indexes, pool.map(_pdf_page_count, [documents[idx][1] for idx in pdf_indexes])))
+    for idx, (_, path) in enumerate(documents):
+        if idx not in page_counts:
+            for start, end in _text_shard_bounds(path, shard_bytes):
+                yield idx, _parse_text_range, (path, start, end)
+            continue
+        for start in range(0, page_counts[idx], shard_pages):
+            yield idx, _parse_pdf_range, (path, start, min(start + shard_pages, page_counts[idx]))
+
+
+def _iter_parsed_shards(documents: List[Tuple[str, str]]) -> Iterator[Tuple[int, List[Page]]]:
+    pool = get_parse_pool()
+    # Bounded prefetch: workers stay busy while parsed pages never pile up ahead of embedding.
+    window = max(1, int(os.getenv("KB_PARSE_PREFETCH", "0")) or 2 * _parse_workers())
+    pending: deque = deque()
+    for doc_idx, fn, args in _plan_parse_tasks(pool, documents):
+        pending.append((doc_idx, pool.submit(fn, *args)))
+        if len(pending) >= window:
+            idx, future = pending.popleft()
+            yield idx, future.result()
+    while pending:
+        idx, future = pending.popleft()
+        yield idx, future.result()
+
+
+def iter_parsed_documents(documents: List[Tuple[str, str]]) -> Iterator[Tuple[str, str, Iterator[Page]]]:
+    """Parse staged documents in the process pool, yielding ``(filename, path, pages)`` in input order.
+
+    Large PDFs are sharded into page ranges and text files into byte ranges, so no
+    worker result holds more than one shard; each document's pages iterator must
+    be consumed before advancing to the next document.
+    """
+    shards = _iter_parsed_shards(documents)
+    for doc_idx, group in itertools.groupby(shards, key=lambda shard: shard[0]):
+        filename, path = documents[doc_idx]
+        yield filename, path, (page for _, pages in group for page in pages)
@@ -0,0 +1,131 @@
+"""Token-budgeted context packing for KB answers.
+
+Search results are ordered by score, the text a passage repeats from another
+passage of the same file (chunk overlap) is cut, and passages are added until
+the token budget is spent; the last one that does not fit is truncated.
+Tokens are counted with tiktoken when it is installed and its encoding is
+available offline, otherwise estimated from the character count.
+"""
+
+import os
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .kb import estimate_tokens
+
+SEPARATOR = "\n\n"
+_MIN_OVERLAP_CHARS = 32
+# A truncated passage shorter than this is more noise than context.
+_MIN_PASSAGE_TOKENS = 32
+
+
+def default_context_budget() -> int:
+    return max(0, int(os.getenv("KB_CONTEXT_TOKEN_BUDGET", "2000")))
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str) -> Optional[Any]:
+    try:
+        import tiktoken
+
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def _tokenizer(model: str) -> Tuple[Callable[[str], int], Callable[[str, int], str]]:
+    """``(count, truncate)`` for ``model``: exact with tiktoken, ~4 characters per token otherwise."""
+    encoding = _encoding(model)
+    if encoding is None:
+        return estimate_tokens, lambda text, tokens: text[: tokens * 4]
+    return (
+        lambda text: len(encoding.encode(text, disallowed_special=())),
+        lambda text, tokens: encoding.decode(encoding.encode(text, disallowed_special=())[:tokens]),
+    )
+
+
+def _overlap(head: str, tail: str) -> int:
+    """Length of the longest suffix of ``head`` that ``tail`` starts with (at least _MIN_OVERLAP_CHARS)."""
+    probe = tail[:_MIN_OVERLAP_CHARS]
+    if len(probe) < _MIN_OVERLAP_CHARS:
+        return 0
+    start = head.find(probe, max(0, len(head) - len(tail)))
+    while start != -1:
+        if tail.startswith(head[start:]):
+            return len(head) - start
+        start = head.find(probe, start + 1)
+    return 0
+
+
+def _source(result: Dict[str, Any]) -> Tuple[Any, Any]:
+    metadata = result.get("metadata") or {}
+    return result.get("kb_id"), metadata.get("filename")
+
+
+def _dedupe(text: str, kept: List[str]) -> str:
+    """Drop what ``text`` repeats from passages of the same file that are already in the context."""
+    for other in kept:
+        if text in other:
+            return ""
+        cut = _overlap(other, text)
+        if cut:
+            text = text[cut:]
+            continue
+        cut = _overlap(text, other)
+        if cut:
+            text = text[: len(text) - cut]
+    return text.strip()
+
+
+def build_context(
+    results: List[Dict[str, Any]], token_budget: int, model: str
+) -> Tuple[str, List[Dict[str, Any]], Dict[str, Any]]:
+    """Pack search results into a context string of at most ``token_budget`` tokens (0 means unbounded).
+
+    Returns ``(context, used results, stats)``; the stats are meant for the trace.
+    """
+    count, truncate = _tokenizer(model)
+    separator_tokens = count(SEPARATOR)
+    ranked = sorted(results, key=lambda r: r.get("score") if r.get("score") is not None else float("-inf"), reverse=True)
+    kept: Dict[Tuple[Any, Any], List[str]] = {}
+    passages: List[str] = []
+    used: List[Dict[str, Any]] = []
+    stats: Dict[str, Any] = {
+        "budget": token_budget,
+        "candidates": len(results),
+        "raw_tokens": 0,
+        "overlap_tokens": 0,
+        "dropped": 0,
+        "truncated": False,
+        "context_tokens": 0,
+        "tokenizer": "estimate" if _encoding(model) is None else "tiktoken",
+    }
+    for result in ranked:
+        raw = (result.get("content") or "").strip()
+        raw_tokens = count(raw)
+        stats["raw_tokens"] += raw_tokens
+        source = _source(result)
+        text = _dedupe(raw, kept.get(source, [])) if source[1] else raw
+        tokens = count(text) if text != raw else raw_tokens
+        stats["overlap_tokens"] += raw_tokens - tokens
+        if not text:
+            stats["dropped"] += 1
+            continue
+        cost = tokens + (separator_tokens if passages else 0)
+        if token_budget and stats["context_tokens"] + cost > token_budget:
+            remaining = token_budget - stats["context_tokens"] - (separator_tokens if passages else 0)
+            if stats["truncated"] or remaining < _MIN_PASSAGE_TOKENS:
+                stats["dropped"] += 1
+                continue
+            text = truncate(text, remaining).rstrip()
+            cost = count(text) + (separator_tokens if passages else 0)
+            stats["truncated"] = True
+        kept.setdefault(source, []).append(raw)
+        passages.append(text)
+        used.append(result)
+        stats["context_tokens"] += cost
+    stats["passages"] = len(passages)
+    return SEPARATOR.join(passages), used, stats
@@ -0,0 +1,82 @@
+"""Background builds of a knowledge base's compact (quantized) search index.
+
+``CREATE INDEX CONCURRENTLY`` over a large KB takes minutes, so requests that
+need a new index (first upload, quantization change, snapshot import) only
+queue one here. A quantization change is recorded as ``pending_quantization``
+and applied once its index is valid; searches keep the old mode until then.
+"""
+
+import logging
+import threading
+from typing import Optional, Set, Tuple
+
+from .storage import (
+    apply_kb_quantization,
+    drop_kb_build_indexes,
+    ensure_kb_quantized_index,
+    get_knowledge_base,
+    kb_index_lock,
+    list_kb_index_jobs,
+)
+
+logger = logging.getLogger(__name__)
+
+_ACTIVE: Set[Tuple[str, int]] = set()
+_ACTIVE_LOCK = threading.Lock()
+
+
+def sync_kb_index(tenant_id: str, kb_id: int) -> Optional[str]:
+    """Bring the active build's compact indexes in line with the KB's quantization setting.
+
+    Builds (or rebuilds, if a previous attempt left it invalid) the index for the
+    pending mode, or the current one if nothing is pending, then switches the KB
+    to the pending mode and drops the index of the mode it replaced. Returns the
+    index the KB searches with, or None if it needs none yet. Skips the KB while
+    another worker holds its index lock.
+    """
+    with kb_index_lock(kb_id) as acquired:
+        if not acquired:
+            return None
+        while True:
+            kb = get_knowledge_base(tenant_id, kb_id)
+            if kb is None:
+                return None
+            target = kb["pending_quantization"] or kb["quantization"]
+            name = ensure_kb_quantized_index(tenant_id, kb_id, build_id=kb["active_build"], quantization=target)
+            if kb["pending_quantization"] and not apply_kb_quantization(tenant_id, kb_id, target):
+                continue  # settings changed again while the index was building
+            drop_kb_build_indexes(kb_id, kb["active_build"], keep=name)
+            current = get_knowledge_base(tenant_id, kb_id)
+            if current is None or (
+                not current["pending_quantization"] and current["active_build"] == kb["active_build"]
+            ):
+                return name
+
+
+def _run(tenant_id: str, kb_id: int) -> None:
+    try:
+        name = sync_kb_index(tenant_id, kb_id)
+        logger.info("Indexed knowledge base %s (%s)", kb_id, name or "no compact index")
+    except Exception:
+        logger.exception("Index build for knowledge base %s failed; it will resume on next start", kb_id)
+    finally:
+        with _ACTIVE_LOCK:
+            _ACTIVE.discard((tenant_id, kb_id))
+
+
+def start_kb_index(tenant_id: str, kb_id: int) -> bool:
+    """Sync the KB's indexes on a background thread unless a sync for it is already running here."""
+    key = (tenant_id, kb_id)
+    with _ACTIVE_LOCK:
+        if key in _ACTIVE:
+            return False
+        _ACTIVE.add(key)
+    threading.Thread(target=_run, args=key, name=f"kb-index-{kb_id}", daemon=True).start()
+    return True
+
+
+def resume_kb_indexes() -> int:
+    started = 0
+    for item in list_kb_index_jobs():
+        started += int(start_kb_index(item["tenant_id"], item["kb_id"]))
+    return started
@@ -0,0 +1,84 @@
+import logging
+import os
+import threading
+import time
+from typing import Optional, Set, Tuple
+
+from .config import env_bool
+from .storage import (
+    drop_kb_build_indexes,
+    finish_kb_purge,
+    list_deleted_knowledge_bases,
+    purge_kb_documents_batch,
+)
+
+logger = logging.getLogger(__name__)
+
+_ACTIVE: Set[Tuple[str, int]] = set()
+_ACTIVE_LOCK = threading.Lock()
+
+
+def _purge_batches(tenant_id: str, kb_id: int, build_id: Optional[int] = None) -> int:
+    batch_size = max(1, int(os.getenv("KB_PURGE_BATCH_SIZE", "2000")))
+    pause = max(0.0, float(os.getenv("KB_PURGE_PAUSE_MS", "200")) / 1000)
+    max_duty = min(1.0, max(0.01, float(os.getenv("KB_PURGE_MAX_DUTY", "0.5"))))
+    total = 0
+    while True:
+        started = time.perf_counter()
+        removed = purge_kb_documents_batch(tenant_id, kb_id, batch_size, build_id=build_id)
+        if not removed:
+            break
+        total += removed
+        elapsed = time.perf_counter() - started
+        time.sleep(max(pause, elapsed * (1 - max_duty) / max_duty))
+    return total
+
+
+def purge_knowledge_base(tenant_id: str, kb_id: int) -> int:
+    """Remove a soft-deleted KB's chunks in throttled batches, then drop the KB.
+
+    Each batch is its own short transaction of at most KB_PURGE_BATCH_SIZE rows.
+    Between batches the worker sleeps at least KB_PURGE_PAUSE_MS and long enough
+    that deletes take no more than KB_PURGE_MAX_DUTY of wall time, leaving room
+    for live queries. Dead tuples are left to autovacuum unless KB_PURGE_VACUUM
+    is set, which runs a table-wide VACUUM of knowledge_documents afterwards.
+    """
+    total = _purge_batches(tenant_id, kb_id)
+    finish_kb_purge(tenant_id, kb_id, vacuum=env_bool("KB_PURGE_VACUUM"))
+    return total
+
+
+def purge_kb_build(tenant_id: str, kb_id: int, build_id: int) -> int:
+    """Remove the chunks and indexes of a retired or failed build of a live KB, with the same throttling."""
+    total = _purge_batches(tenant_id, kb_id, build_id=build_id)
+    drop_kb_build_indexes(kb_id, build_id)
+    return total
+
+
+def _run(tenant_id: str, kb_id: int) -> None:
+    try:
+        removed = purge_knowledge_base(tenant_id, kb_id)
+        logger.info("Purged knowledge base %s (%s chunks)", kb_id, removed)
+    except Exception:
+        logger.exception("Purge of knowledge base %s failed; it will resume on next start", kb_id)
+    finally:
+        with _ACTIVE_LOCK:
+            _ACTIVE.discard((tenant_id, kb_id))
+
+
+def start_kb_purge(tenant_id: str, kb_id: int) -> bool:
+    """Purge the KB on a background thread unless a purge for it is already running here."""
+    key = (tenant_id, kb_id)
+    with _ACTIVE_LOCK:
+        if key in _ACTIVE:
+            return False
+        _ACTIVE.add(key)
+    threading.Thread(target=_run, args=key, name=f"kb-purge-{kb_id}", daemon=True).start()
+    return True
+
+
+def resume_kb_purges() -> int:
+    started = 0
+    for item in list_deleted_knowledge_bases():
+        started += int(start_kb_purge(item["tenant_id"], item["kb_id"]))
+    return started
@@ -0,0 +1,314 @@
+"""Blue/green knowledge base rebuilds.
+
+A rebuild re-chunks and re-embeds a KB into a shadow build (chunk rows tagged
+with the build id) while live search keeps reading the active build. The shadow
+build gets its quantized index, is validated against the active build with a
+self-retrieval recall check, and is then switched in atomically. Files written
+during the rebuild are caught up before the switch; the old build is purged in
+throttled batches afterwards.
+"""
+
+import logging
+import os
+import statistics
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from .embeddings import embed_texts
+from .kb import Page, content_hash, iter_chunks
+from .kb_index import start_kb_index
+from .kb_purge import purge_kb_build
+from .minhash import band_keys, signature
+from .storage import (
+    activate_kb_build,
+    create_kb_build,
+    ensure_kb_quantized_index,
+    get_kb_build,
+    get_kb_generation,
+    get_knowledge_base,
+    kb_build_lock,
+    list_kb_build_chunks,
+    list_kb_build_files,
+    list_running_kb_builds,
+    replace_kb_build_file,
+    sample_kb_build_chunks,
+    search_kb_build,
+    update_kb_build,
+)
+
+logger = logging.getLogger(__name__)
+
+_ACTIVE: Set[int] = set()
+_ACTIVE_LOCK = threading.Lock()
+_PROBE_CHARS = 300
+_NEEDLE_CHARS = 40
+
+
+def _spec(settings: Dict[str, Any]) -> Tuple[Optional[str], Optional[int]]:
+    if not settings.get("embedding_model"):
+        return None, None
+    return settings["embedding_model"], settings.get("embedding_dimensions")
+
+
+def _source_spec(source: Dict[str, Any]) -> Tuple[Optional[str], Optional[int]]:
+    """Embedding spec of the live KB; its ``embedding_dimensions`` is the stored size, not the requested one."""
+    return _spec({"embedding_model": source["embedding_model"], "embedding_dimensions": source["requested_dimensions"]})
+
+
+def _source_pages(chunks: List[Dict[str, Any]], overlap: int) -> Iterator[Page]:
+    """Reassemble a file's text from its chunks, dropping the overlap each chunk repeats from the previous one."""
+    previous = ""
+    for chunk in chunks:
+        text = chunk["content"]
+        tail = previous[-overlap:].strip() if overlap > 0 else ""
+        if tail and text.startswith(tail):
+            text = text[len(tail) :].lstrip()
+        previous = chunk["content"]
+        yield chunk["metadata"].get("page_start"), text
+
+
+class _Builder:
+    def __init__(self, tenant_id: str, build: Dict[str, Any], source: Dict[str, Any]) -> None:
+        self.tenant_id = tenant_id
+        self.build = build
+        self.source = source
+        self.settings = build["settings"]
+        self.model, self.dimensions = _spec(self.settings)
+        # Unchanged model and dimensions: chunks whose text survives re-chunking keep their vectors.
+        self.reuse = _source_spec(source) == (self.model, self.dimensions)
+        self.batch_size = max(1, int(os.getenv("KB_EMBED_BATCH_SIZE", "64")))
+        self.progress: Dict[str, Any] = {"files": 0, "files_done": 0, "chunks": 0, "embedded": 0, "reused": 0}
+        self.synced_generation = 0
+
+    def build_file(self, file: Dict[str, Any]) -> None:
+        chunks = list_kb_build_chunks(file["id"], self.build["source_build"])
+        if chunks and all("chunk_index" in chunk["metadata"] for chunk in chunks):
+            pages = _source_pages(chunks, self.source["chunk_overlap"])
+            documents = []
+            for chunk in iter_chunks(pages, self.settings["chunk_size"], self.settings["chunk_overlap"]):
+                metadata: Dict[str, Any] = {"filename": file["filename"], "chunk_index": chunk["chunk_index"]}
+                if chunk["page_start"] is not None:
+                    metadata["page_start"] = chunk["page_start"]
+                    metadata["page_end"] = chunk["page_end"]
+                documents.append({"content": chunk["content"], "metadata": metadata})
+        else:
+            # Documents added one by one were never chunked; carry them over as they are.
+            documents = [{"content": chunk["content"], "metadata": chunk["metadata"]} for chunk in chunks]
+
+        reusable = {chunk["content_hash"]: chunk["embedding"] for chunk in chunks if chunk["embedding"] is not None}
+        pending = []
+        for doc in documents:
+            doc["content_hash"] = content_hash(doc["content"])
+            doc["minhash"] = signature(doc["content"])
+            doc["lsh_bands"] = band_keys(doc["minhash"])
+            if self.reuse and doc["content_hash"] in reusable:
+                doc["embedding"] = reusable[doc["content_hash"]]
+                self.progress["reused"] += 1
+            else:
+                pending.append(doc)
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start : start + self.batch_size]
+            vectors = embed_texts([doc["content"] for doc in batch], model=self.model, dimensions=self.dimensions)
+            for doc, vector in zip(batch, vectors):
+                doc["embedding"] = vector
+            self.progress["embedded"] += len(batch)
+        if documents and "dimensions" not in self.progress:
+            self.progress["dimensions"] = len(documents[0]["embedding"])
+
+        try:
+            replace_kb_build_file(self.tenant_id, self.build["kb_id"], self.build["id"], file["id"], documents)
+        except IntegrityError:
+            # The file was deleted while it was being rebuilt.
+            return
+        self.progress["chunks"] += len(documents)
+
+    def build_files(self, files: List[Dict[str, Any]]) -> None:
+        for file in files:
+            self.build_file(file)
+            self.progress["files_done"] += 1
+            update_kb_build(self.build["id"], progress=self.progress)
+
+    def sync(self, initial: bool = False) -> int:
+        """Build every file written since the last sync; returns the KB generation now covered."""
+        # Read the generation before listing files, so anything written later shows up next time.
+        current = get_kb_generation(self.tenant_id, self.build["kb_id"])
+        if current is None:
+            raise RuntimeError("Knowledge base not found.")
+        after = None if initial else self.synced_generation
+        files = list_kb_build_files(self.tenant_id, self.build["kb_id"], after_generation=after)
+        self.progress["files"] += len(files)
+        self.build_files(files)
+        self.synced_generation = current
+        return current
+
+
+def _probe(content: str, length: int) -> str:
+    text = " ".join(content.split())
+    start = max(0, (len(text) - length) // 2)
+    return text[start : start + length]
+
+
+def _found(query: str, content: str) -> bool:
+    # Either end of the passage must survive intact: one of them lies wholly inside a single new chunk.
+    text = " ".join(content.split())
+    return query[:_NEEDLE_CHARS] in text or query[-_NEEDLE_CHARS:] in text
+
+
+def _self_retrieval(
+    tenant_id: str,
+    kb_id: int,
+    build_id: int,
+    quantization: str,
+    dims: Optional[int],
+    queries: List[str],
+    vectors: List[List[float]],
+    k: int,
+) -> Tuple[float, float]:
+    """Share of sampled passages found in the top-k when searched for, and p50 latency in ms."""
+    hits = 0
+    latencies = []
+    for query, vector in zip(queries, vectors):
+        started = time.perf_counter()
+        results = search_kb_build(tenant_id, kb_id, build_id, quantization, dims, vector, limit=k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += any(_found(query, row["content"]) for row in results)
+    return hits / len(queries), statistics.median(latencies)
+
+
+def _validate(tenant_id: str, builder: _Builder, dims: Optional[int]) -> Dict[str, Any]:
+    """Compare self-retrieval recall of the shadow build against the active one on the same sample.
+
+    Passes when the shadow build's recall is no more than KB_REBUILD_RECALL_TOLERANCE
+    below the active build's.
+    """
+    build, source, settings = builder.build, builder.source, builder.settings
+    count = max(1, int(os.getenv("KB_REBUILD_VALIDATION_QUERIES", "20")))
+    k = max(1, int(os.getenv("KB_REBUILD_VALIDATION_K", "5")))
+    tolerance = float(os.getenv("KB_REBUILD_RECALL_TOLERANCE", "0.05"))
+    samples = sample_kb_build_chunks(
+        tenant_id, build["kb_id"], build["source_build"], count, max_generation=builder.synced_generation
+    )
+    # Passages shorter than either build's chunks, so each can be found whole on both sides.
+    length = min(_PROBE_CHARS, source["chunk_size"] // 2, settings["chunk_size"] // 2)
+    queries = [probe for probe in (_probe(sample, length) for sample in samples) if probe]
+    report: Dict[str, Any] = {"queries": len(queries), "k": k, "tolerance": tolerance}
+    if not queries:
+        return {**report, "passed": True}
+
+    source_model, source_dims = _source_spec(source)
+    source_vectors = embed_texts(queries, model=source_model, dimensions=source_dims)
+    if builder.reuse:
+        vectors = source_vectors
+    else:
+        vectors = embed_texts(queries, model=builder.model, dimensions=builder.dimensions)
+    before, before_ms = _self_retrieval(
+        tenant_id,
+        build["kb_id"],
+        build["source_build"],
+        source["quantization"],
+        source["embedding_dimensions"],
+        queries,
+        source_vectors,
+        k,
+    )
+    after, after_ms = _self_retrieval(
+        tenant_id, build["kb_id"], build["id"], settings["quantization"], dims, queries, vectors, k
+    )
+    return {
+        **report,
+        "recall_before": before,
+        "recall_after": after,
+        "p50_ms_before": round(before_ms, 2),
+        "p50_ms_after": round(after_ms, 2),
+        "passed": after >= before - tolerance,
+    }
+
+
+def run_kb_rebuild(tenant_id: str, build_id: int) -> Dict[str, Any]:
+    """Populate, validate and cut over one build; raises if it fails or is rejected."""
+    build = get_kb_build(tenant_id, build_id)
+    if build is None:
+        raise RuntimeError("Build not found.")
+    kb_id = build["kb_id"]
+    source = get_knowledge_base(tenant_id, kb_id)
+    if source is None:
+        raise RuntimeError("Knowledge base not found.")
+    builder = _Builder(tenant_id, build, source)
+    update_kb_build(build_id, status="building")
+
+    builder.sync(initial=True)
+
+    update_kb_build(build_id, status="validating", progress=builder.progress)
+    dims = builder.settings.get("embedding_dimensions") or builder.progress.get("dimensions")
+    ensure_kb_quantized_index(
+        tenant_id, kb_id, build_id=build_id, quantization=builder.settings["quantization"], dims=dims
+    )
+    builder.sync()
+    validation = _validate(tenant_id, builder, dims)
+    update_kb_build(build_id, validation=validation)
+    if not validation["passed"]:
+        raise RuntimeError(
+            f"Recall check failed: {validation['recall_after']:.2f} against "
+            f"{validation['recall_before']:.2f} on the active build."
+        )
+
+    for _ in range(max(1, int(os.getenv("KB_REBUILD_CATCHUP_ROUNDS", "5")))):
+        if activate_kb_build(tenant_id, kb_id, build_id, builder.synced_generation):
+            break
+        builder.sync()
+    else:
+        raise RuntimeError("The knowledge base kept changing during cutover; try the rebuild again.")
+
+    update_kb_build(build_id, progress=builder.progress)
+    purge_kb_build(tenant_id, kb_id, build["source_build"])
+    # Apply a quantization change requested while the build was running.
+    start_kb_index(tenant_id, kb_id)
+    return get_kb_build(tenant_id, build_id) or build
+
+
+def _run(tenant_id: str, build_id: int) -> None:
+    try:
+        with kb_build_lock(build_id) as acquired:
+            if not acquired:
+                return
+            run_kb_rebuild(tenant_id, build_id)
+            logger.info("Rebuilt knowledge base build %s", build_id)
+    except Exception as exc:
+        logger.exception("Knowledge base build %s failed", build_id)
+        build = get_kb_build(tenant_id, build_id)
+        if build is not None and build["status"] != "active":
+            update_kb_build(build_id, status="failed", error=str(exc))
+            try:
+                purge_kb_build(tenant_id, build["kb_id"], build_id)
+            except Exception:
+                logger.exception("Cleanup of failed build %s failed", build_id)
+    finally:
+        with _ACTIVE_LOCK:
+            _ACTIVE.discard(build_id)
+
+
+def _start(tenant_id: str, build_id: int) -> bool:
+    with _ACTIVE_LOCK:
+        if build_id in _ACTIVE:
+            return False
+        _ACTIVE.add(build_id)
+    threading.Thread(target=_run, args=(tenant_id, build_id), name=f"kb-rebuild-{build_id}", daemon=True).start()
+    return True
+
+
+def start_kb_rebuild(tenant_id: str, kb_id: int, settings: Dict[str, Any]) -> Dict[str, Any]:
+    """Register a shadow build with ``settings`` overriding the KB's current ones and run it in the background."""
+    build = create_kb_build(tenant_id, kb_id, settings)
+    _start(tenant_id, build["id"])
+    return build
+
+
+def resume_kb_rebuilds() -> int:
+    """Restart builds interrupted by a shutdown; per-file writes are idempotent, so they start over."""
+    started = 0
+    for build in list_running_kb_builds():
+        started += int(_start(build["tenant_id"], build["id"]))
+    return started
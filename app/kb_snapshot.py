@@ -0,0 +1,265 @@
+"""Portable knowledge base snapshots.
+
+A snapshot is a zip holding ``manifest.json`` (KB settings), ``files.jsonl``
+(the kb_files catalogue), ``chunks.jsonl`` (content, metadata, hashes) and
+``embeddings.bin``: a row-major little-endian float32 (or, on request, float16) matrix with one
+row per chunk that has an embedding. Import bulk-loads chunks with binary COPY,
+so no embeddings are recomputed.
+"""
+
+import json
+import os
+import struct
+import tempfile
+import zipfile
+from typing import Any, BinaryIO, Dict, Optional
+
+from psycopg.adapt import Dumper
+from psycopg.pq import Format
+from psycopg.types import TypeInfo
+from sqlalchemy import select
+
+from .db import session_scope
+from .db_models import KbFile, KnowledgeBase
+from .embeddings import default_embedding_model
+
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_DTYPES = {"float16": "e", "float32": "f"}
+_BATCH_ROWS = 2000
+
+
+class _PackedVector(bytes):
+    """A vector already encoded in pgvector's binary wire format."""
+
+
+def _pack_vector(values) -> _PackedVector:
+    return _PackedVector(struct.pack(f">HH{len(values)}f", len(values), 0, *values))
+
+
+def _driver_connection(session):
+    return session.connection().connection.driver_connection
+
+
+def export_kb_snapshot(tenant_id: str, kb_id: int, target: BinaryIO, dtype: str = "float32") -> Dict[str, Any]:
+    """Write a snapshot of a live KB to ``target`` and return its manifest.
+
+    Vectors are exported losslessly as float32; ``dtype="float16"`` halves the
+    matrix at the cost of rounding every component, so it is opt-in.
+    """
+    if dtype not in SNAPSHOT_DTYPES:
+        raise RuntimeError(f"dtype must be one of: {', '.join(SNAPSHOT_DTYPES)}")
+    code = SNAPSHOT_DTYPES[dtype]
+    with session_scope() as session:
+        kb = session.execute(
+            select(KnowledgeBase).where(
+                KnowledgeBase.tenant_id == tenant_id,
+                KnowledgeBase.id == kb_id,
+                KnowledgeBase.deleted_at.is_(None),
+            )
+        ).scalars().first()
+        if kb is None:
+            raise RuntimeError("Knowledge base not found.")
+        files = session.execute(select(KbFile).where(KbFile.tenant_id == tenant_id, KbFile.kb_id == kb_id)).scalars().all()
+
+        conn = _driver_connection(session)
+        chunks = 0
+        vectors = 0
+        dims: Optional[int] = kb.embedding_dimensions
+        with tempfile.TemporaryDirectory(prefix="kb-snapshot-") as workdir:
+            chunks_path = os.path.join(workdir, "chunks.jsonl")
+            matrix_path = os.path.join(workdir, "embeddings.bin")
+            # Vectors are read in pgvector's binary format straight off the wire.
+            with conn.cursor(name=f"kb_snapshot_{kb_id}", binary=True) as cursor, open(
+                chunks_path, "wb"
+            ) as chunk_out, open(matrix_path, "wb") as matrix_out:
+                cursor.itersize = _BATCH_ROWS
+                cursor.execute(
+                    "SELECT file_id, content, doc_metadata::text, content_hash, file_version, "
+                    "minhash, lsh_bands, embedding FROM knowledge_documents "
+                    "WHERE tenant_id = %s AND kb_id = %s AND build_id = %s ORDER BY id",
+                    (tenant_id, kb_id, kb.active_build),
+                )
+                for file_id, content, metadata, chunk_hash, file_version, minhash, lsh_bands, embedding in cursor:
+                    row_index = None
+                    if embedding is not None:
+                        width = struct.unpack_from(">H", embedding)[0]
+                        if dims is None:
+                            dims = width
+                        if width != dims:
+                            raise RuntimeError("Knowledge base mixes embedding dimensions; re-index it first.")
+                        values = struct.unpack_from(f">{width}f", embedding, 4)
+                        matrix_out.write(struct.pack(f"<{width}{code}", *values))
+                        row_index = vectors
+                        vectors += 1
+                    row = {
+                        "file_id": file_id,
+                        "content": content,
+                        "metadata": json.loads(metadata) if metadata else None,
+                        "content_hash": chunk_hash,
+                        "file_version": file_version,
+                        "minhash": minhash,
+                        "lsh_bands": lsh_bands,
+                        "vector": row_index,
+                    }
+                    chunk_out.write(json.dumps(row).encode("utf-8") + b"\n")
+                    chunks += 1
+
+            manifest = {
+                "format": SNAPSHOT_FORMAT,
+                "name": kb.name,
+                "description": kb.description,
+                "provider": kb.provider,
+                "quantization": kb.quantization,
+                # Resolve the default so the importing environment embeds queries with the same model.
+                "embedding_model": kb.embedding_model or default_embedding_model(),
+                "embedding_model_explicit": bool(kb.embedding_model),
+                "embedding_dimensions": dims,
+                "requested_dimensions": kb.requested_dimensions,
+                "chunk_size": kb.chunk_size,
+                "chunk_overlap": kb.chunk_overlap,
+                "dtype": dtype,
+                "files": len(files),
+                "chunks": chunks,
+                "vectors": vectors,
+            }
+            with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+                archive.writestr("manifest.json", json.dumps(manifest, indent=2))
+                archive.writestr(
+                    "files.jsonl",
+                    "".join(
+                        json.dumps(
+                            {
+                                "id": item.id,
+                                "filename": item.filename,
+                                "chunk_count": item.chunk_count,
+                                "byte_size": item.byte_size,
+                                "content_hash": item.content_hash,
+                            }
+                        )
+                        + "\n"
+                        for item in files
+                    ),
+                )
+                archive.write(chunks_path, "chunks.jsonl")
+                # Float matrices barely compress; store them so export stays I/O bound.
+                archive.write(matrix_path, "embeddings.bin", compress_type=zipfile.ZIP_STORED)
+    return manifest
+
+
+def _register_packed_vector(conn) -> int:
+    info = TypeInfo.fetch(conn, "vector")
+    if info is None:
+        raise RuntimeError("The vector extension is not installed in the target database.")
+
+    class PackedVectorDumper(Dumper):
+        format = Format.BINARY
+        oid = info.oid
+
+        def dump(self, obj):
+            return obj
+
+    conn.adapters.register_dumper(_PackedVector, PackedVectorDumper)
+    return info.oid
+
+
+def import_kb_snapshot(tenant_id: str, source: BinaryIO, name: Optional[str] = None) -> Dict[str, Any]:
+    """Create a new KB for ``tenant_id`` from a snapshot; returns ``{"id", "files", "chunks"}``."""
+    try:
+        archive = zipfile.ZipFile(source)
+    except zipfile.BadZipFile as exc:
+        raise RuntimeError("Invalid snapshot archive.") from exc
+    with archive:
+        try:
+            manifest = json.loads(archive.read("manifest.json"))
+        except (KeyError, ValueError) as exc:
+            raise RuntimeError("Snapshot manifest is missing or invalid.") from exc
+        if manifest.get("format") != SNAPSHOT_FORMAT or manifest.get("dtype") not in SNAPSHOT_DTYPES:
+            raise RuntimeError("Unsupported snapshot format.")
+        code = SNAPSHOT_DTYPES[manifest["dtype"]]
+        dims = manifest.get("embedding_dimensions")
+        row_bytes = struct.calcsize(f"<{dims}{code}") if dims else 0
+
+        model = manifest.get("embedding_model")
+        explicit = manifest.get("embedding_model_explicit") or (model and model != default_embedding_model())
+        if "requested_dimensions" in manifest:
+            requested = manifest["requested_dimensions"]
+        else:
+            # Older snapshots only carry the stored size; only text-embedding-3 models accept it as a request.
+            requested = dims if explicit and model and model.startswith("text-embedding-3") else None
+
+        with session_scope() as session:
+            kb_name = name or manifest["name"]
+            exists = session.execute(
+                select(KnowledgeBase.id).where(
+                    KnowledgeBase.tenant_id == tenant_id,
+                    KnowledgeBase.name == kb_name,
+                    KnowledgeBase.deleted_at.is_(None),
+                )
+            ).first()
+            if exists is not None:
+                raise RuntimeError(f"A knowledge base named {kb_name!r} already exists.")
+            kb = KnowledgeBase(
+                tenant_id=tenant_id,
+                name=kb_name,
+                description=manifest.get("description") or "",
+                provider=manifest.get("provider") or "pgvector",
+                quantization=manifest.get("quantization") or "none",
+                embedding_model=model if explicit else None,
+                embedding_dimensions=dims,
+                requested_dimensions=requested,
+                chunk_size=manifest.get("chunk_size") or 1200,
+                chunk_overlap=manifest.get("chunk_overlap", 200),
+            )
+            session.add(kb)
+            session.flush()
+
+            file_ids: Dict[int, int] = {}
+            with archive.open("files.jsonl") as lines:
+                for line in lines:
+                    item = json.loads(line)
+                    record = KbFile(
+                        tenant_id=tenant_id,
+                        kb_id=kb.id,
+                        filename=item["filename"],
+                        chunk_count=item.get("chunk_count") or 0,
+                        byte_size=item.get("byte_size") or 0,
+                        content_hash=item.get("content_hash"),
+                    )
+                    session.add(record)
+                    session.flush()
+                    file_ids[item["id"]] = record.id
+
+            conn = _driver_connection(session)
+            vector_oid = _register_packed_vector(conn)
+            columns = (
+                "tenant_id, kb_id, file_id, content, doc_metadata, content_hash, file_version, minhash, lsh_bands, embedding"
+            )
+            types = ["varchar", "int8", "int8", "text", "jsonb", "varchar", "int4", "int8[]", "int8[]", vector_oid]
+            chunks = 0
+            with conn.cursor() as cursor, archive.open("chunks.jsonl") as lines, archive.open("embeddings.bin") as matrix:
+                with cursor.copy(f"COPY knowledge_documents ({columns}) FROM STDIN (FORMAT BINARY)") as copy:
+                    copy.set_types(types)
+                    for line in lines:
+                        item = json.loads(line)
+                        embedding = None
+                        if item.get("vector") is not None:
+                            raw = matrix.read(row_bytes)
+                            if len(raw) != row_bytes:
+                                raise RuntimeError("Snapshot embedding matrix is truncated.")
+                            embedding = _pack_vector(struct.unpack(f"<{dims}{code}", raw))
+                        copy.write_row(
+                            (
+                                tenant_id,
+                                kb.id,
+                                file_ids.get(item.get("file_id")),
+                                item["content"],
+                                item.get("metadata"),
+                                item.get("content_hash"),
+                                item.get("file_version"),
+                                item.get("minhash"),
+                                item.get("lsh_bands"),
+                                embedding,
+                            )
+                        )
+                        chunks += 1
+            return {"id": int(kb.id), "files": len(file_ids), "chunks": chunks}
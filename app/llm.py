@@ -20,7 +20,7 @@ def _client():
     return OpenAI(api_key=api_key)
 
 
-def _model() -> str:
+def chat_model() -> str:
     return os.getenv("AZURE_OPENAI_DEPLOYMENT", os.getenv("LLM_MODEL", "gpt-4o-mini"))
 
 
@@ -34,7 +34,7 @@ def select_intent(message: str, intents: List[Dict[str, str]]) -> Tuple[Optional
         "Return JSON with keys intent_id and confidence (0-1)."
     )
     response = client.chat.completions.create(
-        model=_model(),
+        model=chat_model(),
         messages=[
             {"role": "system", "content": prompt},
             {"role": "user", "content": json.dumps({"message": message, "intents": intent_list})},
@@ -61,7 +61,7 @@ def answer_with_context(question: str, context: str) -> Tuple[str, Dict[str, Any
         "If the context does not contain the answer, say you do not know."
     )
     response = client.chat.completions.create(
-        model=_model(),
+        model=chat_model(),
         messages=[
             {"role": "system", "content": prompt},
             {"role": "user", "content": json.dumps({"question": question, "context": context})},
@@ -79,7 +79,7 @@ def extract_fields(message: str, fields: List[Dict[str, Any]]) -> Tuple[Dict[str
         "Return JSON object keyed by field name. Use null if missing."
     )
     response = client.chat.completions.create(
-        model=_model(),
+        model=chat_model(),
         messages=[
             {"role": "system", "content": prompt},
             {"role": "user", "content": json.dumps({"message": message, "fields": fields})},
@@ -101,7 +101,7 @@ def generate_field_prompt(form: Dict[str, Any], field: Dict[str, Any]) -> Tuple[
         "Keep it concise (under ~18 words), end with a question mark."
     )
     response = client.chat.completions.create(
-        model=_model(),
+        model=chat_model(),
         messages=[
             {"role": "system", "content": prompt},
             {"role": "user", "content": json.dumps({"form": form, "field": field})},
@@ -121,7 +121,7 @@ def explain_validation_error(payload: Dict[str, Any]) -> Tuple[str, Dict[str, An
         "Be specific and suggest how to fix it. Avoid jargon."
     )
     response = client.chat.completions.create(
-        model=_model(),
+        model=chat_model(),
         messages=[
             {"role": "system", "content": prompt},
             {"role": "user", "content": json.dumps(payload)},
@@ -139,7 +139,7 @@ def explain_validator_failure(payload: Dict[str, Any]) -> Tuple[str, Dict[str, A
         "using the user's provided values. Suggest what to change."
     )
     response = client.chat.completions.create(
-        model=_model(),
+        model=chat_model(),
         messages=[
             {"role": "system", "content": prompt},
             {"role": "user", "content": json.dumps(payload)},
@@ -0,0 +1,108 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from .config import env_bool
+from .storage import (
+    LOG_TABLES,
+    add_months,
+    create_log_partition,
+    delete_log_partition_rows,
+    drop_log_partition,
+    list_log_partition_agents,
+    list_log_partitions,
+    list_log_retention_policies,
+    log_maintenance_lock,
+    month_start,
+)
+
+logger = logging.getLogger(__name__)
+
+_STARTED = threading.Event()
+
+
+def default_retention_months() -> Optional[int]:
+    """Deployment-wide retention (LOG_RETENTION_MONTHS); unset or 0 keeps logs forever."""
+    months = int(os.getenv("LOG_RETENTION_MONTHS", "0") or 0)
+    return months if months > 0 else None
+
+
+def _keeps(months: Optional[int], upper: datetime, now: datetime) -> bool:
+    return months is None or upper > add_months(now, -months)
+
+
+def maintain_log_partitions(now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Create upcoming monthly partitions and expire old ones according to the retention policies.
+
+    A month is expired for an agent once it ended more than the agent's retention
+    (its persistence config, else LOG_RETENTION_MONTHS) ago. Partitions are shared
+    by all tenants: one nobody keeps any more is dropped, or archived to
+    LOG_ARCHIVE_SCHEMA, which is a catalogue change rather than a DELETE. Agents with
+    a shorter retention than the others have their rows deleted from just that
+    partition.
+    """
+    now = now or datetime.now(timezone.utc)
+    months_ahead = max(1, int(os.getenv("LOG_PARTITION_MONTHS_AHEAD", "3")))
+    archive_schema = os.getenv("LOG_ARCHIVE_SCHEMA") or None
+    default = default_retention_months()
+    policies = list_log_retention_policies()
+    report: Dict[str, Any] = {"created": [], "dropped": [], "archived": [], "deleted_rows": 0}
+    for table in LOG_TABLES:
+        for offset in range(months_ahead + 1):
+            month = add_months(month_start(now), offset)
+            if create_log_partition(table, month):
+                report["created"].append(f"{table}_p{month:%Y%m}")
+        retention = {agent: tables[table] or default for agent, tables in policies.items()}
+        for partition in list_log_partitions(table):
+            upper = add_months(partition["month"], 1)
+            if upper > now:
+                continue
+            keepers = {agent for agent, months in retention.items() if _keeps(months, upper, now)}
+            if not keepers and not _keeps(default, upper, now):
+                drop_log_partition(table, partition["name"], archive_schema)
+                report["archived" if archive_schema else "dropped"].append(partition["name"])
+                continue
+            # Past months get no new rows, so once an agent's rows are gone the partition
+            # stops listing it and later passes have nothing to delete.
+            present = list_log_partition_agents(partition["name"])
+            if _keeps(default, upper, now):
+                # Agents without a policy of their own keep it; delete only those that expire sooner.
+                expired = [agent for agent in present if not _keeps(retention.get(agent, default), upper, now)]
+            else:
+                expired = [agent for agent in present if agent not in keepers]
+            if expired:
+                report["deleted_rows"] += delete_log_partition_rows(partition["name"], sorted(expired))
+    return report
+
+
+def run_log_maintenance() -> Optional[Dict[str, Any]]:
+    """One maintenance pass, unless another process holds the maintenance lock."""
+    with log_maintenance_lock() as acquired:
+        if not acquired:
+            return None
+        report = maintain_log_partitions()
+    if report["created"] or report["dropped"] or report["archived"] or report["deleted_rows"]:
+        logger.info("Log partition maintenance: %s", report)
+    return report
+
+
+def _loop(interval: float) -> None:
+    while True:
+        try:
+            run_log_maintenance()
+        except Exception:
+            logger.exception("Log partition maintenance failed; retrying in %ss", interval)
+        time.sleep(interval)
+
+
+def start_log_maintenance() -> bool:
+    """Run maintenance now and every LOG_MAINTENANCE_INTERVAL_SECONDS on a daemon thread (once per process)."""
+    if not env_bool("LOG_MAINTENANCE_ENABLED", True) or _STARTED.is_set():
+        return False
+    _STARTED.set()
+    interval = max(60.0, float(os.getenv("LOG_MAINTENANCE_INTERVAL_SECONDS", "21600")))
+    threading.Thread(target=_loop, args=(interval,), name="log-maintenance", daemon=True).start()
+    return True
@@ -0,0 +1,74 @@
+import hashlib
+import random
+import re
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+NUM_PERM = 64
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 5
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# Fixed seed: signatures are stored in Postgres and must be comparable across processes and deploys.
+_rng = random.Random(20240601)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def _shingles(text: str) -> set[int]:
+    tokens = _TOKEN_RE.findall(text.lower())
+    if not tokens:
+        return set()
+    if len(tokens) < SHINGLE_SIZE:
+        return {zlib.crc32(" ".join(tokens).encode("utf-8"))}
+    return {
+        zlib.crc32(" ".join(tokens[idx : idx + SHINGLE_SIZE]).encode("utf-8"))
+        for idx in range(len(tokens) - SHINGLE_SIZE + 1)
+    }
+
+
+def signature(text: str) -> List[int]:
+    shingles = _shingles(text)
+    if not shingles:
+        return [_MAX_HASH] * NUM_PERM
+    return [min(((a * value + b) % _PRIME) & _MAX_HASH for value in shingles) for a, b in _PERMUTATIONS]
+
+
+def band_keys(sig: Sequence[int]) -> List[int]:
+    """Hash each band of the signature into a signed 64-bit key (fits a Postgres BIGINT)."""
+    keys = []
+    for band in range(BANDS):
+        rows = sig[band * ROWS : (band + 1) * ROWS]
+        digest = hashlib.blake2b(f"{band}:{','.join(map(str, rows))}".encode("ascii"), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, "big", signed=True))
+    return keys
+
+
+def similarity(left: Sequence[int], right: Sequence[int]) -> float:
+    if not left or not right or len(left) != len(right):
+        return 0.0
+    return sum(1 for a, b in zip(left, right) if a == b) / len(left)
+
+
+class NearDuplicateIndex:
+    """In-memory LSH index over MinHash signatures."""
+
+    def __init__(self, threshold: float) -> None:
+        self.threshold = threshold
+        self._buckets: Dict[int, List[Tuple[List[int], Any]]] = {}
+
+    def add(self, sig: List[int], ref: Any, keys: Optional[List[int]] = None) -> None:
+        for key in keys or band_keys(sig):
+            self._buckets.setdefault(key, []).append((sig, ref))
+
+    def match(self, sig: List[int], keys: Optional[List[int]] = None) -> Optional[Any]:
+        best_ref = None
+        best_score = self.threshold
+        for key in keys or band_keys(sig):
+            for candidate, ref in self._buckets.get(key, []):
+                score = similarity(sig, candidate)
+                if score >= best_score:
+                    best_ref, best_score = ref, score
+        return best_ref
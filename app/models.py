@@ -18,6 +18,11 @@ class ProjectConfig(BaseModel):
     azure_app_service: Optional[AzureAppServiceSettings] = None
 
 
+class KnowledgeBaseRef(BaseModel):
+    id: int
+    weight: float = Field(default=1.0, gt=0)
+
+
 class KnowledgeBaseConfig(BaseModel):
     enable_knowledge_base: bool = False
     provider: Literal["azure_ai_search", "pgvector", "none"] = "pgvector"
@@ -25,9 +30,12 @@ class KnowledgeBaseConfig(BaseModel):
     api_key: Optional[str] = None
     index_name: Optional[str] = None
     knowledge_base_id: Optional[int] = None
+    knowledge_bases: List[KnowledgeBaseRef] = Field(default_factory=list)
     retrieval_mode: Literal["single-pass", "agentic"] = "single-pass"
     max_agentic_passes: int = 3
     use_semantic_ranker: bool = True
+    # Max prompt tokens of KB context per answer; None uses KB_CONTEXT_TOKEN_BUDGET, 0 disables the limit.
+    context_token_budget: Optional[int] = Field(default=None, ge=0)
 
     @field_validator("endpoint", "api_key", "index_name", mode="before")
     @classmethod
@@ -36,6 +44,13 @@ class KnowledgeBaseConfig(BaseModel):
             return None
         return value
 
+    @field_validator("knowledge_bases", mode="before")
+    @classmethod
+    def _ids_to_refs(cls, value):
+        if value is None:
+            return []
+        return [{"id": item} if isinstance(item, int) else item for item in value]
+
 
 class FieldUIConfig(BaseModel):
     placeholder: Optional[str] = None
@@ -202,6 +217,8 @@ class PersistenceConfig(BaseModel):
     postgres_dsn: Optional[str] = None
     mongo_uri: Optional[str] = None
     enable_chat_logs: bool = True
+    chat_log_retention_months: Optional[int] = Field(default=None, ge=1)
+    trace_log_retention_months: Optional[int] = Field(default=None, ge=1)
     enable_config_versions: bool = True
     enable_cosmos: bool = False
     use_managed_identity: bool = False
@@ -0,0 +1,121 @@
+import hashlib
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from .cache import build_kb_cache_key, cache_get, cache_set, get_redis, kb_cache_ttl
+from .embeddings import embed_text
+from .storage import get_kb_profiles, search_kb_documents_federated
+
+
+def _query_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _weights_part(kb_weights: Dict[int, float]) -> str:
+    return ",".join(f"{kb_id}*{weight:g}" for kb_id, weight in sorted(kb_weights.items()))
+
+
+def search_knowledge_base(tenant_id: str, kb_id: int, query: str, limit: int = 5) -> Tuple[List[Dict[str, Any]], bool]:
+    return search_knowledge_bases(tenant_id, {kb_id: 1.0}, query, limit=limit)
+
+
+def search_knowledge_bases(
+    tenant_id: str,
+    kb_weights: Dict[int, float],
+    query: str,
+    limit: int = 5,
+    profiles: Optional[Dict[int, Dict[str, Any]]] = None,
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """Run a federated search over ``kb_weights`` (kb_id -> weight).
+
+    The query is embedded once per distinct (model, dimensions) among the KBs.
+    Query embeddings and results are cached under the generations of the KBs
+    involved. Returns ``(results, cached)``; without Redis nothing is cached.
+    """
+    if profiles is None:
+        profiles = get_kb_profiles(tenant_id, list(kb_weights))
+    kb_weights = {kb_id: weight for kb_id, weight in kb_weights.items() if kb_id in profiles}
+    if not kb_weights:
+        return [], False
+    cache = get_redis()
+    generations = {kb_id: profiles[kb_id]["generation"] for kb_id in kb_weights}
+    query_hash = _query_hash(query)
+    results_key = build_kb_cache_key(
+        tenant_id, generations, "search", _weights_part(kb_weights), str(limit), query_hash
+    )
+    if cache:
+        cached = cache_get(cache, results_key)
+        if cached is not None:
+            return cached, True
+
+    by_spec: Dict[Tuple[Optional[str], Optional[int]], List[int]] = {}
+    for kb_id in kb_weights:
+        by_spec.setdefault(profiles[kb_id]["embedding"], []).append(kb_id)
+    embeddings: Dict[int, List[float]] = {}
+    for (model, dimensions), kb_ids in by_spec.items():
+        group_generations = {kb_id: generations[kb_id] for kb_id in kb_ids}
+        embedding = _query_embedding(cache, tenant_id, group_generations, model, dimensions, query, query_hash)
+        embeddings.update({kb_id: embedding for kb_id in kb_ids})
+    results = search_kb_documents_federated(tenant_id, kb_weights, embeddings, limit=limit)
+    if cache:
+        cache_set(cache, results_key, results, kb_cache_ttl())
+    return results, False
+
+
+def _query_embedding(
+    cache: Any,
+    tenant_id: str,
+    generations: Dict[int, int],
+    model: Optional[str],
+    dimensions: Optional[int],
+    query: str,
+    query_hash: str,
+) -> List[float]:
+    if not cache:
+        return embed_text(query, model=model, dimensions=dimensions)
+    key = build_kb_cache_key(tenant_id, generations, "embedding", model or "default", str(dimensions or 0), query_hash)
+    embedding = cache_get(cache, key)
+    if embedding is None:
+        embedding = embed_text(query, model=model, dimensions=dimensions)
+        cache_set(cache, key, embedding, kb_cache_ttl())
+    return embedding
+
+
+def answer_scope(agent_id: Optional[str], answer_config: Dict[str, Any]) -> str:
+    """Cache scope of an agent's KB answers: its id plus a hash of everything that shapes the answer."""
+    digest = hashlib.sha256(json.dumps(answer_config, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    return f"{agent_id or '-'}:{digest[:16]}"
+
+
+def _answer_key(
+    tenant_id: str, scope: str, generations: Dict[int, int], kb_weights: Dict[int, float], question: str
+) -> str:
+    return build_kb_cache_key(tenant_id, generations, "answer", scope, _weights_part(kb_weights), _query_hash(question))
+
+
+def get_cached_answer(
+    tenant_id: str,
+    scope: str,
+    generations: Dict[int, int],
+    kb_weights: Dict[int, float],
+    question: str,
+) -> Optional[Dict[str, Any]]:
+    """Cached reply for ``question``; ``scope`` comes from ``answer_scope`` so agents never share answers."""
+    cache = get_redis()
+    if not cache or not generations:
+        return None
+    return cache_get(cache, _answer_key(tenant_id, scope, generations, kb_weights, question))
+
+
+def cache_answer(
+    tenant_id: str,
+    scope: str,
+    generations: Dict[int, int],
+    kb_weights: Dict[int, float],
+    question: str,
+    answer: Dict[str, Any],
+) -> None:
+    cache = get_redis()
+    if not cache or not generations:
+        return
+    cache_set(cache, _answer_key(tenant_id, scope, generations, kb_weights, question), answer, kb_cache_ttl())
@@ -1,5 +1,6 @@
 import logging
 import os
+import time
 import uuid
 from datetime import datetime
 from typing import Any, Dict, List, Optional
@@ -8,6 +9,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
 from .cache import build_cache_key, cache_get, cache_set, get_redis
+from .db import pool_stats
 from .graph import build_graph
 from .models import ChatResponse, FormsConfig, KnowledgeBaseConfig, ToolCallConfig, ToolDefinition, ToolsConfig
 from .google_oauth import refresh_credentials_if_needed, token_to_credentials
@@ -19,16 +21,20 @@ from .storage import (
     get_agent_id,
     get_latest_version_payload,
     get_tenant_id,
-    get_thread_state,
+    get_thread_state_entry,
     get_version_config,
     get_oauth_credential,
     log_chat,
     log_trace,
+    record_turn_usage,
+    reserve_thread_state,
     update_form_submission_delivery,
     upsert_oauth_credential,
     upsert_thread_state,
+    ThreadStateConflict,
 )
 from .tools_runtime import execute_tool
+from .usage import turn_counters
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -55,6 +61,11 @@ def healthcheck():
     return {"status": "ok"}
 
 
+@app.get("/stats/db-pool")
+def db_pool_stats():
+    return pool_stats()
+
+
 @app.get("/forms")
 def list_forms(version: Optional[int] = None):
     tenant_id = get_tenant_id()
@@ -109,6 +120,13 @@ def chat_preview(req: RuntimeMessageRequest):
     return _run_chat(req, config, version, tenant_id, agent_id)
 
 
+def _discard_concurrent_turn(redis_client, cache_key: str, thread_id: str) -> None:
+    # The cached row version is stale; the retry must read the stored one.
+    if redis_client:
+        redis_client.delete(cache_key)
+    logger.warning("Discarded concurrent turn for thread %s", thread_id)
+
+
 def _run_chat(
     req: RuntimeMessageRequest,
     config: Dict[str, Any],
@@ -116,22 +134,37 @@ def _run_chat(
     tenant_id: str,
     agent_id: str,
 ) -> ChatResponse:
+    started = time.perf_counter()
     forms_config = FormsConfig.model_validate(config.get("forms", {}))
     tools_config = ToolsConfig.model_validate(config.get("tools", {"tools": []}))
     knowledge_config = KnowledgeBaseConfig.model_validate(config.get("knowledge", {}))
-    graph_app, _ = build_graph(forms_config, tools_config, knowledge_config)
+    graph_app, _ = build_graph(forms_config, tools_config, knowledge_config, agent_id=agent_id)
 
     redis_client = get_redis()
     cache_key = build_cache_key(
-        "session",
+        "thread_state",
         tenant_id,
         agent_id,
         version,
         "public",
         req.thread_id,
     )
-    cached_state = cache_get(redis_client, cache_key) if redis_client else None
-    previous_state = cached_state or get_thread_state(tenant_id, agent_id, version, req.thread_id) or {}
+    stored = cache_get(redis_client, cache_key) if redis_client else None
+    if not isinstance(stored, dict) or "row_version" not in stored:
+        stored = get_thread_state_entry(tenant_id, agent_id, version, req.thread_id) or {"state": {}, "row_version": 0}
+    try:
+        # Claim the thread before any tool call or delivery, so a concurrent turn is refused before its side effects.
+        reserved_row_version = reserve_thread_state(
+            tenant_id, agent_id, version, req.thread_id, expected_row_version=stored["row_version"]
+        )
+    except ThreadStateConflict as exc:
+        _discard_concurrent_turn(redis_client, cache_key, req.thread_id)
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+    if redis_client:
+        # Point the cache at the reserved version, so a turn that fails after this does not 409 the next one.
+        ttl = int(os.getenv("CACHE_TTL_SECONDS", "900"))
+        cache_set(redis_client, cache_key, {"state": stored["state"], "row_version": reserved_row_version}, ttl)
+    previous_state = stored["state"] or {}
     state_input: Dict[str, Any] = {**previous_state, "thread_id": req.thread_id, "last_user_message": req.message}
     state_input.pop("reply", None)
     state_input["trace_events"] = []
@@ -298,10 +331,18 @@ def _run_chat(
     state_for_storage = dict(result)
     state_for_storage.pop("trace_events", None)
 
-    upsert_thread_state(tenant_id, agent_id, version, req.thread_id, state_for_storage)
+    try:
+        row_version = upsert_thread_state(
+            tenant_id, agent_id, version, req.thread_id, state_for_storage, expected_row_version=reserved_row_version
+        )
+    except ThreadStateConflict as exc:
+        # Another writer bypassed the reservation; keep its state rather than overwrite it.
+        _discard_concurrent_turn(redis_client, cache_key, req.thread_id)
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
     if redis_client:
         ttl = int(os.getenv("CACHE_TTL_SECONDS", "900"))
-        cache_set(redis_client, cache_key, state_for_storage, ttl)
+        cache_set(redis_client, cache_key, {"state": state_for_storage, "row_version": row_version}, ttl)
+    record_turn_usage(tenant_id, agent_id, version, req.thread_id, turn_counters(events))
     log_chat(tenant_id, agent_id, version, req.thread_id, "user", req.message)
     log_chat(tenant_id, agent_id, version, req.thread_id, "assistant", reply, state=state_for_storage)
     trace_id = str(uuid.uuid4())
@@ -321,6 +362,7 @@ def _run_chat(
             "state_before": state_before,
             "state_after": state_after,
         },
+        latency_ms=int((time.perf_counter() - started) * 1000),
     )
     logger.info("Processed message for thread %s", req.thread_id)
     return ChatResponse(reply=reply, state=result)
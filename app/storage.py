@@ -1,23 +1,59 @@
 from __future__ import annotations
 
-from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional
-
-from sqlalchemy import delete, desc, func, or_, select
+import base64
+import json
+import os
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Generator, Iterator, List, Optional, Set, Tuple
+
+from pgvector.sqlalchemy import BIT, HALFVEC, Vector
+from sqlalchemy import (
+    case,
+    cast,
+    column as sa_column,
+    delete,
+    desc,
+    exists,
+    func,
+    literal,
+    literal_column,
+    null,
+    or_,
+    select,
+    table as sa_table,
+    text,
+    tuple_,
+    union_all,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, undefer
 
-from .db import session_scope
+from .config import env_bool
+from .db import get_engine, read_session_scope, session_scope
 from .db_models import (
+    AgentActivity,
     AgentDraft,
     AgentVersion,
     AuditLog,
     ChatLog,
     FormSubmission,
+    KbBuild,
+    KbFile,
     KnowledgeBase,
     KnowledgeDocument,
     OAuthCredential,
     ThreadState,
+    ThreadSummary,
     TraceLog,
+    TracePayload,
+    UsageRollup,
 )
+from .kb import content_hash
+from .trace_payloads import decode_payload, encode_payload, summarize_trace
+from .usage import SKETCH_REGISTERS, USAGE_COUNTERS, estimate_distinct, sketch_register
 
 
 DEFAULT_TENANT = "local"
@@ -25,14 +61,10 @@ DEFAULT_AGENT = "default"
 
 
 def get_tenant_id() -> str:
-    import os
-
     return os.getenv("TENANT_ID", DEFAULT_TENANT)
 
 
 def get_agent_id() -> str:
-    import os
-
     return os.getenv("AGENT_ID", DEFAULT_AGENT)
 
 
@@ -46,17 +78,15 @@ def get_draft_config(tenant_id: str, agent_id: str) -> Optional[Dict[str, Any]]:
         return draft.config if draft else None
 
 
-def upsert_draft_config(tenant_id: str, agent_id: str, config: Dict[str, Any]) -> None:
+def upsert_draft_config(tenant_id: str, agent_id: str, config: Dict[str, Any]) -> int:
+    """Insert or replace the draft in one statement; returns its new row version."""
+    stmt = pg_insert(AgentDraft).values(tenant_id=tenant_id, agent_id=agent_id, config=config)
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_agent_drafts_tenant_agent",
+        set_={"config": stmt.excluded.config, "updated_at": func.now(), "row_version": AgentDraft.row_version + 1},
+    ).returning(AgentDraft.row_version)
     with session_scope() as session:
-        stmt = select(AgentDraft).where(
-            AgentDraft.tenant_id == tenant_id,
-            AgentDraft.agent_id == agent_id,
-        )
-        draft = session.execute(stmt).scalars().first()
-        if draft:
-            draft.config = config
-        else:
-            session.add(AgentDraft(tenant_id=tenant_id, agent_id=agent_id, config=config))
+        return session.execute(stmt).scalar_one()
 
 
 def publish_config(tenant_id: str, agent_id: str, config: Dict[str, Any]) -> int:
@@ -100,62 +130,190 @@ def list_versions(tenant_id: str, agent_id: str) -> List[Dict[str, Any]]:
         ]
 
 
+USAGE_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+USAGE_GRANULARITIES = ("hour", "day")
+
+
+def _session_sketch_enabled() -> bool:
+    return env_bool("USAGE_SESSION_SKETCH", True)
+
+
+def record_turn_usage(
+    tenant_id: str, agent_id: str, version: int, thread_id: str, counters: Dict[str, int]
+) -> None:
+    """Add one turn's counters to its hour, day and all-time rollup rows in a single upsert.
+
+    Must run before the turn's messages are logged: whether the thread counts as a new
+    session in each bucket is decided from its previous activity in thread_summaries.
+    """
+    with session_scope() as session:
+        now, previous = session.execute(
+            select(
+                func.now(),
+                select(ThreadSummary.last_activity)
+                .where(
+                    ThreadSummary.tenant_id == tenant_id,
+                    ThreadSummary.agent_id == agent_id,
+                    ThreadSummary.thread_id == thread_id,
+                )
+                .scalar_subquery(),
+            )
+        ).one()
+        now = now.astimezone(timezone.utc)
+        hour = now.replace(minute=0, second=0, microsecond=0)
+        day = hour.replace(hour=0)
+        sketch = _session_sketch_enabled()
+        rows = []
+        for granularity, bucket in (("hour", hour), ("day", day), ("all", USAGE_EPOCH)):
+            row = {
+                **counters,
+                "tenant_id": tenant_id,
+                "agent_id": agent_id,
+                "version": version,
+                "granularity": granularity,
+                "bucket": bucket,
+                "sessions": int(previous is None or previous < bucket),
+                "new_sessions": int(previous is None),
+                "sessions_sketch": None,
+            }
+            if granularity == "day" and sketch:
+                row["sessions_sketch"] = literal_column(f"array_fill(0::smallint, ARRAY[{SKETCH_REGISTERS}])")
+            rows.append(row)
+        stmt = pg_insert(UsageRollup).values(rows)
+        session.execute(
+            stmt.on_conflict_do_update(
+                constraint="uq_usage_rollups",
+                set_={name: getattr(UsageRollup, name) + getattr(stmt.excluded, name) for name in USAGE_COUNTERS},
+            )
+        )
+        if sketch and (previous is None or previous < day):
+            # A thread only needs adding to a day's sketch once, on its first turn that day.
+            register, rank = sketch_register(f"{agent_id}:{thread_id}")
+            session.execute(
+                text(
+                    "UPDATE usage_rollups SET sessions_sketch[:register] = GREATEST(sessions_sketch[:register], :rank) "
+                    "WHERE tenant_id = :tenant_id AND agent_id = :agent_id AND granularity = 'day' "
+                    "AND bucket = :bucket AND version = :version"
+                ),
+                {
+                    "register": register,
+                    "rank": rank,
+                    "tenant_id": tenant_id,
+                    "agent_id": agent_id,
+                    "bucket": day,
+                    "version": version,
+                },
+            )
+
+
+def _rollup_filters(tenant_id: str, agent_id: Optional[str], granularity: str) -> List[Any]:
+    filters = [UsageRollup.tenant_id == tenant_id, UsageRollup.granularity == granularity]
+    if agent_id:
+        filters.append(UsageRollup.agent_id == agent_id)
+    return filters
+
+
 def get_usage_metrics(tenant_id: str, agent_id: Optional[str] = None) -> Dict[str, int]:
-    since = datetime.utcnow() - timedelta(days=7)
-    with session_scope() as session:
-        base_filters = [ChatLog.tenant_id == tenant_id]
-        if agent_id:
-            base_filters.append(ChatLog.agent_id == agent_id)
-        user_requests = session.execute(
-            select(func.count())
-            .select_from(ChatLog)
-            .where(*base_filters, ChatLog.created_at >= since, ChatLog.role == "user")
-        ).scalar_one()
-        sessions = session.execute(
-            select(func.count(func.distinct(ChatLog.thread_id)))
-            .select_from(ChatLog)
-            .where(*base_filters, ChatLog.created_at >= since)
-        ).scalar_one()
+    """Usage over the last 7 UTC days (today included) and all time, read from the rollups.
+
+    ``sessions_7d`` is the number of distinct sessions, a HyperLogLog estimate merged
+    from the daily sketches (falling back to session-days when none were kept);
+    ``session_days_7d`` adds up each day's active sessions.
+    """
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    since = today - timedelta(days=6)
+    with read_session_scope() as session:
+        week = session.execute(
+            select(*[func.coalesce(func.sum(getattr(UsageRollup, name)), 0).label(name) for name in USAGE_COUNTERS])
+            .where(*_rollup_filters(tenant_id, agent_id, "day"), UsageRollup.bucket >= since)
+        ).one()
         total_sessions = session.execute(
-            select(func.count(func.distinct(ChatLog.thread_id)))
-            .select_from(ChatLog)
-            .where(*base_filters)
+            select(func.coalesce(func.sum(UsageRollup.new_sessions), 0)).where(
+                *_rollup_filters(tenant_id, agent_id, "all")
+            )
         ).scalar_one()
+        index = func.generate_series(1, SKETCH_REGISTERS).table_valued("value").render_derived()
+        registers = session.execute(
+            select(index.c.value, func.max(UsageRollup.sessions_sketch[index.c.value]))
+            .select_from(UsageRollup)
+            .join(index, literal(True))
+            .where(
+                *_rollup_filters(tenant_id, agent_id, "day"),
+                UsageRollup.bucket >= since,
+                UsageRollup.sessions_sketch.is_not(None),
+            )
+            .group_by(index.c.value)
+        ).all()
+    merged = [0] * SKETCH_REGISTERS
+    for register, rank in registers:
+        merged[register - 1] = int(rank or 0)
     return {
-        "requests_7d": int(user_requests or 0),
-        "sessions_7d": int(sessions or 0),
-        "total_sessions": int(total_sessions or 0),
+        "requests_7d": int(week.requests),
+        "sessions_7d": estimate_distinct(merged) if registers else int(week.sessions),
+        "session_days_7d": int(week.sessions),
+        "total_sessions": int(total_sessions),
+        "llm_calls_7d": int(week.llm_calls),
+        "prompt_tokens_7d": int(week.prompt_tokens),
+        "completion_tokens_7d": int(week.completion_tokens),
+        "total_tokens_7d": int(week.total_tokens),
+        "kb_queries_7d": int(week.kb_queries),
+        "submissions_7d": int(week.submissions),
+        "speculative_retrievals_used_7d": int(week.speculative_used),
+        "speculative_retrievals_wasted_7d": int(week.speculative_wasted),
     }
 
 
+def list_usage_rollups(
+    tenant_id: str,
+    agent_id: Optional[str],
+    granularity: str,
+    since: datetime,
+    until: Optional[datetime] = None,
+) -> List[Dict[str, Any]]:
+    """Rollup rows per bucket (summed over versions) for dashboards and billing, oldest first."""
+    if granularity not in USAGE_GRANULARITIES:
+        raise RuntimeError(f"granularity must be one of: {', '.join(USAGE_GRANULARITIES)}")
+    stmt = select(
+        UsageRollup.bucket, *[func.sum(getattr(UsageRollup, name)).label(name) for name in USAGE_COUNTERS]
+    ).where(*_rollup_filters(tenant_id, agent_id, granularity), UsageRollup.bucket >= since)
+    if until:
+        stmt = stmt.where(UsageRollup.bucket < until)
+    stmt = stmt.group_by(UsageRollup.bucket).order_by(UsageRollup.bucket)
+    with read_session_scope() as session:
+        return [
+            {"bucket": row.bucket.isoformat(), **{name: int(getattr(row, name)) for name in USAGE_COUNTERS}}
+            for row in session.execute(stmt)
+        ]
+
+
 def list_agents(tenant_id: str) -> List[Dict[str, Any]]:
+    published = (
+        exists()
+        .where(AgentVersion.tenant_id == AgentDraft.tenant_id, AgentVersion.agent_id == AgentDraft.agent_id)
+        .label("published")
+    )
+    stmt = (
+        select(AgentDraft.agent_id, AgentDraft.config, published, AgentActivity.last_activity)
+        .outerjoin(
+            AgentActivity,
+            (AgentActivity.tenant_id == AgentDraft.tenant_id) & (AgentActivity.agent_id == AgentDraft.agent_id),
+        )
+        .where(AgentDraft.tenant_id == tenant_id)
+    )
     with session_scope() as session:
-        drafts = session.execute(select(AgentDraft).where(AgentDraft.tenant_id == tenant_id)).scalars().all()
         results: List[Dict[str, Any]] = []
-        for draft in drafts:
-            latest = session.execute(
-                select(AgentVersion)
-                .where(AgentVersion.tenant_id == tenant_id, AgentVersion.agent_id == draft.agent_id)
-                .order_by(desc(AgentVersion.version))
-                .limit(1)
-            ).scalars().first()
-            last_log = session.execute(
-                select(ChatLog.created_at)
-                .where(ChatLog.tenant_id == tenant_id, ChatLog.agent_id == draft.agent_id)
-                .order_by(desc(ChatLog.created_at))
-                .limit(1)
-            ).scalars().first()
-            project = (draft.config or {}).get("project", {})
-            name = project.get("project_name") or draft.agent_id
+        for row in session.execute(stmt):
+            project = (row.config or {}).get("project", {})
+            name = project.get("project_name") or row.agent_id
             description = project.get("system_message") or ""
             results.append(
                 {
-                    "id": draft.agent_id,
+                    "id": row.agent_id,
                     "name": name,
                     "description": description,
-                    "status": "Active" if latest else "Draft",
+                    "status": "Active" if row.published else "Draft",
                     "model": "",
-                    "last_run": last_log.isoformat() if last_log else None,
+                    "last_run": row.last_activity.isoformat() if row.last_activity else None,
                     "updated_by": "system",
                 }
             )
@@ -229,6 +387,107 @@ def update_form_submission_delivery(
         found.delivery_result = result
 
 
+def _encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), row_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError) as exc:
+        raise RuntimeError("Invalid cursor.") from exc
+
+
+PAGE_MAX = 200
+
+
+def _keyset_page(
+    session: Session,
+    stmt,
+    created_at,
+    row_id,
+    limit: int,
+    cursor: Optional[str],
+    ascending: bool = False,
+) -> Tuple[List[Any], Optional[str]]:
+    """Run ``stmt`` (selecting one entity) for one page ordered by ``(created_at, row_id)``.
+
+    The cursor holds the key of the last row returned, so every page is an index
+    range scan from that key, however deep it is. Returns ``(rows, next_cursor)``.
+    """
+    limit = max(1, min(limit, PAGE_MAX))
+    key = tuple_(created_at, row_id)
+    if cursor:
+        after_created, after_id = _decode_cursor(cursor)
+        after = tuple_(after_created, after_id)
+        # The plain bound on created_at is redundant but, unlike the row comparison, lets partitions be pruned.
+        if ascending:
+            stmt = stmt.where(key > after, created_at >= after_created)
+        else:
+            stmt = stmt.where(key < after, created_at <= after_created)
+    if ascending:
+        stmt = stmt.order_by(created_at.asc(), row_id.asc())
+    else:
+        stmt = stmt.order_by(created_at.desc(), row_id.desc())
+    rows = session.execute(stmt.limit(limit + 1)).scalars().all()
+    if len(rows) <= limit:
+        return rows, None
+    last = rows[limit - 1]
+    return rows[:limit], _encode_cursor(getattr(last, created_at.key), getattr(last, row_id.key))
+
+
+def _submissions_stmt(
+    tenant_id: str,
+    agent_id: str,
+    form_id: Optional[str],
+    thread_id: Optional[str],
+    delivery_type: Optional[str],
+    start_date: Optional[str],
+    end_date: Optional[str],
+):
+    stmt = select(FormSubmission).where(
+        FormSubmission.tenant_id == tenant_id,
+        FormSubmission.agent_id == agent_id,
+    )
+    if form_id:
+        stmt = stmt.where(FormSubmission.form_id == form_id)
+    if thread_id:
+        stmt = stmt.where(FormSubmission.thread_id == thread_id)
+    if delivery_type:
+        stmt = stmt.where(FormSubmission.delivery_type == delivery_type)
+    try:
+        if start_date:
+            stmt = stmt.where(FormSubmission.created_at >= datetime.fromisoformat(start_date))
+        if end_date:
+            parsed_end = datetime.fromisoformat(end_date)
+            if len(end_date) == 10:
+                parsed_end = parsed_end + timedelta(days=1) - timedelta(seconds=1)
+            stmt = stmt.where(FormSubmission.created_at <= parsed_end)
+    except ValueError as exc:
+        raise RuntimeError("start_date and end_date must be ISO dates.") from exc
+    return stmt
+
+
+def _submission_dict(row: FormSubmission) -> Dict[str, Any]:
+    return {
+        "id": row.id,
+        "tenant_id": row.tenant_id,
+        "agent_id": row.agent_id,
+        "version": row.version,
+        "thread_id": row.thread_id,
+        "form_id": row.form_id,
+        "form_name": row.form_name,
+        "delivery_type": row.delivery_type,
+        "delivery_target": row.delivery_target,
+        "delivery_status": row.delivery_status,
+        "payload": row.payload,
+        "delivery_result": row.delivery_result,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+    }
+
+
 def list_form_submissions(
     tenant_id: str,
     agent_id: str,
@@ -238,49 +497,39 @@ def list_form_submissions(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     limit: int = 50,
-    offset: int = 0,
-) -> List[Dict[str, Any]]:
-    from datetime import datetime
-    from datetime import timedelta
+    cursor: Optional[str] = None,
+) -> Dict[str, Any]:
+    stmt = _submissions_stmt(tenant_id, agent_id, form_id, thread_id, delivery_type, start_date, end_date)
+    with read_session_scope() as session:
+        rows, next_cursor = _keyset_page(session, stmt, FormSubmission.created_at, FormSubmission.id, limit, cursor)
+        return {"items": [_submission_dict(row) for row in rows], "next_cursor": next_cursor}
 
-    with session_scope() as session:
-        stmt = select(FormSubmission).where(
-            FormSubmission.tenant_id == tenant_id,
-            FormSubmission.agent_id == agent_id,
-        )
-        if form_id:
-            stmt = stmt.where(FormSubmission.form_id == form_id)
-        if thread_id:
-            stmt = stmt.where(FormSubmission.thread_id == thread_id)
-        if delivery_type:
-            stmt = stmt.where(FormSubmission.delivery_type == delivery_type)
-        if start_date:
-            stmt = stmt.where(FormSubmission.created_at >= datetime.fromisoformat(start_date))
-        if end_date:
-            parsed_end = datetime.fromisoformat(end_date)
-            if len(end_date) == 10:
-                parsed_end = parsed_end + timedelta(days=1) - timedelta(seconds=1)
-            stmt = stmt.where(FormSubmission.created_at <= parsed_end)
-        stmt = stmt.order_by(desc(FormSubmission.created_at)).limit(limit).offset(offset)
-        rows = session.execute(stmt).scalars().all()
-        return [
-            {
-                "id": row.id,
-                "tenant_id": row.tenant_id,
-                "agent_id": row.agent_id,
-                "version": row.version,
-                "thread_id": row.thread_id,
-                "form_id": row.form_id,
-                "form_name": row.form_name,
-                "delivery_type": row.delivery_type,
-                "delivery_target": row.delivery_target,
-                "delivery_status": row.delivery_status,
-                "payload": row.payload,
-                "delivery_result": row.delivery_result,
-                "created_at": row.created_at.isoformat() if row.created_at else None,
-            }
-            for row in rows
-        ]
+
+def stream_form_submissions(
+    tenant_id: str,
+    agent_id: str,
+    form_id: Optional[str] = None,
+    thread_id: Optional[str] = None,
+    delivery_type: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    batch_size: int = 1000,
+) -> Iterator[Dict[str, Any]]:
+    """Every matching submission, newest first, read through a server-side cursor ``batch_size`` rows at a time.
+
+    Filters are validated before this returns, so errors surface before a response starts streaming.
+    """
+    stmt = _submissions_stmt(tenant_id, agent_id, form_id, thread_id, delivery_type, start_date, end_date)
+    stmt = stmt.order_by(FormSubmission.created_at.desc(), FormSubmission.id.desc())
+
+    def rows() -> Iterator[Dict[str, Any]]:
+        with read_session_scope() as session:
+            for row in session.execute(stmt.execution_options(yield_per=batch_size)).scalars():
+                yield _submission_dict(row)
+                # Rows already yielded are not needed again; keep the identity map from growing.
+                session.expunge(row)
+
+    return rows()
 
 
 def get_oauth_credential(tenant_id: str, agent_id: str, provider: str) -> Optional[Dict[str, Any]]:
@@ -294,25 +543,15 @@ def get_oauth_credential(tenant_id: str, agent_id: str, provider: str) -> Option
         return found.token if found else None
 
 
-def upsert_oauth_credential(tenant_id: str, agent_id: str, provider: str, token: Dict[str, Any]) -> None:
+def upsert_oauth_credential(tenant_id: str, agent_id: str, provider: str, token: Dict[str, Any]) -> int:
+    """Insert or replace the credential in one statement; returns its new row version."""
+    stmt = pg_insert(OAuthCredential).values(tenant_id=tenant_id, agent_id=agent_id, provider=provider, token=token)
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_oauth_credentials",
+        set_={"token": stmt.excluded.token, "updated_at": func.now(), "row_version": OAuthCredential.row_version + 1},
+    ).returning(OAuthCredential.row_version)
     with session_scope() as session:
-        stmt = select(OAuthCredential).where(
-            OAuthCredential.tenant_id == tenant_id,
-            OAuthCredential.agent_id == agent_id,
-            OAuthCredential.provider == provider,
-        )
-        found = session.execute(stmt).scalars().first()
-        if found:
-            found.token = token
-        else:
-            session.add(
-                OAuthCredential(
-                    tenant_id=tenant_id,
-                    agent_id=agent_id,
-                    provider=provider,
-                    token=token,
-                )
-            )
+        return session.execute(stmt).scalar_one()
 
 
 def delete_oauth_credential(tenant_id: str, agent_id: str, provider: str) -> None:
@@ -346,6 +585,47 @@ def log_chat(
                 state=state,
             )
         )
+        _touch_agent_activity(session, tenant_id, agent_id)
+        _touch_thread_summary(session, tenant_id, agent_id, version, thread_id, state)
+
+
+def _touch_agent_activity(session: Session, tenant_id: str, agent_id: str) -> None:
+    stmt = pg_insert(AgentActivity).values(tenant_id=tenant_id, agent_id=agent_id, last_activity=func.now())
+    session.execute(
+        stmt.on_conflict_do_update(
+            constraint="uq_agent_activity",
+            set_={"last_activity": stmt.excluded.last_activity},
+            # Skip the write when a concurrent turn already recorded a later time.
+            where=AgentActivity.last_activity < stmt.excluded.last_activity,
+        )
+    )
+
+
+def _touch_thread_summary(
+    session: Session,
+    tenant_id: str,
+    agent_id: str,
+    version: int,
+    thread_id: str,
+    state: Optional[Dict[str, Any]],
+) -> None:
+    values: Dict[str, Any] = {"version": version, "last_activity": func.now()}
+    if state is not None:
+        values["current_form_id"] = state.get("current_form_id")
+        values["completed"] = bool(state.get("completed"))
+    stmt = pg_insert(ThreadSummary).values(
+        tenant_id=tenant_id, agent_id=agent_id, thread_id=thread_id, message_count=1, **values
+    )
+    session.execute(
+        stmt.on_conflict_do_update(
+            constraint="uq_thread_summaries",
+            set_={**values, "message_count": ThreadSummary.message_count + 1},
+        )
+    )
+
+
+class ThreadStateConflict(RuntimeError):
+    """The thread state changed since it was read: another turn of the thread was stored first."""
 
 
 def upsert_thread_state(
@@ -354,27 +634,56 @@ def upsert_thread_state(
     version: int,
     thread_id: str,
     state: Dict[str, Any],
-) -> None:
+    expected_row_version: Optional[int] = None,
+) -> int:
+    """Store the thread state in one statement and return its new row version.
+
+    With ``expected_row_version`` (0 for a thread without stored state) the write only
+    applies if the stored row is still at that version; otherwise ThreadStateConflict
+    is raised and the stored state is left alone.
+    """
+    stmt = pg_insert(ThreadState).values(
+        tenant_id=tenant_id, agent_id=agent_id, version=version, thread_id=thread_id, state=state
+    )
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_thread_states",
+        set_={"state": stmt.excluded.state, "updated_at": func.now(), "row_version": ThreadState.row_version + 1},
+        where=ThreadState.row_version == expected_row_version if expected_row_version is not None else None,
+    ).returning(ThreadState.row_version)
     with session_scope() as session:
-        stmt = select(ThreadState).where(
-            ThreadState.tenant_id == tenant_id,
-            ThreadState.agent_id == agent_id,
-            ThreadState.version == version,
-            ThreadState.thread_id == thread_id,
-        )
-        found = session.execute(stmt).scalars().first()
-        if found:
-            found.state = state
-        else:
-            session.add(
-                ThreadState(
-                    tenant_id=tenant_id,
-                    agent_id=agent_id,
-                    version=version,
-                    thread_id=thread_id,
-                    state=state,
-                )
-            )
+        row_version = session.execute(stmt).scalar()
+    if row_version is None:
+        raise ThreadStateConflict(f"Thread {thread_id} was updated concurrently.")
+    return row_version
+
+
+def reserve_thread_state(
+    tenant_id: str,
+    agent_id: str,
+    version: int,
+    thread_id: str,
+    expected_row_version: int,
+) -> int:
+    """Claim the thread for one turn by bumping its row version, and return the new version.
+
+    Runs before the turn has any external effect (tool calls, submission delivery):
+    of two concurrent turns of a thread only the first gets the version, the other
+    gets ThreadStateConflict before doing anything. The winner stores its state
+    with the returned version as ``expected_row_version``.
+    """
+    stmt = pg_insert(ThreadState).values(
+        tenant_id=tenant_id, agent_id=agent_id, version=version, thread_id=thread_id, state={}
+    )
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_thread_states",
+        set_={"row_version": ThreadState.row_version + 1},
+        where=ThreadState.row_version == expected_row_version,
+    ).returning(ThreadState.row_version)
+    with session_scope() as session:
+        row_version = session.execute(stmt).scalar()
+    if row_version is None:
+        raise ThreadStateConflict(f"Thread {thread_id} is being updated concurrently.")
+    return row_version
 
 
 def get_thread_state(
@@ -383,139 +692,539 @@ def get_thread_state(
     version: int,
     thread_id: str,
 ) -> Optional[Dict[str, Any]]:
+    found = get_thread_state_entry(tenant_id, agent_id, version, thread_id)
+    return found["state"] if found else None
+
+
+def get_thread_state_entry(
+    tenant_id: str,
+    agent_id: str,
+    version: int,
+    thread_id: str,
+) -> Optional[Dict[str, Any]]:
+    """``{"state", "row_version"}`` of the thread, for a later conditional upsert_thread_state."""
     with session_scope() as session:
-        stmt = select(ThreadState).where(
+        stmt = select(ThreadState.state, ThreadState.row_version).where(
             ThreadState.tenant_id == tenant_id,
             ThreadState.agent_id == agent_id,
             ThreadState.version == version,
             ThreadState.thread_id == thread_id,
         )
-        found = session.execute(stmt).scalars().first()
-        return found.state if found else None
+        found = session.execute(stmt).first()
+        return {"state": found.state, "row_version": found.row_version} if found else None
+
+
+def list_threads(
+    tenant_id: str,
+    agent_id: str,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    completed: Optional[bool] = None,
+    form_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """One page of threads, most recently active first, with the cursor of the next page (None on the last)."""
+    stmt = select(ThreadSummary).where(ThreadSummary.tenant_id == tenant_id, ThreadSummary.agent_id == agent_id)
+    if completed is not None:
+        stmt = stmt.where(ThreadSummary.completed.is_(completed))
+    if form_id:
+        stmt = stmt.where(ThreadSummary.current_form_id == form_id)
+    if since:
+        stmt = stmt.where(ThreadSummary.last_activity >= since)
+    if until:
+        stmt = stmt.where(ThreadSummary.last_activity <= until)
+    with read_session_scope() as session:
+        rows, next_cursor = _keyset_page(session, stmt, ThreadSummary.last_activity, ThreadSummary.id, limit, cursor)
+        return {
+            "threads": [
+                {
+                    "thread_id": row.thread_id,
+                    "version": row.version,
+                    "last_activity": row.last_activity.isoformat(),
+                    "message_count": row.message_count,
+                    "current_form_id": row.current_form_id,
+                    "completed": row.completed,
+                }
+                for row in rows
+            ],
+            "next_cursor": next_cursor,
+        }
+
+
+def get_thread_messages(
+    tenant_id: str, agent_id: str, thread_id: str, limit: int = PAGE_MAX, cursor: Optional[str] = None
+) -> Dict[str, Any]:
+    """One page of a thread's messages, oldest first."""
+    stmt = select(ChatLog).where(
+        ChatLog.tenant_id == tenant_id,
+        ChatLog.agent_id == agent_id,
+        ChatLog.thread_id == thread_id,
+    )
+    with read_session_scope() as session:
+        rows, next_cursor = _keyset_page(session, stmt, ChatLog.created_at, ChatLog.id, limit, cursor, ascending=True)
+        return {
+            "messages": [
+                {
+                    "role": row.role,
+                    "content": row.content,
+                    "state": row.state,
+                    "created_at": row.created_at.isoformat() if row.created_at else None,
+                }
+                for row in rows
+            ],
+            "next_cursor": next_cursor,
+        }
+
 
+KB_QUANTIZATION_MODES = ("none", "halfvec", "binary")
 
-def list_threads(tenant_id: str, agent_id: str) -> List[Dict[str, Any]]:
+
+def _live_kb(tenant_id: str, kb_id: int):
+    return (
+        KnowledgeBase.tenant_id == tenant_id,
+        KnowledgeBase.id == kb_id,
+        KnowledgeBase.deleted_at.is_(None),
+    )
+
+
+def _require_live_kb(session: Session, tenant_id: str, kb_id: int, writing: bool = False) -> KnowledgeBase:
+    stmt = select(KnowledgeBase).where(*_live_kb(tenant_id, kb_id))
+    if writing:
+        # KEY SHARE lets writers run side by side but holds off a rebuild cutover until they commit.
+        stmt = stmt.with_for_update(read=True, key_share=True)
+    kb = session.execute(stmt).scalars().first()
+    if kb is None:
+        raise RuntimeError("Knowledge base not found.")
+    return kb
+
+
+def _embedding_spec(kb: Any) -> Tuple[Optional[str], Optional[int]]:
+    """(model, dimensions) to embed with; ``(None, None)`` means the global default model at native size."""
+    if not kb.embedding_model:
+        return None, None
+    return kb.embedding_model, kb.requested_dimensions
+
+
+def create_knowledge_base(
+    tenant_id: str,
+    name: str,
+    description: str,
+    provider: str,
+    quantization: str = "none",
+    embedding_model: Optional[str] = None,
+    embedding_dimensions: Optional[int] = None,
+) -> int:
     with session_scope() as session:
-        stmt = (
-            select(ChatLog.thread_id, ChatLog.created_at)
-            .where(ChatLog.tenant_id == tenant_id, ChatLog.agent_id == agent_id)
-            .order_by(desc(ChatLog.created_at))
+        kb = KnowledgeBase(
+            tenant_id=tenant_id,
+            name=name,
+            description=description,
+            provider=provider,
+            quantization=quantization,
+            embedding_model=embedding_model,
+            embedding_dimensions=embedding_dimensions,
+            requested_dimensions=embedding_dimensions,
         )
-        rows = session.execute(stmt).all()
-        seen = set()
-        results = []
-        for thread_id, created_at in rows:
-            if thread_id in seen:
-                continue
-            seen.add(thread_id)
-            results.append(
-                {"thread_id": thread_id, "last_activity": created_at.isoformat() if created_at else None}
+        session.add(kb)
+        session.flush()
+        return int(kb.id)
+
+
+def update_knowledge_base_settings(
+    tenant_id: str,
+    kb_id: int,
+    quantization: Optional[str] = None,
+    embedding_model: Optional[str] = None,
+    embedding_dimensions: Optional[int] = None,
+) -> bool:
+    values: Dict[str, Any] = {}
+    if quantization is not None:
+        # Queued until kb_index has built the new mode's index; choosing the current mode cancels a pending switch.
+        values["pending_quantization"] = case(
+            (KnowledgeBase.quantization == quantization, None), else_=quantization
+        )
+    if embedding_model is not None or embedding_dimensions is not None:
+        values["embedding_model"] = embedding_model
+        values["embedding_dimensions"] = embedding_dimensions
+        values["requested_dimensions"] = embedding_dimensions
+    with session_scope() as session:
+        if "embedding_model" in values:
+            has_documents = session.execute(
+                select(KnowledgeDocument.id)
+                .where(KnowledgeDocument.tenant_id == tenant_id, KnowledgeDocument.kb_id == kb_id)
+                .limit(1)
+            ).first()
+            if has_documents is not None:
+                raise RuntimeError(
+                    "The embedding model can only be changed on an empty knowledge base; rebuild it instead."
+                )
+        result = session.execute(
+            update(KnowledgeBase)
+            .where(*_live_kb(tenant_id, kb_id))
+            .values(**values, generation=KnowledgeBase.generation + 1)
+        )
+        return bool(result.rowcount)
+
+
+def _kb_index_prefix(kb_id: int) -> str:
+    return f"ix_knowledge_documents_kb{kb_id}_"
+
+
+def _kb_build_index_prefix(kb_id: int, build_id: int) -> str:
+    return f"{_kb_index_prefix(kb_id)}b{build_id}_"
+
+
+def _kb_index_name(kb_id: int, build_id: int, quantization: str, dims: int) -> str:
+    return f"{_kb_build_index_prefix(kb_id, build_id)}{quantization}_{dims}"
+
+
+def _kb_index_valid(conn, name: str) -> Optional[bool]:
+    """Whether index ``name`` is valid; None if it does not exist."""
+    return conn.execute(
+        text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"), {"name": name}
+    ).scalar()
+
+
+def ensure_kb_quantized_index(
+    tenant_id: str,
+    kb_id: int,
+    build_id: Optional[int] = None,
+    quantization: Optional[str] = None,
+    dims: Optional[int] = None,
+) -> Optional[str]:
+    """Build the KB's partial HNSW index over its compact representation, if configured.
+
+    The index covers ``binary_quantize(embedding)::bit(d)`` (Hamming) or
+    ``embedding::halfvec(d)`` (cosine) for one build of this KB only; full-precision
+    vectors stay in the table for rescoring. Build, mode and dimensions default to
+    the KB's active settings. Blocks for the whole build: call it from a background
+    job (``kb_index``, ``kb_rebuild``) holding ``kb_index_lock``, never from a request.
+    An invalid index left by an interrupted build is dropped and built again.
+    """
+    with session_scope() as session:
+        kb = session.execute(select(KnowledgeBase).where(*_live_kb(tenant_id, kb_id))).scalars().first()
+        if not kb:
+            return None
+        build_id = kb.active_build if build_id is None else build_id
+        quantization = quantization or kb.quantization
+        dims = dims or kb.embedding_dimensions
+        if quantization == "none" or not dims:
+            return None
+        dims = int(dims)
+    name = _kb_index_name(kb_id, build_id, quantization, dims)
+    if quantization == "binary":
+        expression = f"(binary_quantize(embedding)::bit({dims})) bit_hamming_ops"
+    else:
+        expression = f"(embedding::halfvec({dims})) halfvec_cosine_ops"
+    with get_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if _kb_index_valid(conn, name) is False:
+            conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"'))
+        conn.execute(
+            text(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON knowledge_documents "
+                f"USING hnsw ({expression}) WHERE kb_id = {int(kb_id)} AND build_id = {int(build_id)}"
             )
-        return results
+        )
+    return name
 
 
-def get_thread_messages(tenant_id: str, agent_id: str, thread_id: str) -> List[Dict[str, Any]]:
+@contextmanager
+def kb_index_lock(kb_id: int) -> Generator[bool, None, None]:
+    """Session advisory lock held while a KB's indexes are built or dropped; yields False if another worker holds it."""
+    key = func.hashtext(f"kb-index:{kb_id}")
+    with get_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        acquired = bool(conn.execute(select(func.pg_try_advisory_lock(key))).scalar())
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                conn.execute(select(func.pg_advisory_unlock(key)))
+
+
+def _drop_kb_indexes(prefix: str, keep: Optional[str] = None) -> List[str]:
     with session_scope() as session:
-        stmt = (
-            select(ChatLog.role, ChatLog.content, ChatLog.state, ChatLog.created_at)
-            .where(
-                ChatLog.tenant_id == tenant_id,
-                ChatLog.agent_id == agent_id,
-                ChatLog.thread_id == thread_id,
+        names = session.execute(
+            text("SELECT indexname FROM pg_indexes WHERE tablename = 'knowledge_documents' AND indexname LIKE :prefix"),
+            {"prefix": f"{prefix}%"},
+        ).scalars().all()
+    dropped = [name for name in names if name != keep]
+    with get_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for name in dropped:
+            conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"'))
+    return dropped
+
+
+def drop_kb_build_indexes(kb_id: int, build_id: int, keep: Optional[str] = None) -> List[str]:
+    """Drop the compact indexes of one build of a KB, except ``keep`` (the one its current mode uses)."""
+    return _drop_kb_indexes(_kb_build_index_prefix(kb_id, build_id), keep=keep)
+
+
+def apply_kb_quantization(tenant_id: str, kb_id: int, quantization: str) -> bool:
+    """Switch the KB to its pending ``quantization``, unless another change was requested meanwhile."""
+    with session_scope() as session:
+        result = session.execute(
+            update(KnowledgeBase)
+            .where(*_live_kb(tenant_id, kb_id), KnowledgeBase.pending_quantization == quantization)
+            .values(
+                quantization=quantization,
+                pending_quantization=None,
+                generation=KnowledgeBase.generation + 1,
             )
-            .order_by(ChatLog.created_at.asc())
         )
-        return [
-            {
-                "role": row.role,
-                "content": row.content,
-                "state": row.state,
-                "created_at": row.created_at.isoformat() if row.created_at else None,
-            }
-            for row in session.execute(stmt)
-        ]
+        return bool(result.rowcount)
 
 
-def create_knowledge_base(tenant_id: str, name: str, description: str, provider: str) -> int:
+def list_kb_index_jobs() -> List[Dict[str, Any]]:
+    """Live KBs that may need index work: a pending mode switch, or a quantized mode whose index may be missing."""
     with session_scope() as session:
-        kb = KnowledgeBase(tenant_id=tenant_id, name=name, description=description, provider=provider)
-        session.add(kb)
-        session.flush()
-        return int(kb.id)
+        rows = session.execute(
+            select(KnowledgeBase.tenant_id, KnowledgeBase.id).where(
+                KnowledgeBase.deleted_at.is_(None),
+                or_(KnowledgeBase.pending_quantization.is_not(None), KnowledgeBase.quantization != "none"),
+            )
+        ).all()
+    return [{"tenant_id": row.tenant_id, "kb_id": row.id} for row in rows]
+
+
+def get_kb_generation(tenant_id: str, kb_id: int) -> Optional[int]:
+    return get_kb_generations(tenant_id, [kb_id]).get(kb_id)
+
+
+def get_kb_generations(tenant_id: str, kb_ids: List[int]) -> Dict[int, int]:
+    """Generations of the live KBs among ``kb_ids`` (deleted or unknown ids are omitted)."""
+    return {kb_id: profile["generation"] for kb_id, profile in get_kb_profiles(tenant_id, kb_ids).items()}
+
+
+def get_kb_profiles(tenant_id: str, kb_ids: Optional[List[int]] = None) -> Dict[int, Dict[str, Any]]:
+    """Generation and embedding spec of each live KB among ``kb_ids`` (all of the tenant's when None)."""
+    if kb_ids is not None and not kb_ids:
+        return {}
+    with session_scope() as session:
+        stmt = select(
+            KnowledgeBase.id,
+            KnowledgeBase.generation,
+            KnowledgeBase.embedding_model,
+            KnowledgeBase.requested_dimensions,
+        ).where(KnowledgeBase.tenant_id == tenant_id, KnowledgeBase.deleted_at.is_(None))
+        if kb_ids is not None:
+            stmt = stmt.where(KnowledgeBase.id.in_(kb_ids))
+        rows = session.execute(stmt)
+        return {
+            int(row.id): {"generation": int(row.generation), "embedding": _embedding_spec(row)}
+            for row in rows
+        }
+
+
+def _bump_kb_generation(session: Session, kb_id: int) -> int:
+    # Runs in the mutating transaction, so readers never pair new documents with an old generation.
+    return session.execute(
+        update(KnowledgeBase)
+        .where(KnowledgeBase.id == kb_id)
+        .values(generation=KnowledgeBase.generation + 1)
+        .returning(KnowledgeBase.generation)
+    ).scalar_one()
+
+
+def _kb_dict(kb: KnowledgeBase) -> Dict[str, Any]:
+    return {
+        "id": kb.id,
+        "name": kb.name,
+        "description": kb.description,
+        "provider": kb.provider,
+        "quantization": kb.quantization,
+        "pending_quantization": kb.pending_quantization,
+        "embedding_model": kb.embedding_model,
+        "embedding_dimensions": kb.embedding_dimensions,
+        "requested_dimensions": kb.requested_dimensions,
+        "chunk_size": kb.chunk_size,
+        "chunk_overlap": kb.chunk_overlap,
+        "generation": kb.generation,
+        "active_build": kb.active_build,
+        "created_at": kb.created_at.isoformat() if kb.created_at else None,
+    }
 
 
 def list_knowledge_bases(tenant_id: str) -> List[Dict[str, Any]]:
     with session_scope() as session:
-        stmt = select(KnowledgeBase).where(KnowledgeBase.tenant_id == tenant_id).order_by(KnowledgeBase.created_at.desc())
-        return [
-            {
-                "id": kb.id,
-                "name": kb.name,
-                "description": kb.description,
-                "provider": kb.provider,
-                "created_at": kb.created_at.isoformat() if kb.created_at else None,
-            }
-            for kb in session.execute(stmt).scalars().all()
-        ]
+        stmt = (
+            select(KnowledgeBase)
+            .where(KnowledgeBase.tenant_id == tenant_id, KnowledgeBase.deleted_at.is_(None))
+            .order_by(KnowledgeBase.created_at.desc())
+        )
+        return [_kb_dict(kb) for kb in session.execute(stmt).scalars().all()]
 
 
-def delete_knowledge_base(tenant_id: str, kb_id: int) -> None:
+def get_knowledge_base(tenant_id: str, kb_id: int) -> Optional[Dict[str, Any]]:
     with session_scope() as session:
-        session.execute(
-            delete(KnowledgeDocument).where(
-                KnowledgeDocument.tenant_id == tenant_id,
-                KnowledgeDocument.kb_id == kb_id,
+        kb = session.execute(select(KnowledgeBase).where(*_live_kb(tenant_id, kb_id))).scalars().first()
+        return _kb_dict(kb) if kb else None
+
+
+def delete_knowledge_base(tenant_id: str, kb_id: int) -> bool:
+    """Mark the KB deleted so it disappears from reads; rows are removed by ``purge_kb_documents_batch``."""
+    with session_scope() as session:
+        total = (
+            select(func.coalesce(func.sum(KbFile.chunk_count), 0))
+            .where(KbFile.tenant_id == tenant_id, KbFile.kb_id == kb_id)
+            .scalar_subquery()
+        )
+        result = session.execute(
+            update(KnowledgeBase)
+            .where(*_live_kb(tenant_id, kb_id))
+            .values(
+                deleted_at=func.now(),
+                purge_total=total,
+                purged=0,
+                generation=KnowledgeBase.generation + 1,
             )
         )
+        return bool(result.rowcount)
+
+
+def list_deleted_knowledge_bases() -> List[Dict[str, Any]]:
+    with session_scope() as session:
+        stmt = select(KnowledgeBase.tenant_id, KnowledgeBase.id).where(KnowledgeBase.deleted_at.is_not(None))
+        return [{"tenant_id": row.tenant_id, "kb_id": row.id} for row in session.execute(stmt)]
+
+
+def get_kb_deletion_status(tenant_id: str, kb_id: int) -> Optional[Dict[str, Any]]:
+    with session_scope() as session:
+        kb = session.execute(
+            select(KnowledgeBase).where(KnowledgeBase.tenant_id == tenant_id, KnowledgeBase.id == kb_id)
+        ).scalars().first()
+        if not kb:
+            return None
+        if kb.deleted_at is None:
+            return {"kb_id": kb.id, "status": "active"}
+        return {
+            "kb_id": kb.id,
+            "status": "deleting",
+            "deleted_at": kb.deleted_at.isoformat(),
+            "purged": kb.purged,
+            "total": max(kb.purge_total, kb.purged),
+        }
+
+
+def purge_kb_documents_batch(tenant_id: str, kb_id: int, batch_size: int, build_id: Optional[int] = None) -> int:
+    """Delete up to ``batch_size`` chunks of a deleted KB (or of one retired build) in a short transaction.
+
+    Returns rows removed.
+    """
+    with session_scope() as session:
+        filters = [KnowledgeDocument.tenant_id == tenant_id, KnowledgeDocument.kb_id == kb_id]
+        if build_id is not None:
+            filters.append(KnowledgeDocument.build_id == build_id)
+        ids = (
+            select(KnowledgeDocument.id)
+            .where(*filters)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        removed = session.execute(delete(KnowledgeDocument).where(KnowledgeDocument.id.in_(ids))).rowcount or 0
+        if removed and build_id is None:
+            session.execute(
+                update(KnowledgeBase)
+                .where(KnowledgeBase.id == kb_id, KnowledgeBase.deleted_at.is_not(None))
+                .values(purged=KnowledgeBase.purged + removed)
+            )
+        return removed
+
+
+def finish_kb_purge(tenant_id: str, kb_id: int, vacuum: bool = False) -> None:
+    """Drop the emptied KB's catalogue, partial indexes and row; ``vacuum`` also vacuums the whole chunk table."""
+    with session_scope() as session:
+        remaining = session.execute(
+            select(KnowledgeDocument.id)
+            .where(KnowledgeDocument.tenant_id == tenant_id, KnowledgeDocument.kb_id == kb_id)
+            .limit(1)
+        ).first()
+        if remaining is not None:
+            return
+        session.execute(delete(KbFile).where(KbFile.tenant_id == tenant_id, KbFile.kb_id == kb_id))
+        session.execute(delete(KbBuild).where(KbBuild.tenant_id == tenant_id, KbBuild.kb_id == kb_id))
         session.execute(
             delete(KnowledgeBase).where(
                 KnowledgeBase.tenant_id == tenant_id,
                 KnowledgeBase.id == kb_id,
+                KnowledgeBase.deleted_at.is_not(None),
             )
         )
+        index_names = session.execute(
+            text("SELECT indexname FROM pg_indexes WHERE tablename = 'knowledge_documents' AND indexname LIKE :prefix"),
+            {"prefix": f"{_kb_index_prefix(kb_id)}%"},
+        ).scalars().all()
+    with get_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for name in index_names:
+            conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"'))
+        if vacuum:
+            conn.execute(text("VACUUM (ANALYZE) knowledge_documents"))
 
 
 def list_kb_files(tenant_id: str, kb_id: int) -> List[Dict[str, Any]]:
     with session_scope() as session:
-        stmt = select(KnowledgeDocument.doc_metadata, KnowledgeDocument.created_at).where(
-            KnowledgeDocument.tenant_id == tenant_id,
-            KnowledgeDocument.kb_id == kb_id,
+        stmt = (
+            select(KbFile)
+            .join(KnowledgeBase, KnowledgeBase.id == KbFile.kb_id)
+            .where(KbFile.tenant_id == tenant_id, KbFile.kb_id == kb_id, KnowledgeBase.deleted_at.is_(None))
+            .order_by(KbFile.indexed_at.desc(), KbFile.id.desc())
         )
-        files: Dict[str, Dict[str, Any]] = {}
-        for row in session.execute(stmt):
-            metadata = row.doc_metadata or {}
-            filename = metadata.get("filename") or "manual_entry"
-            entry = files.setdefault(filename, {"filename": filename, "chunks": 0, "last_indexed_at": None})
-            entry["chunks"] += 1
-            created_at = row.created_at.isoformat() if row.created_at else None
-            if created_at and (entry["last_indexed_at"] is None or created_at > entry["last_indexed_at"]):
-                entry["last_indexed_at"] = created_at
-        return sorted(files.values(), key=lambda item: item["last_indexed_at"] or "", reverse=True)
+        return [
+            {
+                "filename": item.filename,
+                "chunks": item.chunk_count,
+                "bytes": item.byte_size,
+                "content_hash": item.content_hash,
+                "last_indexed_at": item.indexed_at.isoformat() if item.indexed_at else None,
+            }
+            for item in session.execute(stmt).scalars().all()
+        ]
 
 
-def _kb_filename_clause(filename: str):
-    if filename == "manual_entry":
-        return or_(
-            KnowledgeDocument.doc_metadata.is_(None),
-            KnowledgeDocument.doc_metadata["filename"].astext.is_(None),
+def _kb_file_id(session: Session, tenant_id: str, kb_id: int, filename: str) -> Optional[int]:
+    return session.execute(
+        select(KbFile.id)
+        .join(KnowledgeBase, KnowledgeBase.id == KbFile.kb_id)
+        .where(
+            KbFile.tenant_id == tenant_id,
+            KbFile.kb_id == kb_id,
+            KbFile.filename == filename,
+            KnowledgeBase.deleted_at.is_(None),
         )
-    return KnowledgeDocument.doc_metadata["filename"].astext == filename
+    ).scalar_one_or_none()
+
+
+def _active_build(kb_id: int):
+    return select(KnowledgeBase.active_build).where(KnowledgeBase.id == kb_id).scalar_subquery()
+
+
+def _ensure_kb_file(session: Session, tenant_id: str, kb_id: int, filename: str) -> int:
+    stmt = (
+        pg_insert(KbFile)
+        .values(tenant_id=tenant_id, kb_id=kb_id, filename=filename, chunk_count=0, byte_size=0)
+        .on_conflict_do_update(constraint="uq_kb_files", set_={"filename": filename})
+        .returning(KbFile.id)
+    )
+    return int(session.execute(stmt).scalar_one())
 
 
 def delete_kb_file(tenant_id: str, kb_id: int, filename: str) -> int:
     with session_scope() as session:
-        result = session.execute(
-            delete(KnowledgeDocument).where(
-                KnowledgeDocument.tenant_id == tenant_id,
-                KnowledgeDocument.kb_id == kb_id,
-                _kb_filename_clause(filename),
-            )
-        )
+        file_id = _kb_file_id(session, tenant_id, kb_id, filename)
+        if file_id is None:
+            return 0
+        result = session.execute(delete(KnowledgeDocument).where(KnowledgeDocument.file_id == file_id))
+        session.execute(delete(KbFile).where(KbFile.id == file_id))
+        _bump_kb_generation(session, kb_id)
         return result.rowcount or 0
 
 
 def list_kb_file_chunks(tenant_id: str, kb_id: int, filename: str, limit: int = 50) -> List[Dict[str, Any]]:
     with session_scope() as session:
+        file_id = _kb_file_id(session, tenant_id, kb_id, filename)
+        if file_id is None:
+            return []
         stmt = (
             select(
                 KnowledgeDocument.id,
@@ -523,11 +1232,7 @@ def list_kb_file_chunks(tenant_id: str, kb_id: int, filename: str, limit: int =
                 KnowledgeDocument.doc_metadata,
                 KnowledgeDocument.created_at,
             )
-            .where(
-                KnowledgeDocument.tenant_id == tenant_id,
-                KnowledgeDocument.kb_id == kb_id,
-                _kb_filename_clause(filename),
-            )
+            .where(KnowledgeDocument.file_id == file_id, KnowledgeDocument.build_id == _active_build(kb_id))
             .order_by(KnowledgeDocument.id.asc())
             .limit(limit)
         )
@@ -539,6 +1244,8 @@ def list_kb_file_chunks(tenant_id: str, kb_id: int, filename: str, limit: int =
                     "id": row.id,
                     "content": row.content,
                     "chunk_index": metadata.get("chunk_index"),
+                    "page_start": metadata.get("page_start"),
+                    "page_end": metadata.get("page_end"),
                     "created_at": row.created_at.isoformat() if row.created_at else None,
                 }
             )
@@ -553,42 +1260,644 @@ def add_kb_document(
     metadata: Optional[Dict[str, Any]] = None,
 ) -> int:
     with session_scope() as session:
+        kb = _require_live_kb(session, tenant_id, kb_id, writing=True)
+        file_id = _ensure_kb_file(session, tenant_id, kb_id, (metadata or {}).get("filename") or "manual_entry")
         doc = KnowledgeDocument(
             tenant_id=tenant_id,
             kb_id=kb_id,
+            file_id=file_id,
+            build_id=kb.active_build,
             content=content,
             embedding=embedding,
             doc_metadata=metadata,
+            content_hash=content_hash(content),
         )
         session.add(doc)
         session.flush()
+        session.execute(
+            update(KbFile)
+            .where(KbFile.id == file_id)
+            .values(
+                chunk_count=KbFile.chunk_count + 1,
+                byte_size=KbFile.byte_size + len(content.encode("utf-8")),
+                generation=_bump_kb_generation(session, kb_id),
+                indexed_at=func.now(),
+            )
+        )
         return int(doc.id)
 
 
-def search_kb_documents(tenant_id: str, kb_id: int, embedding: List[float], limit: int = 5) -> List[Dict[str, Any]]:
+def _kb_near_duplicate_stmt(
+    tenant_id: str,
+    kb_id: int,
+    build_id: Optional[int],
+    file_id: Optional[int],
+    keys: List[int],
+):
+    return select(
+        KnowledgeDocument.id,
+        KnowledgeDocument.content_hash,
+        KnowledgeDocument.minhash,
+        KnowledgeDocument.lsh_bands,
+    ).where(
+        KnowledgeDocument.tenant_id == tenant_id,
+        KnowledgeDocument.kb_id == kb_id,
+        KnowledgeDocument.build_id == build_id,
+        KnowledgeDocument.lsh_bands.overlap(sorted(set(keys))),
+        KnowledgeDocument.file_id.is_distinct_from(file_id),
+    )
+
+
+class KbFilePlan:
+    """Snapshot of a file's stored chunks, read without holding locks, to decide what an upload must embed.
+
+    Embedding runs against this snapshot outside any transaction; ``kb_file_sync``
+    then diffs the embedded chunks against the rows current under its lock, so
+    the lock is only held for the writes.
+    """
+
+    def __init__(self, tenant_id: str, kb_id: int, filename: str) -> None:
+        self.tenant_id = tenant_id
+        self.kb_id = kb_id
+        with session_scope() as session:
+            kb = _require_live_kb(session, tenant_id, kb_id)
+            self.embedding_model, self.embedding_dimensions = _embedding_spec(kb)
+            self.chunk_size, self.chunk_overlap = kb.chunk_size, kb.chunk_overlap
+            self.build_id = kb.active_build
+            self.file_id = _kb_file_id(session, tenant_id, kb_id, filename)
+            hashes = []
+            if self.file_id is not None:
+                hashes = session.execute(
+                    select(KnowledgeDocument.content_hash).where(
+                        KnowledgeDocument.file_id == self.file_id, KnowledgeDocument.build_id == self.build_id
+                    )
+                ).scalars()
+            self._stored = Counter(chunk_hash or "" for chunk_hash in hashes)
+
+    def claim(self, chunk_hash: str) -> bool:
+        """Whether a stored chunk with this content hash can be reused (each stored chunk is claimed once)."""
+        if self._stored[chunk_hash] <= 0:
+            return False
+        self._stored[chunk_hash] -= 1
+        return True
+
+    def near_duplicate_candidates(self, band_keys: List[int]) -> List[Dict[str, Any]]:
+        """Chunks from other files in the KB sharing at least one LSH band with ``band_keys``."""
+        if not band_keys:
+            return []
+        stmt = _kb_near_duplicate_stmt(self.tenant_id, self.kb_id, self.build_id, self.file_id, band_keys)
+        with session_scope() as session:
+            return [
+                {"id": row.id, "content_hash": row.content_hash, "minhash": row.minhash, "lsh_bands": row.lsh_bands}
+                for row in session.execute(stmt)
+            ]
+
+
+class KbFileSync:
+    """Diffs a re-uploaded file's chunks against the stored ones inside one transaction.
+
+    Chunks whose content hash already exists are kept (only their metadata is
+    refreshed), new chunks are inserted, and chunks missing from the new upload
+    are deleted when the sync finishes.
+    """
+
+    _FLUSH_SIZE = 500
+
+    def __init__(self, session: Session, tenant_id: str, kb_id: int, filename: str) -> None:
+        self.session = session
+        self.tenant_id = tenant_id
+        self.kb_id = kb_id
+        self.filename = filename
+        kb = _require_live_kb(session, tenant_id, kb_id, writing=True)
+        self.embedding_model, self.embedding_dimensions = _embedding_spec(kb)
+        self.chunk_size, self.chunk_overlap = kb.chunk_size, kb.chunk_overlap
+        self.build_id = kb.active_build
+        self.file_id = _ensure_kb_file(session, tenant_id, kb_id, filename)
+        self.byte_size: Optional[int] = None
+        self.file_hash: Optional[str] = None
+        rows = session.execute(
+            select(KnowledgeDocument.id, KnowledgeDocument.content_hash, KnowledgeDocument.file_version)
+            .where(KnowledgeDocument.file_id == self.file_id, KnowledgeDocument.build_id == self.build_id)
+            .order_by(KnowledgeDocument.id.asc())
+        ).all()
+        self._unclaimed: Dict[str, List[int]] = {}
+        for row in rows:
+            self._unclaimed.setdefault(row.content_hash or "", []).append(row.id)
+        self.version = max((row.file_version or 0 for row in rows), default=0) + 1
+        self._updates: List[Dict[str, Any]] = []
+        self._dims_recorded = False
+        self.added = 0
+        self.reused = 0
+        self.skipped = 0
+        self.deleted = 0
+
+    def claim(self, chunk_hash: str) -> Optional[int]:
+        ids = self._unclaimed.get(chunk_hash)
+        if not ids:
+            return None
+        return ids.pop(0)
+
+    def keep(self, doc_id: int, metadata: Dict[str, Any]) -> None:
+        self._updates.append({"id": doc_id, "doc_metadata": metadata, "file_version": self.version})
+        self.reused += 1
+        if len(self._updates) >= self._FLUSH_SIZE:
+            self._flush_updates()
+
+    def add(self, documents: List[Dict[str, Any]]) -> None:
+        dims = next((len(doc["embedding"]) for doc in documents if doc.get("embedding")), None)
+        if dims and not self._dims_recorded:
+            self.session.execute(
+                update(KnowledgeBase)
+                .where(KnowledgeBase.id == self.kb_id, KnowledgeBase.embedding_dimensions.is_(None))
+                .values(embedding_dimensions=dims)
+            )
+            self._dims_recorded = True
+        self.session.add_all(
+            [
+                KnowledgeDocument(
+                    tenant_id=self.tenant_id,
+                    kb_id=self.kb_id,
+                    file_id=self.file_id,
+                    build_id=self.build_id,
+                    content=doc["content"],
+                    embedding=doc.get("embedding"),
+                    doc_metadata=doc.get("metadata"),
+                    content_hash=doc.get("content_hash") or content_hash(doc["content"]),
+                    file_version=self.version,
+                    minhash=doc.get("minhash"),
+                    lsh_bands=doc.get("lsh_bands"),
+                )
+                for doc in documents
+            ]
+        )
+        self.session.flush()
+        self.added += len(documents)
+
+    def skip(self) -> None:
+        """Record an extracted chunk that is intentionally not stored (e.g. a dropped duplicate)."""
+        self.skipped += 1
+
+    def finish(self) -> None:
+        self._flush_updates()
+        if not self.added and not self.reused and not self.skipped:
+            # Nothing extracted: leave the previous version in place.
+            if not self._unclaimed:
+                self.session.execute(delete(KbFile).where(KbFile.id == self.file_id))
+            return
+        stale = [doc_id for ids in self._unclaimed.values() for doc_id in ids]
+        for start in range(0, len(stale), self._FLUSH_SIZE):
+            batch = stale[start : start + self._FLUSH_SIZE]
+            self.session.execute(delete(KnowledgeDocument).where(KnowledgeDocument.id.in_(batch)))
+        self.deleted = len(stale)
+        values: Dict[str, Any] = {"chunk_count": self.added + self.reused, "indexed_at": func.now()}
+        if self.byte_size is not None:
+            values["byte_size"] = self.byte_size
+        if self.file_hash is not None:
+            values["content_hash"] = self.file_hash
+        if self.added or self.reused or self.deleted:
+            values["generation"] = _bump_kb_generation(self.session, self.kb_id)
+        self.session.execute(update(KbFile).where(KbFile.id == self.file_id).values(**values))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "chunks": self.added + self.reused + self.skipped,
+            "indexed": self.added + self.reused,
+            "added": self.added,
+            "reused": self.reused,
+            "deleted": self.deleted,
+            "version": self.version,
+        }
+
+    def _flush_updates(self) -> None:
+        if self._updates:
+            self.session.execute(update(KnowledgeDocument), self._updates)
+            self._updates = []
+
+
+@contextmanager
+def kb_file_sync(
+    tenant_id: str,
+    kb_id: int,
+    filename: str,
+    byte_size: Optional[int] = None,
+    file_hash: Optional[str] = None,
+    plan: Optional[KbFilePlan] = None,
+) -> Generator[KbFileSync, None, None]:
+    """Transaction that writes one file's chunks; keep it to the writes (embed against a ``KbFilePlan`` first)."""
     with session_scope() as session:
-        stmt = (
+        # Serialise concurrent uploads of the same file so both do not diff against the same snapshot.
+        session.execute(
+            select(func.pg_advisory_xact_lock(func.hashtext(f"kb:{tenant_id}:{kb_id}:{filename}")))
+        )
+        sync = KbFileSync(session, tenant_id, kb_id, filename)
+        if plan is not None and (
+            (sync.build_id, sync.embedding_model) != (plan.build_id, plan.embedding_model)
+            or plan.embedding_dimensions not in (None, sync.embedding_dimensions)
+        ):
+            raise RuntimeError(f"Knowledge base was rebuilt while {filename} was being embedded; upload it again.")
+        sync.byte_size, sync.file_hash = byte_size, file_hash
+        yield sync
+        sync.finish()
+
+
+def _kb_search_stmt(
+    tenant_id: str,
+    kb_id: int,
+    build_id: int,
+    quantization: str,
+    dims: Optional[int],
+    embedding: List[float],
+    limit: int,
+):
+    filters = [
+        KnowledgeDocument.tenant_id == tenant_id,
+        KnowledgeDocument.kb_id == kb_id,
+        KnowledgeDocument.build_id == build_id,
+        KnowledgeDocument.embedding.is_not(None),
+    ]
+    if quantization == "none" or not dims or dims != len(embedding):
+        return (
             select(
                 KnowledgeDocument.id,
                 KnowledgeDocument.content,
                 KnowledgeDocument.doc_metadata,
                 KnowledgeDocument.embedding.cosine_distance(embedding).label("distance"),
             )
-            .where(KnowledgeDocument.tenant_id == tenant_id, KnowledgeDocument.kb_id == kb_id)
+            .where(*filters)
             .order_by("distance")
             .limit(limit)
         )
+
+    # Inline kb_id and build_id so the planner can match the build's partial index even under generic plans.
+    filters[1] = KnowledgeDocument.kb_id == literal_column(str(int(kb_id)))
+    filters[2] = KnowledgeDocument.build_id == literal_column(str(int(build_id)))
+    query = literal(embedding, Vector())
+    if quantization == "binary":
+        prefilter = cast(func.binary_quantize(KnowledgeDocument.embedding), BIT(dims)).hamming_distance(
+            cast(func.binary_quantize(query), BIT(dims))
+        )
+    else:
+        prefilter = cast(KnowledgeDocument.embedding, HALFVEC(dims)).cosine_distance(cast(query, HALFVEC(dims)))
+    shortlist = (
+        select(
+            KnowledgeDocument.id,
+            KnowledgeDocument.content,
+            KnowledgeDocument.doc_metadata,
+            KnowledgeDocument.embedding,
+        )
+        .where(*filters)
+        .order_by(prefilter)
+        .limit(limit * _kb_rescore_factor())
+        .subquery()
+    )
+    # Rescore the compact-index shortlist with the full-precision vectors.
+    return (
+        select(
+            shortlist.c.id,
+            shortlist.c.content,
+            shortlist.c.doc_metadata,
+            shortlist.c.embedding.cosine_distance(embedding).label("distance"),
+        )
+        .order_by("distance")
+        .limit(limit)
+    )
+
+
+def _kb_rescore_factor() -> int:
+    return max(1, int(os.getenv("KB_RESCORE_FACTOR", "4")))
+
+
+def _set_ef_search(session: Session, limit: int) -> None:
+    ef_search = max(40, limit * _kb_rescore_factor())
+    session.execute(text(f"SET LOCAL hnsw.ef_search = {ef_search}"))
+
+
+def search_kb_documents(tenant_id: str, kb_id: int, embedding: List[float], limit: int = 5) -> List[Dict[str, Any]]:
+    return search_kb_documents_federated(tenant_id, {kb_id: 1.0}, {kb_id: embedding}, limit=limit)
+
+
+def search_kb_documents_federated(
+    tenant_id: str,
+    kb_weights: Dict[int, float],
+    embeddings: Dict[int, List[float]],
+    limit: int = 5,
+) -> List[Dict[str, Any]]:
+    """Global top-k across several KBs in one statement.
+
+    ``embeddings`` holds the query embedded with each KB's own model. Each KB
+    contributes its own top-``limit`` (using its quantized index when set) as one
+    branch of a UNION ALL; rows are ranked by ``(1 - distance) * weight``.
+    """
+    kb_weights = {kb_id: weight for kb_id, weight in kb_weights.items() if kb_id in embeddings}
+    if not kb_weights:
+        return []
+    with session_scope() as session:
+        kbs = session.execute(
+            select(
+                KnowledgeBase.id,
+                KnowledgeBase.active_build,
+                KnowledgeBase.quantization,
+                KnowledgeBase.embedding_dimensions,
+            ).where(
+                KnowledgeBase.tenant_id == tenant_id,
+                KnowledgeBase.id.in_(list(kb_weights)),
+                KnowledgeBase.deleted_at.is_(None),
+            )
+        ).all()
+        if not kbs:
+            return []
+        if any(kb.quantization != "none" for kb in kbs):
+            _set_ef_search(session, limit)
+        branches = []
+        for kb in kbs:
+            ranked = _kb_search_stmt(
+                tenant_id, kb.id, kb.active_build, kb.quantization, kb.embedding_dimensions, embeddings[kb.id], limit
+            ).subquery()
+            branches.append(
+                select(
+                    ranked.c.id,
+                    ranked.c.content,
+                    ranked.c.doc_metadata,
+                    ranked.c.distance,
+                    literal_column(str(int(kb.id))).label("kb_id"),
+                    ((1 - ranked.c.distance) * float(kb_weights[kb.id])).label("score"),
+                )
+            )
+        merged = branches[0].subquery() if len(branches) == 1 else union_all(*branches).subquery()
+        stmt = select(merged).order_by(merged.c.score.desc()).limit(limit)
         return [
             {
                 "id": row.id,
+                "kb_id": row.kb_id,
                 "content": row.content,
                 "metadata": row.doc_metadata,
                 "distance": float(row.distance) if row.distance is not None else None,
+                "score": float(row.score) if row.score is not None else None,
+            }
+            for row in session.execute(stmt)
+        ]
+
+
+KB_BUILD_SETTINGS = ("chunk_size", "chunk_overlap", "embedding_model", "embedding_dimensions", "quantization")
+KB_BUILD_RUNNING = ("building", "validating")
+
+
+def _kb_build_dict(build: KbBuild) -> Dict[str, Any]:
+    return {
+        "id": build.id,
+        "kb_id": build.kb_id,
+        "source_build": build.source_build,
+        "status": build.status,
+        "settings": build.settings,
+        "progress": build.progress or {},
+        "validation": build.validation,
+        "error": build.error,
+        "created_at": build.created_at.isoformat() if build.created_at else None,
+        "finished_at": build.finished_at.isoformat() if build.finished_at else None,
+    }
+
+
+def create_kb_build(tenant_id: str, kb_id: int, settings: Dict[str, Any]) -> Dict[str, Any]:
+    """Register a shadow build of the KB using its current settings overridden by ``settings``."""
+    with session_scope() as session:
+        kb = session.execute(
+            select(KnowledgeBase).where(*_live_kb(tenant_id, kb_id)).with_for_update(key_share=True)
+        ).scalars().first()
+        if kb is None:
+            raise RuntimeError("Knowledge base not found.")
+        running = session.execute(
+            select(KbBuild.id).where(KbBuild.kb_id == kb_id, KbBuild.status.in_(KB_BUILD_RUNNING))
+        ).first()
+        if running is not None:
+            raise RuntimeError("A rebuild of this knowledge base is already running.")
+        resolved = {key: getattr(kb, key) for key in KB_BUILD_SETTINGS}
+        # A build's embedding_dimensions is what it asks the provider for, not the size the KB happens to store.
+        resolved["embedding_dimensions"] = kb.requested_dimensions
+        resolved.update({key: value for key, value in settings.items() if key in KB_BUILD_SETTINGS})
+        if resolved["chunk_size"] < 100 or not 0 <= resolved["chunk_overlap"] < resolved["chunk_size"]:
+            raise RuntimeError("chunk_size must be at least 100 and chunk_overlap between 0 and chunk_size.")
+        build = KbBuild(
+            tenant_id=tenant_id,
+            kb_id=kb_id,
+            source_build=kb.active_build,
+            status="building",
+            settings=resolved,
+            progress={},
+        )
+        session.add(build)
+        session.flush()
+        session.refresh(build)
+        return _kb_build_dict(build)
+
+
+@contextmanager
+def kb_build_lock(build_id: int) -> Generator[bool, None, None]:
+    """Session advisory lock held while a build runs; yields False if another worker already runs it."""
+    key = func.hashtext(f"kb-build:{build_id}")
+    with get_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        acquired = bool(conn.execute(select(func.pg_try_advisory_lock(key))).scalar())
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                conn.execute(select(func.pg_advisory_unlock(key)))
+
+
+def get_kb_build(tenant_id: str, build_id: int) -> Optional[Dict[str, Any]]:
+    with session_scope() as session:
+        build = session.execute(
+            select(KbBuild).where(KbBuild.tenant_id == tenant_id, KbBuild.id == build_id)
+        ).scalars().first()
+        return _kb_build_dict(build) if build else None
+
+
+def list_kb_builds(tenant_id: str, kb_id: int, limit: int = 20) -> List[Dict[str, Any]]:
+    with session_scope() as session:
+        stmt = (
+            select(KbBuild)
+            .where(KbBuild.tenant_id == tenant_id, KbBuild.kb_id == kb_id)
+            .order_by(KbBuild.id.desc())
+            .limit(limit)
+        )
+        return [_kb_build_dict(build) for build in session.execute(stmt).scalars().all()]
+
+
+def list_running_kb_builds() -> List[Dict[str, Any]]:
+    with session_scope() as session:
+        stmt = select(KbBuild).where(KbBuild.status.in_(KB_BUILD_RUNNING))
+        return [{"tenant_id": build.tenant_id, **_kb_build_dict(build)} for build in session.execute(stmt).scalars()]
+
+
+def update_kb_build(build_id: int, **values: Any) -> None:
+    if values.get("status") in {"active", "failed"}:
+        values["finished_at"] = func.now()
+    with session_scope() as session:
+        session.execute(update(KbBuild).where(KbBuild.id == build_id).values(**values))
+
+
+def list_kb_build_files(tenant_id: str, kb_id: int, after_generation: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Catalogued files of a live KB, optionally only those written after ``after_generation``."""
+    with session_scope() as session:
+        stmt = (
+            select(KbFile.id, KbFile.filename, KbFile.generation)
+            .join(KnowledgeBase, KnowledgeBase.id == KbFile.kb_id)
+            .where(KbFile.tenant_id == tenant_id, KbFile.kb_id == kb_id, KnowledgeBase.deleted_at.is_(None))
+            .order_by(KbFile.id.asc())
+        )
+        if after_generation is not None:
+            stmt = stmt.where(KbFile.generation > after_generation)
+        return [{"id": row.id, "filename": row.filename, "generation": row.generation} for row in session.execute(stmt)]
+
+
+def list_kb_build_chunks(file_id: int, build_id: int) -> List[Dict[str, Any]]:
+    """A file's chunks in one build, in chunk order, with their embeddings."""
+    with session_scope() as session:
+        stmt = (
+            select(
+                KnowledgeDocument.content,
+                KnowledgeDocument.doc_metadata,
+                KnowledgeDocument.content_hash,
+                KnowledgeDocument.embedding,
+            )
+            .where(KnowledgeDocument.file_id == file_id, KnowledgeDocument.build_id == build_id)
+            .order_by(KnowledgeDocument.doc_metadata["chunk_index"].as_integer(), KnowledgeDocument.id)
+        )
+        return [
+            {
+                "content": row.content,
+                "metadata": row.doc_metadata or {},
+                "content_hash": row.content_hash,
+                "embedding": row.embedding,
             }
             for row in session.execute(stmt)
         ]
 
 
+def replace_kb_build_file(
+    tenant_id: str,
+    kb_id: int,
+    build_id: int,
+    file_id: int,
+    documents: List[Dict[str, Any]],
+) -> None:
+    """Swap a file's chunks in a shadow build for ``documents`` in one transaction."""
+    with session_scope() as session:
+        session.execute(
+            delete(KnowledgeDocument).where(
+                KnowledgeDocument.file_id == file_id, KnowledgeDocument.build_id == build_id
+            )
+        )
+        session.add_all(
+            [
+                KnowledgeDocument(
+                    tenant_id=tenant_id,
+                    kb_id=kb_id,
+                    file_id=file_id,
+                    build_id=build_id,
+                    content=doc["content"],
+                    embedding=doc.get("embedding"),
+                    doc_metadata=doc.get("metadata"),
+                    content_hash=doc.get("content_hash") or content_hash(doc["content"]),
+                    file_version=1,
+                    minhash=doc.get("minhash"),
+                    lsh_bands=doc.get("lsh_bands"),
+                )
+                for doc in documents
+            ]
+        )
+
+
+def sample_kb_build_chunks(
+    tenant_id: str, kb_id: int, build_id: int, count: int, max_generation: int
+) -> List[str]:
+    """Contents of up to ``count`` random embedded chunks of a build, from files written by ``max_generation``."""
+    with session_scope() as session:
+        stmt = (
+            select(KnowledgeDocument.content)
+            .join(KbFile, KbFile.id == KnowledgeDocument.file_id)
+            .where(
+                KnowledgeDocument.tenant_id == tenant_id,
+                KnowledgeDocument.kb_id == kb_id,
+                KnowledgeDocument.build_id == build_id,
+                KnowledgeDocument.embedding.is_not(None),
+                KbFile.generation <= max_generation,
+            )
+            .order_by(func.random())
+            .limit(count)
+        )
+        return list(session.execute(stmt).scalars().all())
+
+
+def search_kb_build(
+    tenant_id: str,
+    kb_id: int,
+    build_id: int,
+    quantization: str,
+    dims: Optional[int],
+    embedding: List[float],
+    limit: int = 5,
+) -> List[Dict[str, Any]]:
+    """Top-k of one build exactly as live search would run it, for validating a shadow build."""
+    with session_scope() as session:
+        if quantization != "none":
+            _set_ef_search(session, limit)
+        stmt = _kb_search_stmt(tenant_id, kb_id, build_id, quantization, dims, embedding, limit)
+        return [
+            {"id": row.id, "content": row.content, "distance": float(row.distance)}
+            for row in session.execute(stmt)
+        ]
+
+
+def activate_kb_build(tenant_id: str, kb_id: int, build_id: int, expected_generation: int) -> bool:
+    """Atomically make a validated build the one the KB serves.
+
+    Returns False without switching if the KB changed since ``expected_generation``;
+    the caller catches the build up and retries.
+    """
+    with session_scope() as session:
+        # FOR UPDATE waits for in-flight writers (they hold KEY SHARE) and keeps new ones out until commit.
+        kb = session.execute(
+            select(KnowledgeBase).where(*_live_kb(tenant_id, kb_id)).with_for_update()
+        ).scalars().first()
+        if kb is None:
+            raise RuntimeError("Knowledge base not found.")
+        if kb.generation != expected_generation:
+            return False
+        build = session.execute(select(KbBuild).where(KbBuild.id == build_id)).scalars().one()
+        settings = build.settings
+        session.execute(
+            update(KnowledgeBase)
+            .where(KnowledgeBase.id == kb_id)
+            .values(
+                active_build=build_id,
+                chunk_size=settings["chunk_size"],
+                chunk_overlap=settings["chunk_overlap"],
+                quantization=settings["quantization"],
+                embedding_model=settings["embedding_model"],
+                embedding_dimensions=settings.get("embedding_dimensions") or (build.progress or {}).get("dimensions"),
+                requested_dimensions=settings.get("embedding_dimensions"),
+                generation=KnowledgeBase.generation + 1,
+            )
+        )
+        chunk_count = (
+            select(func.count(KnowledgeDocument.id))
+            .where(KnowledgeDocument.file_id == KbFile.id, KnowledgeDocument.build_id == build_id)
+            .scalar_subquery()
+        )
+        session.execute(
+            update(KbFile).where(KbFile.tenant_id == tenant_id, KbFile.kb_id == kb_id).values(chunk_count=chunk_count)
+        )
+        session.execute(
+            update(KbBuild)
+            .where(KbBuild.kb_id == kb_id, KbBuild.status == "active")
+            .values(status="superseded")
+        )
+        session.execute(
+            update(KbBuild).where(KbBuild.id == build_id).values(status="active", finished_at=func.now())
+        )
+        return True
+
+
 def log_trace(
     tenant_id: str,
     agent_id: str,
@@ -596,8 +1905,12 @@ def log_trace(
     thread_id: str,
     trace_id: str,
     data: Dict[str, Any],
+    latency_ms: Optional[int] = None,
 ) -> None:
+    """Store a turn's trace as a summary row plus its compressed document (see ``trace_payloads``)."""
+    codec, payload, raw_bytes = encode_payload(data)
     with session_scope() as session:
+        # Both rows take the transaction's now() as created_at, so they land in the same monthly partition.
         session.add(
             TraceLog(
                 tenant_id=tenant_id,
@@ -605,24 +1918,304 @@ def log_trace(
                 version=version,
                 thread_id=thread_id,
                 trace_id=trace_id,
-                data=data,
+                **summarize_trace(data, latency_ms),
+            )
+        )
+        session.add(
+            TracePayload(
+                trace_id=trace_id,
+                tenant_id=tenant_id,
+                agent_id=agent_id,
+                codec=codec,
+                raw_bytes=raw_bytes,
+                payload=payload,
             )
         )
 
 
-def list_traces(tenant_id: str, agent_id: str, thread_id: Optional[str] = None) -> List[Dict[str, Any]]:
+def _trace_summary(trace: TraceLog) -> Dict[str, Any]:
+    return {
+        "trace_id": trace.trace_id,
+        "thread_id": trace.thread_id,
+        "version": trace.version,
+        "status": trace.status,
+        "latency_ms": trace.latency_ms,
+        "tokens": {
+            "prompt_tokens": trace.prompt_tokens,
+            "completion_tokens": trace.completion_tokens,
+            "total_tokens": trace.total_tokens,
+        },
+        "nodes": list(trace.nodes or []),
+        "input_preview": trace.input_preview,
+        "output_preview": trace.output_preview,
+        "created_at": trace.created_at.isoformat() if trace.created_at else None,
+    }
+
+
+def list_traces(
+    tenant_id: str,
+    agent_id: str,
+    thread_id: Optional[str] = None,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    status: Optional[str] = None,
+) -> Dict[str, Any]:
+    """One page of trace summaries, newest first; ``get_trace`` loads a trace's full document."""
+    stmt = select(TraceLog).where(TraceLog.tenant_id == tenant_id, TraceLog.agent_id == agent_id)
+    if thread_id:
+        stmt = stmt.where(TraceLog.thread_id == thread_id)
+    if status:
+        stmt = stmt.where(TraceLog.status == status)
+    # A time range limits the scan to the matching monthly partitions.
+    if since:
+        stmt = stmt.where(TraceLog.created_at >= since)
+    if until:
+        stmt = stmt.where(TraceLog.created_at < until)
+    with read_session_scope() as session:
+        rows, next_cursor = _keyset_page(session, stmt, TraceLog.created_at, TraceLog.id, limit, cursor)
+        return {"traces": [_trace_summary(trace) for trace in rows], "next_cursor": next_cursor}
+
+
+def get_trace(tenant_id: str, agent_id: str, trace_id: str) -> Optional[Dict[str, Any]]:
+    """A trace's summary with its full document under ``data``; None if the trace does not exist."""
+    with read_session_scope() as session:
+        trace = session.execute(
+            select(TraceLog)
+            .options(undefer(TraceLog.data))
+            .where(TraceLog.tenant_id == tenant_id, TraceLog.agent_id == agent_id, TraceLog.trace_id == trace_id)
+            .limit(1)
+        ).scalar_one_or_none()
+        if not trace:
+            return None
+        data = trace.data
+        if data is None:
+            # created_at prunes the lookup to the payload's monthly partition.
+            stored = session.execute(
+                select(TracePayload.codec, TracePayload.payload).where(
+                    TracePayload.trace_id == trace_id, TracePayload.created_at == trace.created_at
+                )
+            ).first()
+            data = decode_payload(stored.codec, stored.payload) if stored else {}
+        return {**_trace_summary(trace), "data": data}
+
+
+def offload_trace_payloads(
+    batch_size: int = 500, after: Optional[Tuple[int, datetime]] = None
+) -> Tuple[int, Optional[Tuple[int, datetime]]]:
+    """Compress up to ``batch_size`` legacy ``trace_logs.data`` documents into ``trace_payloads``.
+
+    Walks trace_logs in primary key order ``(id, created_at)`` from ``after`` (the start
+    when None), so a full run reads each row once instead of rescanning the rows already
+    moved. Returns how many rows were moved and the key to continue after, None at the end.
+    """
+    stmt = (
+        select(
+            TraceLog.id,
+            TraceLog.trace_id,
+            TraceLog.tenant_id,
+            TraceLog.agent_id,
+            TraceLog.created_at,
+            TraceLog.data,
+        )
+        .where(TraceLog.data.is_not(None))
+        .order_by(TraceLog.id, TraceLog.created_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    if after is not None:
+        stmt = stmt.where(tuple_(TraceLog.id, TraceLog.created_at) > tuple_(*after))
     with session_scope() as session:
-        stmt = select(TraceLog).where(TraceLog.tenant_id == tenant_id, TraceLog.agent_id == agent_id)
-        if thread_id:
-            stmt = stmt.where(TraceLog.thread_id == thread_id)
-        stmt = stmt.order_by(TraceLog.created_at.desc()).limit(100)
-        return [
+        rows = session.execute(stmt).all()
+        for row in rows:
+            codec, payload, raw_bytes = encode_payload(row.data)
+            session.execute(
+                pg_insert(TracePayload)
+                .values(
+                    trace_id=row.trace_id,
+                    tenant_id=row.tenant_id,
+                    agent_id=row.agent_id,
+                    codec=codec,
+                    raw_bytes=raw_bytes,
+                    payload=payload,
+                    created_at=row.created_at,
+                )
+                .on_conflict_do_nothing()
+            )
+            session.execute(
+                update(TraceLog)
+                .where(TraceLog.id == row.id, TraceLog.created_at == row.created_at)
+                .values(data=null())
+            )
+        return len(rows), (rows[-1].id, rows[-1].created_at) if rows else None
+
+
+LOG_TABLES = ("chat_logs", "trace_logs", "trace_payloads")
+_LOG_MAINTENANCE_LOCK = 0x6C6F6773  # pg advisory lock key ("logs")
+
+
+def month_start(value: datetime) -> datetime:
+    value = value.astimezone(timezone.utc)
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def _log_table(table: str) -> str:
+    if table not in LOG_TABLES:
+        raise RuntimeError(f"Unknown log table '{table}'.")
+    return table
+
+
+def list_log_partitions(table: str) -> List[Dict[str, Any]]:
+    """Monthly partitions of ``table`` (not the default one), oldest first."""
+    _log_table(table)
+    with session_scope() as session:
+        names = session.execute(
+            text(
+                "SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                "WHERE pg_inherits.inhparent = CAST(:table AS regclass)"
+            ),
+            {"table": table},
+        ).scalars()
+        partitions = []
+        for name in names:
+            suffix = name[len(table) + 2 :]
+            if not name.startswith(f"{table}_p") or len(suffix) != 6 or not suffix.isdigit():
+                continue
+            month = datetime(int(suffix[:4]), int(suffix[4:]), 1, tzinfo=timezone.utc)
+            partitions.append({"name": name, "month": month})
+    return sorted(partitions, key=lambda item: item["month"])
+
+
+def create_log_partition(table: str, month: datetime) -> bool:
+    """Create the partition of ``table`` for ``month``; False if it already exists.
+
+    Rows for that month that landed in the default partition are moved into it in
+    the same transaction, so the partition can be attached.
+    """
+    _log_table(table)
+    month = month_start(month)
+    name = f"{table}_p{month:%Y%m}"
+    bounds = {"lower": month, "upper": add_months(month, 1)}
+    with session_scope() as session:
+        if session.execute(select(func.to_regclass(name))).scalar() is not None:
+            return False
+        session.execute(
+            text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE)")
+        )
+        session.execute(
+            text(
+                f"WITH moved AS (DELETE FROM {table}_default WHERE created_at >= :lower AND created_at < :upper "
+                f"RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+            ),
+            bounds,
+        )
+        session.execute(
+            text(
+                f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES "
+                f"FROM ('{bounds['lower'].isoformat()}') TO ('{bounds['upper'].isoformat()}')"
+            )
+        )
+    return True
+
+
+def drop_log_partition(table: str, name: str, archive_schema: Optional[str] = None) -> None:
+    """Drop a monthly partition, or detach it and move it to ``archive_schema`` to keep the rows offline."""
+    _log_table(table)
+    with session_scope() as session:
+        session.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+        if archive_schema:
+            session.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{archive_schema}"'))
+            session.execute(text(f'ALTER TABLE {name} SET SCHEMA "{archive_schema}"'))
+        else:
+            session.execute(text(f"DROP TABLE {name}"))
+
+
+def list_log_partition_agents(name: str) -> Set[Tuple[str, str]]:
+    """(tenant, agent) pairs with rows in one partition.
+
+    Skips through the partition's (tenant_id, agent_id, ...) index one pair at a
+    time, so the cost grows with the number of agents rather than rows.
+    """
+    with session_scope() as session:
+        rows = session.execute(
+            text(
+                f"WITH RECURSIVE agents AS ("
+                f"(SELECT tenant_id, agent_id FROM {name} ORDER BY tenant_id, agent_id LIMIT 1) "
+                f"UNION ALL SELECT next.tenant_id, next.agent_id FROM agents, LATERAL ("
+                f"SELECT tenant_id, agent_id FROM {name} "
+                f"WHERE (tenant_id, agent_id) > (agents.tenant_id, agents.agent_id) "
+                f"ORDER BY tenant_id, agent_id LIMIT 1) AS next"
+                f") SELECT tenant_id, agent_id FROM agents"
+            )
+        ).all()
+    return {(row.tenant_id, row.agent_id) for row in rows}
+
+
+def delete_log_partition_rows(name: str, agents: List[Tuple[str, str]]) -> int:
+    """Delete the rows of ``agents`` (tenant, agent) from one partition."""
+    if not agents:
+        return 0
+    partition = sa_table(name, sa_column("tenant_id"), sa_column("agent_id"))
+    with session_scope() as session:
+        return session.execute(
+            delete(partition).where(tuple_(partition.c.tenant_id, partition.c.agent_id).in_(agents))
+        ).rowcount or 0
+
+
+def list_log_retention_policies() -> Dict[Tuple[str, str], Dict[str, Optional[int]]]:
+    """Retention months per (tenant, agent) and log table from the persistence config, None where unset.
+
+    The latest published version's config wins over the draft.
+    """
+    keys = {
+        "chat_logs": "chat_log_retention_months",
+        "trace_logs": "trace_log_retention_months",
+        "trace_payloads": "trace_log_retention_months",
+    }
+    latest = (
+        select(AgentVersion.tenant_id, AgentVersion.agent_id, func.max(AgentVersion.version).label("version"))
+        .group_by(AgentVersion.tenant_id, AgentVersion.agent_id)
+        .subquery()
+    )
+    with session_scope() as session:
+        configs = {
+            (row.tenant_id, row.agent_id): row.config
+            for row in session.execute(select(AgentDraft.tenant_id, AgentDraft.agent_id, AgentDraft.config))
+        }
+        configs.update(
             {
-                "trace_id": trace.trace_id,
-                "thread_id": trace.thread_id,
-                "version": trace.version,
-                "data": trace.data,
-                "created_at": trace.created_at.isoformat() if trace.created_at else None,
+                (row.tenant_id, row.agent_id): row.config
+                for row in session.execute(
+                    select(AgentVersion.tenant_id, AgentVersion.agent_id, AgentVersion.config).join(
+                        latest,
+                        (AgentVersion.tenant_id == latest.c.tenant_id)
+                        & (AgentVersion.agent_id == latest.c.agent_id)
+                        & (AgentVersion.version == latest.c.version),
+                    )
+                )
             }
-            for trace in session.execute(stmt).scalars().all()
-        ]
+        )
+    policies = {}
+    for agent, config in configs.items():
+        persistence = (config or {}).get("persistence") or {}
+        policies[agent] = {table: persistence.get(key) or None for table, key in keys.items()}
+    return policies
+
+
+@contextmanager
+def log_maintenance_lock() -> Generator[bool, None, None]:
+    """Session advisory lock so only one process maintains log partitions at a time; yields whether it was taken."""
+    with get_engine().connect() as connection:
+        acquired = bool(connection.execute(select(func.pg_try_advisory_lock(_LOG_MAINTENANCE_LOCK))).scalar())
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                connection.execute(select(func.pg_advisory_unlock(_LOG_MAINTENANCE_LOCK)))
+                connection.commit()
@@ -0,0 +1,225 @@
+"""Streaming form submission exports (CSV, NDJSON, Parquet).
+
+Rows come from ``stream_form_submissions`` (a server-side cursor) and are
+encoded one batch at a time, so memory stays flat however many submissions
+match. Payloads are flattened into one column per form field, taken from the
+forms definition; keys no field declares are kept as JSON in ``payload_other``,
+as are Parquet values that do not fit their field's typed column.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .models import FormsConfig
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+BASE_COLUMNS = (
+    "id",
+    "created_at",
+    "form_id",
+    "form_name",
+    "thread_id",
+    "version",
+    "delivery_type",
+    "delivery_status",
+    "delivery_target",
+)
+OTHER_COLUMN = "payload_other"
+_BASE_TYPES = {"id": "integer", "version": "integer", "created_at": "timestamp"}
+_BATCH_ROWS = 1000
+
+# (column, payload key, field type)
+Column = Tuple[str, str, str]
+
+
+def field_columns(forms: Optional[Dict[str, Any]], form_id: Optional[str] = None) -> List[Column]:
+    """Payload columns for ``form_id`` (or every form), in form and field order, one per field name."""
+    if not forms:
+        return []
+    try:
+        config = FormsConfig.model_validate(forms)
+    except ValueError:
+        return []
+    columns: List[Column] = []
+    seen = set(BASE_COLUMNS) | {OTHER_COLUMN}
+    names = set()
+    for form in config.forms:
+        if form_id and form.id != form_id:
+            continue
+        for field in form.fields:
+            if field.name in names:
+                continue
+            names.add(field.name)
+            column = field.name if field.name not in seen else f"payload_{field.name}"
+            seen.add(column)
+            columns.append((column, field.name, field.type))
+    return columns
+
+
+def _flatten(item: Dict[str, Any], fields: List[Column]) -> Dict[str, Any]:
+    row = {column: item.get(column) for column in BASE_COLUMNS}
+    payload = dict(item.get("payload") or {})
+    for column, key, _ in fields:
+        row[column] = payload.pop(key, None)
+    row[OTHER_COLUMN] = payload or None
+    return row
+
+
+def _cell(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+def _batches(rows: Iterable[Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+    batch: List[Dict[str, Any]] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= _BATCH_ROWS:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _csv(rows: Iterable[Dict[str, Any]], columns: List[str]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in _batches(rows):
+        writer.writerows([_cell(row[column]) for column in columns] for row in batch)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def _ndjson(rows: Iterable[Dict[str, Any]], columns: List[str]) -> Iterator[bytes]:
+    for batch in _batches(rows):
+        yield "".join(json.dumps({column: row[column] for column in columns}) + "\n" for row in batch).encode("utf-8")
+
+
+class _Drain(io.RawIOBase):
+    """Write-only sink that hands out what the Parquet writer has produced so far."""
+
+    def __init__(self) -> None:
+        self.chunks: List[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _parquet_type(pa, kind: str):
+    if kind == "integer":
+        return pa.int64()
+    if kind == "timestamp":
+        return pa.timestamp("us", tz="UTC")
+    if kind == "number":
+        return pa.float64()
+    if kind == "boolean":
+        return pa.bool_()
+    return pa.string()
+
+
+class _Misfit(Exception):
+    """A payload value that the typed Parquet column for its field cannot hold."""
+
+
+def _parquet_value(value: Any, kind: str) -> Any:
+    """Coerce to the column type; raises ``_Misfit`` for a value a typed field cannot hold."""
+    if value is None or kind == "integer":
+        return value
+    if kind == "timestamp":
+        return datetime.fromisoformat(value)
+    if kind == "number":
+        if isinstance(value, bool):
+            raise _Misfit
+        try:
+            return float(value)
+        except (TypeError, ValueError) as exc:
+            raise _Misfit from exc
+    if kind == "boolean":
+        if not isinstance(value, bool):
+            raise _Misfit
+        return value
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def _parquet_record(row: Dict[str, Any], kinds: Dict[str, str], fields: List[Column]) -> Dict[str, Any]:
+    """Typed Parquet row; field values that do not fit their column move to ``payload_other`` under their key."""
+    record: Dict[str, Any] = {}
+    other = dict(row[OTHER_COLUMN] or {})
+    keys = {column: key for column, key, _ in fields}
+    for column, kind in kinds.items():
+        if column == OTHER_COLUMN:
+            continue
+        try:
+            record[column] = _parquet_value(row[column], kind)
+        except _Misfit:
+            record[column] = None
+            other[keys[column]] = row[column]
+    record[OTHER_COLUMN] = _parquet_value(other or None, "text")
+    return record
+
+
+def _parquet(rows: Iterable[Dict[str, Any]], fields: List[Column]) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    kinds = {column: _BASE_TYPES.get(column, "text") for column in BASE_COLUMNS}
+    kinds.update({column: field_type for column, _, field_type in fields})
+    kinds[OTHER_COLUMN] = "text"
+    schema = pa.schema([(column, _parquet_type(pa, kind)) for column, kind in kinds.items()])
+    sink = _Drain()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        for batch in _batches(rows):
+            records = [_parquet_record(row, kinds, fields) for row in batch]
+            # One row group per batch; its bytes can go out as soon as it is written.
+            writer.write_table(pa.Table.from_pylist(records, schema=schema))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def encode_submissions(
+    items: Iterable[Dict[str, Any]], export_format: str, fields: List[Column]
+) -> Iterator[bytes]:
+    """Encode submissions as ``export_format``; raises before any output if the format is unavailable."""
+    if export_format not in EXPORT_FORMATS:
+        raise RuntimeError(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    if export_format == "parquet":
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError as exc:
+            raise RuntimeError("Parquet export requires pyarrow.") from exc
+    rows = (_flatten(item, fields) for item in items)
+    columns = [*BASE_COLUMNS, *(column for column, _, _ in fields), OTHER_COLUMN]
+    if export_format == "csv":
+        return _csv(rows, columns)
+    if export_format == "ndjson":
+        return _ndjson(rows, columns)
+    return _parquet(rows, fields)
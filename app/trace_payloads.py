@@ -0,0 +1,93 @@
+"""Trace summaries and compressed trace payloads.
+
+A chat turn's trace is stored twice over: a small summary row in ``trace_logs``
+(status, latency, tokens, nodes, input/output previews) that listings read, and
+the full JSON document compressed into ``trace_payloads``, which is only read
+when one trace is opened. Payloads are zstd-compressed when the ``zstandard``
+package is installed and zlib-compressed otherwise; the codec is stored with
+each payload so both can be read back.
+"""
+
+import json
+import zlib
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .usage import turn_counters
+
+PREVIEW_CHARS = 200
+ZSTD_LEVEL = 3
+# Failures of the turn itself; validator and field-validation failures are normal conversation flow.
+_ERROR_EVENTS = {"kb_search_failed", "llm_answer_failed", "tool_missing"}
+
+
+@lru_cache(maxsize=1)
+def _zstd() -> Optional[Any]:
+    try:
+        import zstandard
+
+        return zstandard
+    except ImportError:
+        return None
+
+
+def _preview(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    text = value if isinstance(value, str) else json.dumps(value, default=str)
+    return text[:PREVIEW_CHARS]
+
+
+def _failed(event: Dict[str, Any]) -> bool:
+    if event.get("event") in _ERROR_EVENTS:
+        return True
+    result = event.get("result")
+    return event.get("event") == "tool_call" and isinstance(result, dict) and "error" in result
+
+
+def trace_nodes(events: Iterable[Dict[str, Any]]) -> List[str]:
+    """Graph nodes a turn passed through, in order of first appearance."""
+    nodes: List[str] = []
+    for event in events:
+        node = event.get("node")
+        if node and node not in nodes:
+            nodes.append(str(node))
+    return nodes
+
+
+def summarize_trace(data: Dict[str, Any], latency_ms: Optional[int] = None) -> Dict[str, Any]:
+    """Summary columns of a ``trace_logs`` row for the trace document ``data``."""
+    events = [event for event in data.get("events") or [] if isinstance(event, dict)]
+    counters = turn_counters(events)
+    return {
+        "status": "error" if any(_failed(event) for event in events) else "ok",
+        "latency_ms": latency_ms,
+        "prompt_tokens": counters["prompt_tokens"],
+        "completion_tokens": counters["completion_tokens"],
+        "total_tokens": counters["total_tokens"],
+        "nodes": trace_nodes(events),
+        "input_preview": _preview(data.get("input")),
+        "output_preview": _preview(data.get("output")),
+    }
+
+
+def encode_payload(data: Dict[str, Any]) -> Tuple[str, bytes, int]:
+    """``(codec, compressed, raw_bytes)`` for the trace document ``data``."""
+    raw = json.dumps(data, default=str, separators=(",", ":")).encode("utf-8")
+    zstandard = _zstd()
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw), len(raw)
+    return "zlib", zlib.compress(raw, 6), len(raw)
+
+
+def decode_payload(codec: str, payload: bytes) -> Dict[str, Any]:
+    if codec == "zstd":
+        zstandard = _zstd()
+        if zstandard is None:
+            raise RuntimeError("Trace payload is zstd-compressed but the zstandard package is not installed.")
+        raw = zstandard.ZstdDecompressor().decompress(payload)
+    elif codec == "zlib":
+        raw = zlib.decompress(payload)
+    else:
+        raise RuntimeError(f"Unknown trace payload codec '{codec}'.")
+    return json.loads(raw)
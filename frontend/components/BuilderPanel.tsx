@@ -71,22 +71,37 @@ type KnowledgeBaseConfig = {
   api_key?: string | null;
   index_name?: string | null;
   knowledge_base_id?: number | null;
+  knowledge_bases?: { id: number; weight?: number }[];
   retrieval_mode: "single-pass" | "agentic";
   max_agentic_passes: number;
   use_semantic_ranker: boolean;
+  context_token_budget?: number | null;
 };
 
 type FormsConfig = { intents: Intent[]; forms: Form[] };
 type BuilderTab = "configure" | "test" | "threads" | "traces" | "knowledge";
 type ThreadSummary = { thread_id: string; last_activity?: string | null };
 type ThreadMessage = { role: string; content: string; created_at?: string | null };
-type TraceLog = { trace_id: string; thread_id: string; version: number; data: Record<string, unknown>; created_at?: string | null };
+type TraceLog = {
+  trace_id: string;
+  thread_id: string;
+  version: number;
+  status: "ok" | "error";
+  latency_ms?: number | null;
+  tokens: { prompt_tokens: number; completion_tokens: number; total_tokens: number };
+  nodes: string[];
+  input_preview?: string | null;
+  output_preview?: string | null;
+  created_at?: string | null;
+};
 type PublishedVersion = { version: number; created_at?: string | null };
 type PersistenceConfig = {
   storage_backend?: "none" | "postgres" | "mongo" | "cosmos";
   postgres_dsn?: string | null;
   mongo_uri?: string | null;
   enable_chat_logs?: boolean;
+  chat_log_retention_months?: number | null;
+  trace_log_retention_months?: number | null;
   enable_config_versions?: boolean;
   enable_cosmos?: boolean;
   use_managed_identity?: boolean;
@@ -116,7 +131,9 @@ export function BuilderPanel() {
   const [threadSearch, setThreadSearch] = useState<string>("");
   const [selectedThreadId, setSelectedThreadId] = useState<string>("");
   const [threadMessages, setThreadMessages] = useState<ThreadMessage[]>([]);
+  const [messagesCursor, setMessagesCursor] = useState<string | null>(null);
   const [traces, setTraces] = useState<TraceLog[]>([]);
+  const [traceDetails, setTraceDetails] = useState<Record<string, Record<string, any>>>({});
   const [publishedVersions, setPublishedVersions] = useState<PublishedVersion[]>([]);
   const [versionConfigs, setVersionConfigs] = useState<Record<number, Record<string, unknown> | null>>({});
   const [loadingVersions, setLoadingVersions] = useState<boolean>(false);
@@ -171,15 +188,18 @@ export function BuilderPanel() {
     }
   };
 
-  const loadThreadMessages = async (threadId: string) => {
+  const loadThreadMessages = async (threadId: string, cursor?: string) => {
     if (!threadId) return;
     try {
-      const res = await fetch(`${API_BASE}/threads/${threadId}/messages`);
+      const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : "";
+      const res = await fetch(`${API_BASE}/threads/${threadId}/messages${query}`);
       if (!res.ok) throw new Error(await res.text());
       const data = await res.json();
-      setThreadMessages(data.messages || []);
+      const page: ThreadMessage[] = data.messages || [];
+      setThreadMessages((prev) => (cursor ? [...prev, ...page] : page));
+      setMessagesCursor(data.next_cursor || null);
       setSelectedThreadId(threadId);
-      void loadTraces(threadId);
+      if (!cursor) void loadTraces(threadId);
     } catch (err) {
       setMessage(`Failed to load thread: ${String(err)}`);
     }
@@ -197,6 +217,19 @@ export function BuilderPanel() {
     }
   };
 
+  // Listings carry only summaries; a trace's full document is fetched the first time it is expanded.
+  const loadTraceDetail = async (traceId: string) => {
+    if (traceDetails[traceId]) return;
+    try {
+      const res = await fetch(`${API_BASE}/traces/${encodeURIComponent(traceId)}`);
+      if (!res.ok) throw new Error(await res.text());
+      const trace = await res.json();
+      setTraceDetails((prev) => ({ ...prev, [traceId]: trace.data || {} }));
+    } catch (err) {
+      setMessage(`Failed to load trace: ${String(err)}`);
+    }
+  };
+
   useEffect(() => {
     if (activeTab === "threads") {
       void loadThreads();
@@ -874,6 +907,14 @@ export function BuilderPanel() {
                       {m.created_at && <div className="text-sm text-slate-500">{m.created_at}</div>}
                     </div>
                   ))}
+                  {messagesCursor && (
+                    <button
+                      className="btn secondary"
+                      onClick={() => loadThreadMessages(selectedThreadId, messagesCursor)}
+                    >
+                      Load more
+                    </button>
+                  )}
                 </div>
               </div>
             </div>
@@ -919,25 +960,38 @@ export function BuilderPanel() {
                   )}
                   {traces.length === 0 && <p>No trace logs yet.</p>}
                   {traces.map((trace) => {
-                    const data = trace.data || {};
-                    const input = data.input || "";
-                    const output = data.output || "";
-                    const tokens = data.tokens || {};
-                    const events = data.events || [];
-                    const stateBefore = data.state_before || {};
-                    const stateAfter = data.state_after || data.state || {};
-                    const tokenSummary = Object.entries(tokens as Record<string, unknown>)
+                    const data = traceDetails[trace.trace_id];
+                    const input = data ? data.input || "" : trace.input_preview || "";
+                    const output = data ? data.output || "" : trace.output_preview || "";
+                    const tokens = data?.tokens || {};
+                    const events = data?.events || [];
+                    const stateBefore = data?.state_before || {};
+                    const stateAfter = data?.state_after || data?.state || {};
+                    const tokenSummary = Object.entries(trace.tokens || {})
                       .map(([key, value]) => `${key}: ${String(value)}`)
                       .join(", ");
                     return (
-                      <details key={trace.trace_id} className="border rounded p-3">
+                      <details
+                        key={trace.trace_id}
+                        className="border rounded p-3"
+                        onToggle={(e) => {
+                          if ((e.currentTarget as HTMLDetailsElement).open) void loadTraceDetail(trace.trace_id);
+                        }}
+                      >
                         <summary className="cursor-pointer">
-                          <div style={{ fontWeight: 600 }}>Trace {trace.trace_id}</div>
+                          <div style={{ fontWeight: 600 }}>
+                            Trace {trace.trace_id}
+                            {trace.status === "error" ? " · error" : ""}
+                          </div>
                           <div className="text-sm text-slate-600">
                             Version: {trace.version}
                             {trace.created_at ? ` · ${trace.created_at}` : ""}
+                            {trace.latency_ms != null ? ` · ${trace.latency_ms} ms` : ""}
                           </div>
-                          <div className="text-sm text-slate-600">Input: {String(input).slice(0, 120)}</div>
+                          <div className="text-sm text-slate-600">Input: {String(trace.input_preview || "").slice(0, 120)}</div>
+                          {trace.nodes?.length > 0 && (
+                            <div className="text-sm text-slate-600">Nodes: {trace.nodes.join(" → ")}</div>
+                          )}
                         </summary>
                         <div className="space-y-2" style={{ marginTop: 8 }}>
                           <div className="text-sm">
@@ -951,6 +1005,7 @@ export function BuilderPanel() {
                               <strong>Tokens:</strong> {tokenSummary}
                             </div>
                           )}
+                          {!data && <div className="text-sm text-slate-600">Loading trace…</div>}
                           <div className="grid grid-cols-2 gap-2">
                             <div className="border rounded p-2 text-sm" style={{ background: "#f8fafc" }}>
                               <div className="text-slate-600">Input</div>
@@ -8,13 +8,18 @@ type TraceLog = {
   trace_id: string;
   thread_id: string;
   version: number;
-  data: Record<string, unknown>;
+  status: "ok" | "error";
+  latency_ms?: number | null;
+  tokens: { prompt_tokens: number; completion_tokens: number; total_tokens: number };
+  nodes: string[];
+  input_preview?: string | null;
   created_at?: string | null;
 };
 
 export function LogsPanel() {
   const [traces, setTraces] = useState<TraceLog[]>([]);
   const [expandedId, setExpandedId] = useState<string | null>(null);
+  const [details, setDetails] = useState<Record<string, unknown>>({});
   const [threadFilter, setThreadFilter] = useState<string>("");
   const [loading, setLoading] = useState(false);
   const [message, setMessage] = useState<string>("");
@@ -44,10 +49,30 @@ export function LogsPanel() {
     void loadTraces();
   }, []);
 
+  // The full trace document is only fetched when a row is opened.
+  const toggleTrace = async (traceId: string) => {
+    if (expandedId === traceId) {
+      setExpandedId(null);
+      return;
+    }
+    setExpandedId(traceId);
+    if (traceId in details) return;
+    try {
+      const res = await fetch(`${API_BASE}/traces/${encodeURIComponent(traceId)}`);
+      if (!res.ok) throw new Error(await res.text());
+      const trace = await res.json();
+      setDetails((prev) => ({ ...prev, [traceId]: trace.data }));
+    } catch (err) {
+      setMessage(`Failed to load trace: ${String(err)}`);
+    }
+  };
+
   const renderSummary = (trace: TraceLog) => {
-    const data = trace.data || {};
-    const node = (data as any).node || (data as any).event || (data as any).step;
-    return node ? String(node) : "Trace event";
+    const parts = [trace.nodes?.length ? trace.nodes.join(" → ") : trace.input_preview || "Trace event"];
+    if (trace.latency_ms != null) parts.push(`${trace.latency_ms} ms`);
+    if (trace.tokens?.total_tokens) parts.push(`${trace.tokens.total_tokens} tokens`);
+    if (trace.status === "error") parts.push("error");
+    return parts.join(" · ");
   };
 
   return (
@@ -105,7 +130,7 @@ export function LogsPanel() {
                     <td className="px-4 py-3 text-right">
                       <button
                         className="rounded-md border border-slate-200 px-3 py-1 text-xs font-semibold text-slate-600 hover:bg-slate-50"
-                        onClick={() => setExpandedId(expandedId === trace.trace_id ? null : trace.trace_id)}
+                        onClick={() => void toggleTrace(trace.trace_id)}
                       >
                         {expandedId === trace.trace_id ? "Hide" : "View"}
                       </button>
@@ -115,7 +140,7 @@ export function LogsPanel() {
                     <tr className="border-t border-slate-200 bg-slate-50">
                       <td colSpan={5} className="px-4 py-4">
                         <pre className="whitespace-pre-wrap text-xs text-slate-700">
-                          {JSON.stringify(trace.data, null, 2)}
+                          {trace.trace_id in details ? JSON.stringify(details[trace.trace_id], null, 2) : "Loading…"}
                         </pre>
                       </td>
                     </tr>
@@ -4,13 +4,21 @@ import { useEffect, useMemo, useState } from "react";
 
 const API_BASE = process.env.NEXT_PUBLIC_API_BASE || "/api";
 
-type ThreadSummary = { thread_id: string; last_activity?: string | null };
+type ThreadSummary = {
+  thread_id: string;
+  last_activity?: string | null;
+  message_count?: number;
+  current_form_id?: string | null;
+  completed?: boolean;
+};
 type ThreadMessage = { role: string; content: string; created_at?: string | null };
 
 export function RunsPanel() {
   const [threads, setThreads] = useState<ThreadSummary[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [selectedThreadId, setSelectedThreadId] = useState<string>("");
   const [threadMessages, setThreadMessages] = useState<ThreadMessage[]>([]);
+  const [messagesCursor, setMessagesCursor] = useState<string | null>(null);
   const [search, setSearch] = useState<string>("");
   const [loading, setLoading] = useState(false);
   const [message, setMessage] = useState<string>("");
@@ -21,14 +29,17 @@ export function RunsPanel() {
     return threads.filter((t) => t.thread_id.toLowerCase().includes(query));
   }, [threads, search]);
 
-  const loadThreads = async () => {
+  const loadThreads = async (cursor?: string) => {
     setLoading(true);
     setMessage("");
     try {
-      const res = await fetch(`${API_BASE}/threads`);
+      const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : "";
+      const res = await fetch(`${API_BASE}/threads${query}`);
       if (!res.ok) throw new Error(await res.text());
       const data = await res.json();
-      setThreads(data.threads || []);
+      const page: ThreadSummary[] = data.threads || [];
+      setThreads((prev) => (cursor ? [...prev, ...page] : page));
+      setNextCursor(data.next_cursor || null);
     } catch (err) {
       setMessage(`Failed to load threads: ${String(err)}`);
     } finally {
@@ -36,15 +47,18 @@ export function RunsPanel() {
     }
   };
 
-  const loadThreadMessages = async (threadId: string) => {
+  const loadThreadMessages = async (threadId: string, cursor?: string) => {
     if (!threadId) return;
     setLoading(true);
     setMessage("");
     try {
-      const res = await fetch(`${API_BASE}/threads/${threadId}/messages`);
+      const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : "";
+      const res = await fetch(`${API_BASE}/threads/${threadId}/messages${query}`);
       if (!res.ok) throw new Error(await res.text());
       const data = await res.json();
-      setThreadMessages(data.messages || []);
+      const page: ThreadMessage[] = data.messages || [];
+      setThreadMessages((prev) => (cursor ? [...prev, ...page] : page));
+      setMessagesCursor(data.next_cursor || null);
       setSelectedThreadId(threadId);
     } catch (err) {
       setMessage(`Failed to load thread messages: ${String(err)}`);
@@ -66,7 +80,7 @@ export function RunsPanel() {
         </div>
         <button
           className="rounded-md border border-slate-200 bg-white px-3 py-2 text-sm font-medium text-slate-700 hover:bg-slate-50"
-          onClick={loadThreads}
+          onClick={() => loadThreads()}
           disabled={loading}
         >
           Refresh
@@ -102,12 +116,23 @@ export function RunsPanel() {
                 <div className="truncate font-medium">{thread.thread_id}</div>
                 <div className={`text-xs ${selectedThreadId === thread.thread_id ? "text-slate-200" : "text-slate-500"}`}>
                   {thread.last_activity ? new Date(thread.last_activity).toLocaleString() : "No activity"}
+                  {thread.message_count ? ` · ${thread.message_count} messages` : ""}
+                  {thread.completed ? " · completed" : ""}
                 </div>
               </button>
             ))}
             {filteredThreads.length === 0 && (
               <div className="text-sm text-slate-500">No threads found.</div>
             )}
+            {nextCursor && (
+              <button
+                className="w-full rounded-md border border-slate-200 bg-white px-3 py-2 text-sm text-slate-700 hover:bg-slate-50"
+                onClick={() => loadThreads(nextCursor)}
+                disabled={loading}
+              >
+                Load more
+              </button>
+            )}
           </div>
         </div>
 
@@ -131,6 +156,15 @@ export function RunsPanel() {
             {threadMessages.length === 0 && (
               <div className="text-sm text-slate-500">No messages loaded.</div>
             )}
+            {messagesCursor && (
+              <button
+                className="w-full rounded-md border border-slate-200 bg-white px-3 py-2 text-sm text-slate-700 hover:bg-slate-50"
+                onClick={() => loadThreadMessages(selectedThreadId, messagesCursor)}
+                disabled={loading}
+              >
+                Load more
+              </button>
+            )}
           </div>
         </div>
       </div>
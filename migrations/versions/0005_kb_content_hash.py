@@ -0,0 +1,24 @@
+"""knowledge document content hashes and file versions"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0005_kb_content_hash"
+down_revision = "0004_form_submissions_oauth"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("knowledge_documents", sa.Column("content_hash", sa.String(length=64), nullable=True))
+    op.add_column("knowledge_documents", sa.Column("file_version", sa.Integer(), nullable=True))
+    op.execute(
+        "UPDATE knowledge_documents "
+        "SET content_hash = encode(sha256(convert_to(content, 'UTF8')), 'hex'), file_version = 1"
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("knowledge_documents", "file_version")
+    op.drop_column("knowledge_documents", "content_hash")
@@ -0,0 +1,28 @@
+"""knowledge document minhash signatures for near-duplicate detection"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "0006_kb_minhash"
+down_revision = "0005_kb_content_hash"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("knowledge_documents", sa.Column("minhash", postgresql.ARRAY(sa.BigInteger()), nullable=True))
+    op.add_column("knowledge_documents", sa.Column("lsh_bands", postgresql.ARRAY(sa.BigInteger()), nullable=True))
+    op.create_index(
+        "ix_knowledge_documents_lsh_bands",
+        "knowledge_documents",
+        ["lsh_bands"],
+        postgresql_using="gin",
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_knowledge_documents_lsh_bands", table_name="knowledge_documents")
+    op.drop_column("knowledge_documents", "lsh_bands")
+    op.drop_column("knowledge_documents", "minhash")
@@ -0,0 +1,28 @@
+"""knowledge base quantization settings"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0007_kb_quantization"
+down_revision = "0006_kb_minhash"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "knowledge_bases",
+        sa.Column("quantization", sa.String(length=16), nullable=False, server_default="none"),
+    )
+    op.add_column("knowledge_bases", sa.Column("embedding_dimensions", sa.Integer(), nullable=True))
+    op.execute(
+        "UPDATE knowledge_bases kb SET embedding_dimensions = ("
+        "SELECT vector_dims(embedding) FROM knowledge_documents d "
+        "WHERE d.kb_id = kb.id AND d.embedding IS NOT NULL LIMIT 1)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("knowledge_bases", "embedding_dimensions")
+    op.drop_column("knowledge_bases", "quantization")
@@ -0,0 +1,21 @@
+"""knowledge base generation counter"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0008_kb_generation"
+down_revision = "0007_kb_quantization"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "knowledge_bases",
+        sa.Column("generation", sa.BigInteger(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("knowledge_bases", "generation")
@@ -0,0 +1,56 @@
+"""knowledge base file catalogue"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0009_kb_files"
+down_revision = "0008_kb_generation"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "kb_files",
+        sa.Column("id", sa.BigInteger(), primary_key=True),
+        sa.Column("tenant_id", sa.String(length=64), nullable=False),
+        sa.Column("kb_id", sa.BigInteger(), nullable=False),
+        sa.Column("filename", sa.String(length=512), nullable=False),
+        sa.Column("chunk_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("byte_size", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("content_hash", sa.String(length=64), nullable=True),
+        sa.Column("indexed_at", sa.DateTime(timezone=True), server_default=sa.text("now()")),
+    )
+    op.create_unique_constraint("uq_kb_files", "kb_files", ["tenant_id", "kb_id", "filename"])
+    op.create_index("ix_kb_files_tenant_id", "kb_files", ["tenant_id"])
+    op.create_index("ix_kb_files_kb_id", "kb_files", ["kb_id"])
+
+    op.add_column(
+        "knowledge_documents",
+        sa.Column("file_id", sa.BigInteger(), sa.ForeignKey("kb_files.id"), nullable=True),
+    )
+
+    # Existing chunks: byte_size is approximated from chunk text, the original file hash is unknown.
+    op.execute(
+        "INSERT INTO kb_files (tenant_id, kb_id, filename, chunk_count, byte_size, indexed_at) "
+        "SELECT tenant_id, kb_id, COALESCE(doc_metadata->>'filename', 'manual_entry'), "
+        "count(*), COALESCE(sum(octet_length(content)), 0), max(created_at) "
+        "FROM knowledge_documents "
+        "GROUP BY tenant_id, kb_id, COALESCE(doc_metadata->>'filename', 'manual_entry')"
+    )
+    op.execute(
+        "UPDATE knowledge_documents d SET file_id = f.id FROM kb_files f "
+        "WHERE f.tenant_id = d.tenant_id AND f.kb_id = d.kb_id "
+        "AND f.filename = COALESCE(d.doc_metadata->>'filename', 'manual_entry')"
+    )
+    op.create_index("ix_knowledge_documents_file_id", "knowledge_documents", ["file_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_knowledge_documents_file_id", table_name="knowledge_documents")
+    op.drop_column("knowledge_documents", "file_id")
+    op.drop_index("ix_kb_files_kb_id", table_name="kb_files")
+    op.drop_index("ix_kb_files_tenant_id", table_name="kb_files")
+    op.drop_constraint("uq_kb_files", "kb_files", type_="unique")
+    op.drop_table("kb_files")
@@ -0,0 +1,33 @@
+"""knowledge base soft delete and purge progress"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0010_kb_soft_delete"
+down_revision = "0009_kb_files"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("knowledge_bases", sa.Column("deleted_at", sa.DateTime(timezone=True), nullable=True))
+    op.add_column("knowledge_bases", sa.Column("purge_total", sa.BigInteger(), nullable=False, server_default="0"))
+    op.add_column("knowledge_bases", sa.Column("purged", sa.BigInteger(), nullable=False, server_default="0"))
+    # Names only need to be unique among live KBs; a KB being purged must not block re-creating it.
+    op.drop_constraint("uq_kb_tenant_name", "knowledge_bases", type_="unique")
+    op.create_index(
+        "uq_kb_tenant_name",
+        "knowledge_bases",
+        ["tenant_id", "name"],
+        unique=True,
+        postgresql_where=sa.text("deleted_at IS NULL"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("uq_kb_tenant_name", table_name="knowledge_bases")
+    op.create_unique_constraint("uq_kb_tenant_name", "knowledge_bases", ["tenant_id", "name"])
+    op.drop_column("knowledge_bases", "purged")
+    op.drop_column("knowledge_bases", "purge_total")
+    op.drop_column("knowledge_bases", "deleted_at")
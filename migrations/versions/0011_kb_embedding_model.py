@@ -0,0 +1,18 @@
+"""per knowledge base embedding model"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0011_kb_embedding_model"
+down_revision = "0010_kb_soft_delete"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("knowledge_bases", sa.Column("embedding_model", sa.String(length=128), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("knowledge_bases", "embedding_model")
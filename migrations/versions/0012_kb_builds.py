@@ -0,0 +1,67 @@
+"""blue/green knowledge base builds"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "0012_kb_builds"
+down_revision = "0011_kb_embedding_model"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "kb_builds",
+        sa.Column("id", sa.BigInteger(), primary_key=True),
+        sa.Column("tenant_id", sa.String(length=64), nullable=False),
+        sa.Column("kb_id", sa.BigInteger(), nullable=False),
+        sa.Column("source_build", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("status", sa.String(length=16), nullable=False, server_default="building"),
+        sa.Column("settings", postgresql.JSONB(), nullable=False),
+        sa.Column("progress", postgresql.JSONB(), nullable=True),
+        sa.Column("validation", postgresql.JSONB(), nullable=True),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()")),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index("ix_kb_builds_tenant_id", "kb_builds", ["tenant_id"])
+    op.create_index("ix_kb_builds_kb_id", "kb_builds", ["kb_id"])
+
+    # Existing chunks form build 0, which every KB starts out serving.
+    op.add_column("knowledge_bases", sa.Column("active_build", sa.BigInteger(), nullable=False, server_default="0"))
+    op.add_column("knowledge_bases", sa.Column("chunk_size", sa.Integer(), nullable=False, server_default="1200"))
+    op.add_column("knowledge_bases", sa.Column("chunk_overlap", sa.Integer(), nullable=False, server_default="200"))
+    op.add_column("knowledge_documents", sa.Column("build_id", sa.BigInteger(), nullable=False, server_default="0"))
+    op.create_index("ix_knowledge_documents_kb_build", "knowledge_documents", ["kb_id", "build_id"])
+    # Generation of the KB when the file was last written; a rebuild re-syncs files newer than its snapshot.
+    op.add_column("kb_files", sa.Column("generation", sa.BigInteger(), nullable=False, server_default="0"))
+
+    # Per-KB quantized indexes must only cover one build: a shadow build may have other dimensions.
+    bind = op.get_bind()
+    legacy = bind.execute(
+        sa.text(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = 'knowledge_documents' "
+            "AND indexname ~ '^ix_knowledge_documents_kb[0-9]+_(halfvec|binary)_[0-9]+$'"
+        )
+    ).all()
+    for name, definition in legacy:
+        kb_id, mode, dims = name[len("ix_knowledge_documents_kb") :].split("_")
+        op.execute(f'DROP INDEX "{name}"')
+        op.execute(
+            definition.replace(f"INDEX {name} ", f"INDEX ix_knowledge_documents_kb{kb_id}_b0_{mode}_{dims} ")
+            + " AND (build_id = 0)"
+        )
+
+
+def downgrade() -> None:
+    op.drop_column("kb_files", "generation")
+    op.drop_index("ix_knowledge_documents_kb_build", table_name="knowledge_documents")
+    op.drop_column("knowledge_documents", "build_id")
+    op.drop_column("knowledge_bases", "chunk_overlap")
+    op.drop_column("knowledge_bases", "chunk_size")
+    op.drop_column("knowledge_bases", "active_build")
+    op.drop_index("ix_kb_builds_kb_id", table_name="kb_builds")
+    op.drop_index("ix_kb_builds_tenant_id", table_name="kb_builds")
+    op.drop_table("kb_builds")
@@ -0,0 +1,30 @@
+"""per-agent last activity summary"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0013_agent_activity"
+down_revision = "0012_kb_builds"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "agent_activity",
+        sa.Column("id", sa.BigInteger(), primary_key=True),
+        sa.Column("tenant_id", sa.String(length=64), nullable=False),
+        sa.Column("agent_id", sa.String(length=128), nullable=False),
+        sa.Column("last_activity", sa.DateTime(timezone=True), nullable=False),
+        sa.UniqueConstraint("tenant_id", "agent_id", name="uq_agent_activity"),
+    )
+    op.execute(
+        "INSERT INTO agent_activity (tenant_id, agent_id, last_activity) "
+        "SELECT tenant_id, agent_id, max(created_at) FROM chat_logs "
+        "WHERE created_at IS NOT NULL GROUP BY tenant_id, agent_id"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("agent_activity")
@@ -0,0 +1,59 @@
+"""per-thread summary rows for thread listings"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0014_thread_summaries"
+down_revision = "0013_agent_activity"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "thread_summaries",
+        sa.Column("id", sa.BigInteger(), primary_key=True),
+        sa.Column("tenant_id", sa.String(length=64), nullable=False),
+        sa.Column("agent_id", sa.String(length=128), nullable=False),
+        sa.Column("thread_id", sa.String(length=128), nullable=False),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.Column("message_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("current_form_id", sa.String(length=128), nullable=True),
+        sa.Column("completed", sa.Boolean(), nullable=False, server_default=sa.false()),
+        sa.Column("last_activity", sa.DateTime(timezone=True), nullable=False),
+        sa.UniqueConstraint("tenant_id", "agent_id", "thread_id", name="uq_thread_summaries"),
+    )
+    # Keyset pages walk this index newest first.
+    op.create_index(
+        "ix_thread_summaries_activity",
+        "thread_summaries",
+        ["tenant_id", "agent_id", sa.text("last_activity DESC"), sa.text("id DESC")],
+    )
+    op.execute(
+        """
+        INSERT INTO thread_summaries
+            (tenant_id, agent_id, thread_id, version, message_count, current_form_id, completed, last_activity)
+        SELECT t.tenant_id, t.agent_id, t.thread_id, t.version, t.message_count,
+               s.state ->> 'current_form_id', COALESCE((s.state ->> 'completed')::boolean, false), t.last_activity
+        FROM (
+            SELECT tenant_id, agent_id, thread_id, max(version) AS version, count(*) AS message_count,
+                   max(created_at) AS last_activity
+            FROM chat_logs
+            GROUP BY tenant_id, agent_id, thread_id
+        ) AS t
+        LEFT JOIN LATERAL (
+            SELECT state FROM chat_logs AS c
+            WHERE c.tenant_id = t.tenant_id AND c.agent_id = t.agent_id AND c.thread_id = t.thread_id
+              AND c.state IS NOT NULL
+            ORDER BY c.created_at DESC, c.id DESC
+            LIMIT 1
+        ) AS s ON true
+        WHERE t.last_activity IS NOT NULL
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_thread_summaries_activity", table_name="thread_summaries")
+    op.drop_table("thread_summaries")
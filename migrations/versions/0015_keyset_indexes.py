@@ -0,0 +1,36 @@
+"""composite indexes for keyset pagination"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0015_keyset_indexes"
+down_revision = "0014_thread_summaries"
+branch_labels = None
+depends_on = None
+
+# Each listing filters on the leading columns and pages on (created_at, id) in the listed order.
+INDEXES = {
+    "ix_form_submissions_page": ("form_submissions", ["tenant_id", "agent_id", "created_at DESC", "id DESC"]),
+    "ix_trace_logs_page": ("trace_logs", ["tenant_id", "agent_id", "created_at DESC", "id DESC"]),
+    "ix_trace_logs_thread_page": ("trace_logs", ["tenant_id", "agent_id", "thread_id", "created_at DESC", "id DESC"]),
+    "ix_chat_logs_thread_page": ("chat_logs", ["tenant_id", "agent_id", "thread_id", "created_at", "id"]),
+}
+
+
+def _concurrently(table: str) -> str:
+    # Partitioned tables (chat_logs and trace_logs after 0017) cannot build or drop an index concurrently.
+    kind = op.get_bind().execute(sa.text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:t)"), {"t": table})
+    return "" if kind.scalar() == "p" else " CONCURRENTLY"
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, (table, columns) in INDEXES.items():
+            op.execute(f"CREATE INDEX{_concurrently(table)} IF NOT EXISTS {name} ON {table} ({', '.join(columns)})")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, (table, _) in INDEXES.items():
+            op.execute(f"DROP INDEX{_concurrently(table)} IF EXISTS {name}")
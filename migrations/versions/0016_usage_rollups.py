@@ -0,0 +1,75 @@
+"""hourly/daily usage rollups"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "0016_usage_rollups"
+down_revision = "0015_keyset_indexes"
+branch_labels = None
+depends_on = None
+
+COUNTERS = (
+    "requests",
+    "sessions",
+    "new_sessions",
+    "llm_calls",
+    "prompt_tokens",
+    "completion_tokens",
+    "total_tokens",
+    "kb_queries",
+    "submissions",
+    "speculative_used",
+    "speculative_wasted",
+)
+
+
+def upgrade() -> None:
+    op.create_table(
+        "usage_rollups",
+        sa.Column("id", sa.BigInteger(), primary_key=True),
+        sa.Column("tenant_id", sa.String(length=64), nullable=False),
+        sa.Column("agent_id", sa.String(length=128), nullable=False),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.Column("granularity", sa.String(length=8), nullable=False),
+        sa.Column("bucket", sa.DateTime(timezone=True), nullable=False),
+        *[sa.Column(name, sa.BigInteger(), nullable=False, server_default="0") for name in COUNTERS],
+        sa.Column("sessions_sketch", postgresql.ARRAY(sa.SmallInteger()), nullable=True),
+        sa.UniqueConstraint("tenant_id", "agent_id", "granularity", "bucket", "version", name="uq_usage_rollups"),
+    )
+    op.create_index("ix_usage_rollups_tenant_bucket", "usage_rollups", ["tenant_id", "granularity", "bucket"])
+
+    # Requests and sessions can be rebuilt from chat_logs; the other counters start with the rollups.
+    for granularity in ("hour", "day"):
+        op.execute(
+            f"""
+            INSERT INTO usage_rollups (tenant_id, agent_id, version, granularity, bucket, requests, sessions, new_sessions)
+            SELECT c.tenant_id, c.agent_id, c.version, '{granularity}',
+                   date_trunc('{granularity}', c.created_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+                   count(*) FILTER (WHERE c.role = 'user'),
+                   count(DISTINCT c.thread_id),
+                   count(DISTINCT c.thread_id) FILTER (WHERE c.created_at = f.first_at)
+            FROM chat_logs AS c
+            JOIN (
+                SELECT tenant_id, agent_id, thread_id, min(created_at) AS first_at
+                FROM chat_logs GROUP BY tenant_id, agent_id, thread_id
+            ) AS f USING (tenant_id, agent_id, thread_id)
+            WHERE c.created_at IS NOT NULL
+            GROUP BY 1, 2, 3, 4, 5
+            """
+        )
+    op.execute(
+        """
+        INSERT INTO usage_rollups (tenant_id, agent_id, version, granularity, bucket, requests, sessions, new_sessions)
+        SELECT tenant_id, agent_id, version, 'all', '1970-01-01 00:00:00+00',
+               sum(requests), sum(new_sessions), sum(new_sessions)
+        FROM usage_rollups WHERE granularity = 'day'
+        GROUP BY tenant_id, agent_id, version
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_usage_rollups_tenant_bucket", table_name="usage_rollups")
+    op.drop_table("usage_rollups")
@@ -0,0 +1,116 @@
+"""monthly range partitions for chat_logs and trace_logs"""
+
+from datetime import datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0017_partition_logs"
+down_revision = "0016_usage_rollups"
+branch_labels = None
+depends_on = None
+
+MONTHS_AHEAD = 3
+
+COLUMNS = {
+    "chat_logs": (
+        "tenant_id varchar(64) NOT NULL, agent_id varchar(128) NOT NULL, version integer NOT NULL, "
+        "thread_id varchar(128) NOT NULL, role varchar(32) NOT NULL, content text NOT NULL, state jsonb"
+    ),
+    "trace_logs": (
+        "tenant_id varchar(64) NOT NULL, agent_id varchar(128) NOT NULL, version integer NOT NULL, "
+        "thread_id varchar(128) NOT NULL, trace_id varchar(128) NOT NULL, data jsonb NOT NULL"
+    ),
+}
+COPY_COLUMNS = {
+    "chat_logs": "id, tenant_id, agent_id, version, thread_id, role, content, state",
+    "trace_logs": "id, tenant_id, agent_id, version, thread_id, trace_id, data",
+}
+INDEXES = {
+    "chat_logs": {
+        "ix_chat_logs_tenant_id": "tenant_id",
+        "ix_chat_logs_agent_id": "agent_id",
+        "ix_chat_logs_version": "version",
+        "ix_chat_logs_thread_id": "thread_id",
+        "ix_chat_logs_thread_page": "tenant_id, agent_id, thread_id, created_at, id",
+    },
+    "trace_logs": {
+        "ix_trace_logs_tenant_id": "tenant_id",
+        "ix_trace_logs_agent_id": "agent_id",
+        "ix_trace_logs_version": "version",
+        "ix_trace_logs_thread_id": "thread_id",
+        "ix_trace_logs_trace_id": "trace_id",
+        "ix_trace_logs_page": "tenant_id, agent_id, created_at DESC, id DESC",
+        "ix_trace_logs_thread_page": "tenant_id, agent_id, thread_id, created_at DESC, id DESC",
+    },
+}
+
+
+def _add_month(year: int, month: int) -> tuple:
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def _partition_months(table: str) -> list:
+    bind = op.get_bind()
+    oldest = bind.execute(sa.text(f"SELECT min(created_at) FROM {table}")).scalar()
+    now = datetime.now(timezone.utc)
+    first = oldest.astimezone(timezone.utc) if oldest else now
+    last = (now.year, now.month)
+    for _ in range(MONTHS_AHEAD):
+        last = _add_month(*last)
+    months = [(first.year, first.month)]
+    while months[-1] < last:
+        months.append(_add_month(*months[-1]))
+    return months
+
+
+def _swap_indexes(table: str, old: str) -> None:
+    for name, columns in INDEXES[table].items():
+        op.execute(f"DROP INDEX IF EXISTS {name}")
+        op.execute(f"CREATE INDEX {name} ON {table} ({columns})")
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+    op.execute(f"DROP TABLE {old}")
+
+
+def upgrade() -> None:
+    for table in COLUMNS:
+        months = _partition_months(table)
+        op.execute(f"ALTER TABLE {table} RENAME TO {table}_unpartitioned")
+        op.execute(f"ALTER TABLE {table}_unpartitioned RENAME CONSTRAINT {table}_pkey TO {table}_unpartitioned_pkey")
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+        # The partition key has to be part of the primary key; ids still come from the table's sequence.
+        op.execute(
+            f"CREATE TABLE {table} (id bigint NOT NULL DEFAULT nextval('{table}_id_seq'), {COLUMNS[table]}, "
+            f"created_at timestamptz NOT NULL DEFAULT now(), CONSTRAINT {table}_pkey PRIMARY KEY (id, created_at)) "
+            "PARTITION BY RANGE (created_at)"
+        )
+        for year, month in months:
+            upper = _add_month(year, month)
+            op.execute(
+                f"CREATE TABLE {table}_p{year:04d}{month:02d} PARTITION OF {table} FOR VALUES "
+                f"FROM ('{year:04d}-{month:02d}-01 00:00:00+00') TO ('{upper[0]:04d}-{upper[1]:02d}-01 00:00:00+00')"
+            )
+        # Catches rows outside the created months if maintenance falls behind; it moves them out again.
+        op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+        op.execute(
+            f"INSERT INTO {table} ({COPY_COLUMNS[table]}, created_at) "
+            f"SELECT {COPY_COLUMNS[table]}, coalesce(created_at, now()) FROM {table}_unpartitioned"
+        )
+        _swap_indexes(table, f"{table}_unpartitioned")
+
+
+def downgrade() -> None:
+    for table in COLUMNS:
+        op.execute(f"ALTER TABLE {table} RENAME TO {table}_partitioned")
+        op.execute(f"ALTER TABLE {table}_partitioned RENAME CONSTRAINT {table}_pkey TO {table}_partitioned_pkey")
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+        op.execute(
+            f"CREATE TABLE {table} (id bigint NOT NULL DEFAULT nextval('{table}_id_seq'), {COLUMNS[table]}, "
+            f"created_at timestamptz DEFAULT now(), CONSTRAINT {table}_pkey PRIMARY KEY (id))"
+        )
+        op.execute(
+            f"INSERT INTO {table} ({COPY_COLUMNS[table]}, created_at) "
+            f"SELECT {COPY_COLUMNS[table]}, created_at FROM {table}_partitioned"
+        )
+        _swap_indexes(table, f"{table}_partitioned")
@@ -0,0 +1,22 @@
+"""row versions for upserted drafts, thread states and oauth credentials"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0018_row_versions"
+down_revision = "0017_partition_logs"
+branch_labels = None
+depends_on = None
+
+TABLES = ("agent_drafts", "thread_states", "oauth_credentials")
+
+
+def upgrade() -> None:
+    for table in TABLES:
+        op.add_column(table, sa.Column("row_version", sa.BigInteger(), nullable=False, server_default="1"))
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.drop_column(table, "row_version")
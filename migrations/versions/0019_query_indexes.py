@@ -0,0 +1,48 @@
+"""composite indexes for submission filters, drop unused single-column indexes"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0019_query_indexes"
+down_revision = "0018_row_versions"
+branch_labels = None
+depends_on = None
+
+# Submission listings filter by form or thread inside a tenant/agent and page on (created_at, id).
+CREATE = {
+    "ix_form_submissions_form_page": ("form_submissions", "tenant_id, agent_id, form_id, created_at DESC, id DESC"),
+    "ix_form_submissions_thread_page": (
+        "form_submissions",
+        "tenant_id, agent_id, thread_id, created_at DESC, id DESC",
+    ),
+}
+# Single-column indexes no query uses on its own: each is a prefix of a composite index or
+# unique constraint, or its column is only ever filtered together with tenant and agent.
+DROP = {
+    "chat_logs": ("tenant_id", "agent_id", "version", "thread_id"),
+    "trace_logs": ("tenant_id", "agent_id", "version", "thread_id"),
+    "form_submissions": ("tenant_id", "agent_id", "version", "thread_id", "form_id", "delivery_type"),
+    "thread_states": ("tenant_id", "agent_id", "version", "thread_id"),
+}
+# Partitioned tables cannot drop an index concurrently; dropping one is a catalogue change anyway.
+PARTITIONED = {"chat_logs", "trace_logs"}
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, (table, columns) in CREATE.items():
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})")
+        for table, columns in DROP.items():
+            concurrently = "" if table in PARTITIONED else " CONCURRENTLY"
+            for column in columns:
+                op.execute(f"DROP INDEX{concurrently} IF EXISTS ix_{table}_{column}")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for table, columns in DROP.items():
+            concurrently = "" if table in PARTITIONED else " CONCURRENTLY"
+            for column in columns:
+                op.execute(f"CREATE INDEX{concurrently} IF NOT EXISTS ix_{table}_{column} ON {table} ({column})")
+        for name in CREATE:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
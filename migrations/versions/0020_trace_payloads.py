@@ -0,0 +1,107 @@
+"""trace summary columns and compressed trace payloads"""
+
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0020_trace_payloads"
+down_revision = "0019_query_indexes"
+branch_labels = None
+depends_on = None
+
+SUMMARY_COLUMNS = (
+    "status varchar(16) NOT NULL DEFAULT 'ok'",
+    "latency_ms integer",
+    "prompt_tokens integer NOT NULL DEFAULT 0",
+    "completion_tokens integer NOT NULL DEFAULT 0",
+    "total_tokens integer NOT NULL DEFAULT 0",
+    "nodes varchar(64)[] NOT NULL DEFAULT '{}'",
+    "input_preview text",
+    "output_preview text",
+)
+EVENTS = "jsonb_array_elements(CASE WHEN jsonb_typeof(data->'events') = 'array' THEN data->'events' ELSE '[]' END)"
+# Existing rows keep their JSONB document (scripts/offload_trace_payloads.py compresses it away); their token
+# counts come from the recorded usage of the turn's last LLM call, which is all the document keeps at top level.
+BACKFILL = f"""
+UPDATE trace_logs SET
+    status = CASE WHEN EXISTS (
+        SELECT 1 FROM {EVENTS} AS e
+        WHERE e->>'event' IN ('kb_search_failed', 'llm_answer_failed', 'tool_missing')
+           OR (e->>'event' = 'tool_call' AND jsonb_typeof(e->'result') = 'object' AND e->'result' ? 'error')
+    ) THEN 'error' ELSE 'ok' END,
+    prompt_tokens = coalesce((data->'tokens'->>'prompt_tokens')::integer, 0),
+    completion_tokens = coalesce((data->'tokens'->>'completion_tokens')::integer, 0),
+    total_tokens = coalesce((data->'tokens'->>'total_tokens')::integer, 0),
+    nodes = ARRAY(
+        SELECT left(e.value->>'node', 64) FROM {EVENTS} WITH ORDINALITY AS e(value, position)
+        WHERE e.value->>'node' IS NOT NULL GROUP BY e.value->>'node' ORDER BY min(e.position)
+    ),
+    input_preview = left(data->>'input', 200),
+    output_preview = left(data->>'output', 200)
+WHERE data IS NOT NULL
+"""
+
+
+def upgrade() -> None:
+    for column in SUMMARY_COLUMNS:
+        op.execute(f"ALTER TABLE trace_logs ADD COLUMN {column}")
+    op.execute("ALTER TABLE trace_logs ALTER COLUMN data DROP NOT NULL")
+    op.execute(BACKFILL)
+    op.execute(
+        "CREATE INDEX ix_trace_logs_errors ON trace_logs (tenant_id, agent_id, created_at DESC, id DESC) "
+        "WHERE status = 'error'"
+    )
+
+    op.execute(
+        "CREATE TABLE trace_payloads (trace_id varchar(128) NOT NULL, tenant_id varchar(64) NOT NULL, "
+        "agent_id varchar(128) NOT NULL, codec varchar(16) NOT NULL, raw_bytes integer NOT NULL, "
+        "payload bytea NOT NULL, created_at timestamptz NOT NULL DEFAULT now(), "
+        "CONSTRAINT trace_payloads_pkey PRIMARY KEY (trace_id, created_at)) PARTITION BY RANGE (created_at)"
+    )
+    # Payloads are already compressed; keep TOAST from trying (and failing) to compress them again.
+    op.execute("ALTER TABLE trace_payloads ALTER COLUMN payload SET STORAGE EXTERNAL")
+    # One partition for each of trace_logs' months, so both tables expire together.
+    months = op.get_bind().execute(
+        sa.text(
+            "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = 'trace_logs'::regclass AND child.relname ~ '^trace_logs_p[0-9]{6}$'"
+        )
+    ).all()
+    for name, bounds in months:
+        op.execute(f"CREATE TABLE trace_payloads_{name[len('trace_logs_'):]} PARTITION OF trace_payloads {bounds}")
+    op.execute("CREATE TABLE trace_payloads_default PARTITION OF trace_payloads DEFAULT")
+
+
+def downgrade() -> None:
+    from app.trace_payloads import decode_payload
+
+    bind = op.get_bind()
+    # Put the offloaded documents back into trace_logs.data, a batch at a time.
+    while True:
+        rows = bind.execute(
+            sa.text(
+                "SELECT p.trace_id, p.created_at, p.codec, p.payload FROM trace_payloads p JOIN trace_logs t "
+                "ON t.trace_id = p.trace_id AND t.created_at = p.created_at WHERE t.data IS NULL LIMIT 500"
+            )
+        ).all()
+        if not rows:
+            break
+        bind.execute(
+            sa.text(
+                "UPDATE trace_logs SET data = CAST(:data AS jsonb) "
+                "WHERE trace_id = :trace_id AND created_at = :created_at"
+            ),
+            [
+                {"data": json.dumps(decode_payload(codec, payload)), "trace_id": trace_id, "created_at": created_at}
+                for trace_id, created_at, codec, payload in rows
+            ],
+        )
+    op.execute("DROP TABLE trace_payloads")
+    op.execute("DELETE FROM trace_logs WHERE data IS NULL")
+    op.execute("ALTER TABLE trace_logs ALTER COLUMN data SET NOT NULL")
+    op.execute("DROP INDEX IF EXISTS ix_trace_logs_errors")
+    for column in SUMMARY_COLUMNS:
+        op.execute(f"ALTER TABLE trace_logs DROP COLUMN {column.split()[0]}")
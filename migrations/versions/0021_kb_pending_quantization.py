@@ -0,0 +1,18 @@
+"""quantization change waiting for its index build"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0021_kb_pending_quantization"
+down_revision = "0020_trace_payloads"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("knowledge_bases", sa.Column("pending_quantization", sa.String(16), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("knowledge_bases", "pending_quantization")
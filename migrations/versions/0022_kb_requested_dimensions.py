@@ -0,0 +1,30 @@
+"""embedding dimensions requested from the provider, kept apart from the stored vector size"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0022_kb_requested_dimensions"
+down_revision = "0021_kb_pending_quantization"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("knowledge_bases", sa.Column("requested_dimensions", sa.Integer(), nullable=True))
+    # embedding_dimensions used to hold either the requested truncation or the observed native size. Only
+    # text-embedding-3 models accept a dimensions argument, and for them re-sending the native size is harmless.
+    op.execute(
+        "UPDATE knowledge_bases SET requested_dimensions = embedding_dimensions "
+        "WHERE embedding_model LIKE 'text-embedding-3%' AND embedding_dimensions IS NOT NULL"
+    )
+    # Running rebuilds copied the same value into their settings.
+    op.execute(
+        "UPDATE kb_builds SET settings = settings || jsonb_build_object('embedding_dimensions', NULL) "
+        "WHERE coalesce(settings->>'embedding_model', '') NOT LIKE 'text-embedding-3%' "
+        "AND settings->>'embedding_dimensions' IS NOT NULL AND status IN ('building', 'validating')"
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("knowledge_bases", "requested_dimensions")
@@ -0,0 +1,19 @@
+"""(tenant, agent) index on trace_payloads for retention purges"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0023_trace_payloads_agent_index"
+down_revision = "0022_kb_requested_dimensions"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Log maintenance lists the agents present in each partition by skipping through this index.
+    # trace_payloads is partitioned, so the index cannot be built concurrently.
+    op.execute("CREATE INDEX IF NOT EXISTS ix_trace_payloads_agent ON trace_payloads (tenant_id, agent_id)")
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_trace_payloads_agent")
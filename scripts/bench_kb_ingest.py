@@ -0,0 +1,98 @@
+"""Benchmark peak memory of KB text extraction + chunking on a synthetic PDF.
+
+Usage: python scripts/bench_kb_ingest.py [--pages 500]
+
+Compares the legacy path (join every page, then chunk into a list) with the
+streaming path (`iter_upload_pages` -> `iter_chunks`). No embeddings are called.
+"""
+
+import argparse
+import io
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+from app.kb import chunk_text, iter_chunks, iter_upload_pages, read_text_from_upload
+
+WORDS = (
+    "policy coverage claim premium deductible renewal invoice account customer support "
+    "service request escalation refund shipment warranty contract agreement schedule"
+).split()
+
+
+def build_pdf(pages: int, lines_per_page: int = 45) -> bytes:
+    """Write a minimal text-only PDF without third-party writers."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for page in range(pages):
+        lines = []
+        for line in range(lines_per_page):
+            words = [WORDS[(page * 7 + line * 3 + i) % len(WORDS)] for i in range(12)]
+            lines.append(f"({' '.join(words)} p{page + 1}l{line + 1}) Tj T*")
+        stream = ("BT /F1 9 Tf 12 TL 40 780 Td " + " ".join(lines) + " ET").encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids).encode("latin-1")
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % pages
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def _measure(label: str, fn) -> None:
+    tracemalloc.start()
+    started = time.perf_counter()
+    chunks = fn()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<10} chunks={chunks:<6} time={elapsed:6.2f}s peak={peak / 1024 / 1024:7.2f} MiB")
+
+
+def legacy(content: bytes) -> int:
+    return len(chunk_text(read_text_from_upload("bench.pdf", content)))
+
+
+def streaming(content: bytes) -> int:
+    count = 0
+    for _ in iter_chunks(iter_upload_pages("bench.pdf", io.BytesIO(content))):
+        count += 1
+    return count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=500)
+    args = parser.parse_args()
+    content = build_pdf(args.pages)
+    print(f"pdf pages={args.pages} size={len(content) / 1024 / 1024:.2f} MiB")
+    _measure("legacy", lambda: legacy(content))
+    _measure("streaming", lambda: streaming(content))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Compare KB quantization modes: recall@k against exact search, query latency and index size.
+
+Usage: POSTGRES_DSN=... python scripts/bench_kb_quantization.py [--docs 20000] [--dims 1536]
+
+Loads a synthetic clustered corpus into one throwaway KB per mode, builds the
+per-KB index and runs the same queries through `search_kb_documents`. Requires
+pgvector >= 0.7 (halfvec, binary_quantize). The KBs are purged afterwards.
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+from sqlalchemy import text
+
+from app.db import session_scope
+from app.db_models import KnowledgeBase, KnowledgeDocument
+from app.kb_purge import purge_knowledge_base
+from app.storage import (
+    KB_QUANTIZATION_MODES,
+    create_knowledge_base,
+    delete_knowledge_base,
+    ensure_kb_quantized_index,
+    search_kb_documents,
+)
+
+TENANT = "bench-quantization"
+
+
+def _normalize(vector):
+    norm = sum(value * value for value in vector) ** 0.5 or 1.0
+    return [value / norm for value in vector]
+
+
+def build_corpus(docs: int, dims: int, clusters: int, seed: int = 7):
+    rng = random.Random(seed)
+    centers = [[rng.gauss(0, 1) for _ in range(dims)] for _ in range(clusters)]
+    corpus = []
+    for idx in range(docs):
+        center = centers[idx % clusters]
+        corpus.append(_normalize([value + rng.gauss(0, 0.6) for value in center]))
+    queries = []
+    for idx in range(64):
+        center = centers[rng.randrange(clusters)]
+        queries.append(_normalize([value + rng.gauss(0, 0.6) for value in center]))
+    return corpus, queries
+
+
+def load_kb(mode: str, corpus, batch: int = 1000) -> int:
+    kb_id = create_knowledge_base(TENANT, f"bench-{mode}", "", "pgvector", quantization=mode)
+    for start in range(0, len(corpus), batch):
+        with session_scope() as session:
+            session.add_all(
+                KnowledgeDocument(
+                    tenant_id=TENANT,
+                    kb_id=kb_id,
+                    content=f"doc {start + offset}",
+                    embedding=vector,
+                    doc_metadata={"doc": start + offset},
+                )
+                for offset, vector in enumerate(corpus[start : start + batch])
+            )
+    with session_scope() as session:
+        session.query(KnowledgeBase).filter(KnowledgeBase.id == kb_id).update(
+            {"embedding_dimensions": len(corpus[0])}
+        )
+    return kb_id
+
+
+def index_size(index_name) -> int:
+    if not index_name:
+        return 0
+    with session_scope() as session:
+        return int(session.execute(text("SELECT pg_relation_size(CAST(:name AS regclass))"), {"name": index_name}).scalar())
+
+
+def run(mode: str, kb_id: int, queries, k: int, exact):
+    latencies = []
+    hits = 0
+    for query, truth in zip(queries, exact):
+        started = time.perf_counter()
+        results = search_kb_documents(TENANT, kb_id, query, limit=k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        found = {row["metadata"]["doc"] for row in results}
+        hits += len(found & truth)
+    return hits / (k * len(queries)), statistics.median(latencies)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--dims", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    corpus, queries = build_corpus(args.docs, args.dims, args.clusters)
+    kb_ids = {mode: load_kb(mode, corpus) for mode in KB_QUANTIZATION_MODES}
+    try:
+        exact = [
+            {row["metadata"]["doc"] for row in search_kb_documents(TENANT, kb_ids["none"], query, limit=args.k)}
+            for query in queries
+        ]
+        table_bytes = len(corpus) * args.dims * 4
+        print(f"docs={args.docs} dims={args.dims} k={args.k} raw vectors={table_bytes / 1024 / 1024:.1f} MiB")
+        for mode, kb_id in kb_ids.items():
+            index_name = ensure_kb_quantized_index(TENANT, kb_id)
+            recall, p50 = run(mode, kb_id, queries, args.k, exact)
+            size = index_size(index_name) / 1024 / 1024
+            print(f"{mode:<8} recall@{args.k}={recall:.3f} p50={p50:7.2f} ms index={size:8.1f} MiB")
+    finally:
+        for kb_id in kb_ids.values():
+            delete_knowledge_base(TENANT, kb_id)
+            purge_knowledge_base(TENANT, kb_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Benchmark the agents listing against the per-agent query loop it replaced.
+
+Usage: POSTGRES_DSN=... python scripts/bench_list_agents.py [--agents 300] [--versions 3] [--messages 2000]
+
+Seeds a throwaway tenant with drafts, published versions and chat logs (plus
+the agent_activity rows log_chat maintains), then times the old loop (two
+queries per draft, the second sorting chat_logs) and `list_agents`, counting
+the statements each one sends. The tenant's rows are deleted afterwards.
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+from sqlalchemy import delete, desc, event, select, text
+
+from app.db import get_engine, session_scope
+from app.db_models import AgentActivity, AgentDraft, AgentVersion, ChatLog
+from app.storage import list_agents
+
+TENANT = "bench-list-agents"
+
+
+def seed(agents: int, versions: int, messages: int) -> None:
+    params = {"tenant": TENANT, "agents": agents, "versions": versions, "messages": messages}
+    # Counts are cast to bigint: psycopg sends small ints as smallint, which overflows in the products.
+    with session_scope() as session:
+        session.execute(
+            text(
+                "INSERT INTO agent_drafts (tenant_id, agent_id, config) "
+                "SELECT :tenant, 'agent-' || a, jsonb_build_object('project', jsonb_build_object("
+                "'project_name', 'Agent ' || a, 'system_message', 'You help with case ' || a)) "
+                "FROM generate_series(1, CAST(:agents AS bigint)) AS a"
+            ),
+            params,
+        )
+        # Every other agent is published.
+        session.execute(
+            text(
+                "INSERT INTO agent_versions (tenant_id, agent_id, version, config) "
+                "SELECT :tenant, 'agent-' || a, v, '{}'::jsonb "
+                "FROM generate_series(1, CAST(:agents AS bigint), 2) AS a, "
+                "generate_series(1, CAST(:versions AS bigint)) AS v"
+            ),
+            params,
+        )
+        session.execute(
+            text(
+                "INSERT INTO chat_logs (tenant_id, agent_id, version, thread_id, role, content, created_at) "
+                "SELECT :tenant, 'agent-' || (1 + m % CAST(:agents AS bigint)), 1, 'thread-' || (m / 20), "
+                "CASE WHEN m % 2 = 0 THEN 'user' ELSE 'assistant' END, 'message ' || m, "
+                "now() - make_interval(secs => m) "
+                "FROM generate_series(1, CAST(:agents AS bigint) * CAST(:messages AS bigint)) AS m"
+            ),
+            params,
+        )
+        session.execute(
+            text(
+                "INSERT INTO agent_activity (tenant_id, agent_id, last_activity) "
+                "SELECT tenant_id, agent_id, max(created_at) FROM chat_logs WHERE tenant_id = :tenant "
+                "GROUP BY tenant_id, agent_id"
+            ),
+            params,
+        )
+    with session_scope() as session:
+        session.execute(text("ANALYZE agent_drafts, agent_versions, chat_logs, agent_activity"))
+
+
+def cleanup() -> None:
+    with session_scope() as session:
+        for model in (ChatLog, AgentVersion, AgentDraft, AgentActivity):
+            session.execute(delete(model).where(model.tenant_id == TENANT))
+
+
+def list_agents_per_draft(tenant_id: str) -> List[Dict[str, Any]]:
+    """The previous implementation: one query for the drafts, then two per draft."""
+    with session_scope() as session:
+        drafts = session.execute(select(AgentDraft).where(AgentDraft.tenant_id == tenant_id)).scalars().all()
+        results = []
+        for draft in drafts:
+            latest = session.execute(
+                select(AgentVersion)
+                .where(AgentVersion.tenant_id == tenant_id, AgentVersion.agent_id == draft.agent_id)
+                .order_by(desc(AgentVersion.version))
+                .limit(1)
+            ).scalars().first()
+            last_log = session.execute(
+                select(ChatLog.created_at)
+                .where(ChatLog.tenant_id == tenant_id, ChatLog.agent_id == draft.agent_id)
+                .order_by(desc(ChatLog.created_at))
+                .limit(1)
+            ).scalars().first()
+            results.append(
+                {
+                    "id": draft.agent_id,
+                    "status": "Active" if latest else "Draft",
+                    "last_run": last_log.isoformat() if last_log else None,
+                }
+            )
+        return results
+
+
+def measure(fn, runs: int):
+    statements = []
+    engine = get_engine()
+
+    def count(*_args, **_kwargs) -> None:
+        statements[-1] += 1
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        latencies = []
+        for _ in range(runs):
+            statements.append(0)
+            started = time.perf_counter()
+            result = fn(TENANT)
+            latencies.append((time.perf_counter() - started) * 1000)
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    return result, statistics.median(latencies), statements[-1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--agents", type=int, default=300)
+    parser.add_argument("--versions", type=int, default=3)
+    parser.add_argument("--messages", type=int, default=2000, help="chat log rows per agent")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    cleanup()
+    seed(args.agents, args.versions, args.messages)
+    try:
+        print(f"agents={args.agents} versions={args.versions} chat_logs={args.agents * args.messages}")
+        old, old_ms, old_statements = measure(list_agents_per_draft, args.runs)
+        new, new_ms, new_statements = measure(list_agents, args.runs)
+        expected = {row["id"]: (row["status"], row["last_run"]) for row in old}
+        mismatches = sum(expected.get(row["id"]) != (row["status"], row["last_run"]) for row in new)
+        print(f"per-draft  p50={old_ms:9.2f} ms statements={old_statements}")
+        print(f"list_agents p50={new_ms:9.2f} ms statements={new_statements} mismatches={mismatches}")
+    finally:
+        cleanup()
+
+
+if __name__ == "__main__":
+    main()
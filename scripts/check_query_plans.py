@@ -0,0 +1,254 @@
+"""Plan regression check: every storage read on the large tables must be index-driven.
+
+Usage: POSTGRES_DSN=... python scripts/check_query_plans.py [--agents 50] [--rows 2000] [--keep]
+
+Seeds a throwaway tenant with chat logs, traces and their payloads, submissions,
+thread states and summaries and usage rollups (--rows per agent), runs ANALYZE, then calls each
+storage read function while capturing the SQL it sends. Every captured
+statement is EXPLAINed with its parameters and fails the check if the plan
+sequentially scans a relation with at least --min-rows rows, or sorts more than
+--min-rows rows (a listing that cannot walk an index in page order). Exits 1 on
+any failure. The tenant's rows are deleted afterwards unless --keep is given.
+"""
+
+import argparse
+import re
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+from sqlalchemy import delete, event, text
+
+from app.db import get_engine, get_read_engine, session_scope
+from app.db_models import (
+    AgentActivity,
+    AgentDraft,
+    AgentVersion,
+    ChatLog,
+    FormSubmission,
+    ThreadState,
+    ThreadSummary,
+    TraceLog,
+    TracePayload,
+    UsageRollup,
+)
+from app.storage import (
+    LOG_TABLES,
+    get_thread_messages,
+    get_thread_state_entry,
+    get_trace,
+    get_usage_metrics,
+    list_agents,
+    list_form_submissions,
+    list_log_partition_agents,
+    list_threads,
+    list_traces,
+    list_usage_rollups,
+    stream_form_submissions,
+)
+
+PARTITION = re.compile(r"^(chat_logs|trace_logs|trace_payloads)_(p\d{6}|default)$")
+TENANT = "plan-check"
+AGENT = "agent-1"
+MODELS = (
+    ChatLog,
+    TraceLog,
+    TracePayload,
+    FormSubmission,
+    ThreadState,
+    ThreadSummary,
+    UsageRollup,
+    AgentActivity,
+    AgentVersion,
+    AgentDraft,
+)
+
+
+def seed(agents: int, rows: int) -> None:
+    # Counts are cast to bigint: psycopg sends small ints as smallint, which overflows in the products.
+    params = {"tenant": TENANT, "agents": agents, "rows": rows}
+    statements = [
+        "INSERT INTO agent_drafts (tenant_id, agent_id, config) "
+        "SELECT :tenant, 'agent-' || a, '{}'::jsonb FROM generate_series(1, CAST(:agents AS bigint)) AS a",
+        "INSERT INTO agent_versions (tenant_id, agent_id, version, config) "
+        "SELECT :tenant, 'agent-' || a, 1, '{}'::jsonb FROM generate_series(1, CAST(:agents AS bigint)) AS a",
+        # 20 messages per thread, spread over the last 60 days (several monthly partitions).
+        "INSERT INTO chat_logs (tenant_id, agent_id, version, thread_id, role, content, created_at) "
+        "SELECT :tenant, 'agent-' || a, 1, 'thread-' || (m / 20), "
+        "CASE WHEN m % 2 = 0 THEN 'user' ELSE 'assistant' END, 'message ' || m, "
+        "now() - make_interval(secs => (m * 5184000 / CAST(:rows AS bigint))::int) "
+        "FROM generate_series(1, CAST(:agents AS bigint)) AS a, generate_series(1, CAST(:rows AS bigint)) AS m",
+        # Every 50th trace failed; each has its (placeholder) payload at the same created_at.
+        "INSERT INTO trace_logs (tenant_id, agent_id, version, thread_id, trace_id, status, input_preview, created_at) "
+        "SELECT :tenant, 'agent-' || a, 1, 'thread-' || (m / 10), 'trace-' || a || '-' || m, "
+        "CASE WHEN m % 50 = 0 THEN 'error' ELSE 'ok' END, 'message ' || m, "
+        "now() - make_interval(secs => (m * 5184000 / CAST(:rows AS bigint))::int) "
+        "FROM generate_series(1, CAST(:agents AS bigint)) AS a, generate_series(1, CAST(:rows AS bigint)) AS m",
+        "INSERT INTO trace_payloads (trace_id, tenant_id, agent_id, codec, raw_bytes, payload, created_at) "
+        "SELECT trace_id, tenant_id, agent_id, 'zlib', 2, '\\x789cabae0500017500f9'::bytea, created_at "
+        "FROM trace_logs WHERE tenant_id = :tenant",
+        "INSERT INTO form_submissions (tenant_id, agent_id, version, thread_id, form_id, form_name, delivery_type, "
+        "payload, delivery_status, created_at) "
+        "SELECT :tenant, 'agent-' || a, 1, 'thread-' || (m / 2), 'form-' || (m % 10), 'Form', "
+        "CASE WHEN m % 3 = 0 THEN 'email' ELSE 'sheets' END, jsonb_build_object('name', 'n' || m), 'sent', "
+        "now() - make_interval(secs => (m * 5184000 / CAST(:rows AS bigint))::int) "
+        "FROM generate_series(1, CAST(:agents AS bigint)) AS a, generate_series(1, CAST(:rows AS bigint)) AS m",
+        "INSERT INTO thread_states (tenant_id, agent_id, version, thread_id, state) "
+        "SELECT :tenant, 'agent-' || a, 1, 'thread-' || t, '{}'::jsonb "
+        "FROM generate_series(1, CAST(:agents AS bigint)) AS a, generate_series(1, CAST(:rows AS bigint)) AS t",
+        "INSERT INTO thread_summaries (tenant_id, agent_id, thread_id, version, message_count, current_form_id, "
+        "completed, last_activity) "
+        "SELECT :tenant, 'agent-' || a, 'thread-' || t, 1, 20, 'form-' || (t % 10), t % 4 = 0, "
+        "now() - make_interval(secs => (t * 5184000 / CAST(:rows AS bigint))::int) "
+        "FROM generate_series(1, CAST(:agents AS bigint)) AS a, generate_series(1, CAST(:rows AS bigint)) AS t",
+        "INSERT INTO usage_rollups (tenant_id, agent_id, version, granularity, bucket, requests, sessions) "
+        "SELECT :tenant, 'agent-' || a, 1, g.granularity, date_trunc(g.granularity, now()) - "
+        "CASE g.granularity WHEN 'hour' THEN make_interval(hours => b::int) ELSE make_interval(days => b::int) END, "
+        "10, 2 FROM generate_series(1, CAST(:agents AS bigint)) AS a, "
+        "(VALUES ('hour'), ('day')) AS g(granularity), generate_series(0, 719) AS b",
+    ]
+    with session_scope() as session:
+        for statement in statements:
+            session.execute(text(statement), params)
+    with session_scope() as session:
+        session.execute(
+            text(
+                "ANALYZE chat_logs, trace_logs, trace_payloads, form_submissions, thread_states, thread_summaries, usage_rollups, "
+                "agent_versions, agent_drafts"
+            )
+        )
+
+
+def cleanup() -> None:
+    with session_scope() as session:
+        for model in MODELS:
+            session.execute(delete(model).where(model.tenant_id == TENANT))
+
+
+def checks() -> Iterator[Tuple[str, Callable[[], Any]]]:
+    first_messages = get_thread_messages(TENANT, AGENT, "thread-1", limit=5)
+    first_traces = list_traces(TENANT, AGENT, limit=5)
+    first_submissions = list_form_submissions(TENANT, AGENT, limit=5)
+    first_threads = list_threads(TENANT, AGENT, limit=5)
+    yield "get_thread_messages", lambda: get_thread_messages(TENANT, AGENT, "thread-1", limit=5)
+    yield "get_thread_messages (next page)", lambda: get_thread_messages(
+        TENANT, AGENT, "thread-1", limit=5, cursor=first_messages["next_cursor"]
+    )
+    yield "list_traces", lambda: list_traces(TENANT, AGENT)
+    yield "list_traces (next page)", lambda: list_traces(TENANT, AGENT, cursor=first_traces["next_cursor"])
+    yield "list_traces (thread)", lambda: list_traces(TENANT, AGENT, thread_id="thread-3")
+    yield "list_traces (errors)", lambda: list_traces(TENANT, AGENT, status="error")
+    yield "get_trace", lambda: get_trace(TENANT, AGENT, first_traces["traces"][0]["trace_id"])
+    yield "list_form_submissions", lambda: list_form_submissions(TENANT, AGENT)
+    yield "list_form_submissions (next page)", lambda: list_form_submissions(
+        TENANT, AGENT, cursor=first_submissions["next_cursor"]
+    )
+    yield "list_form_submissions (form)", lambda: list_form_submissions(TENANT, AGENT, form_id="form-3")
+    yield "list_form_submissions (thread)", lambda: list_form_submissions(TENANT, AGENT, thread_id="thread-7")
+    yield "list_form_submissions (type, dates)", lambda: list_form_submissions(
+        TENANT, AGENT, delivery_type="email", start_date="2000-01-01", end_date="2100-01-01"
+    )
+    yield "stream_form_submissions (form)", lambda: sum(1 for _ in stream_form_submissions(TENANT, AGENT, "form-3"))
+    yield "get_thread_state_entry", lambda: get_thread_state_entry(TENANT, AGENT, 1, "thread-5")
+    yield "list_threads", lambda: list_threads(TENANT, AGENT)
+    yield "list_threads (next page)", lambda: list_threads(TENANT, AGENT, cursor=first_threads["next_cursor"])
+    yield "list_threads (completed, form)", lambda: list_threads(TENANT, AGENT, completed=True, form_id="form-4")
+    yield "get_usage_metrics", lambda: get_usage_metrics(TENANT, AGENT)
+    yield "list_usage_rollups (hour)", lambda: list_usage_rollups(
+        TENANT, AGENT, "hour", datetime.now(timezone.utc) - timedelta(days=3)
+    )
+    yield "list_agents", lambda: list_agents(TENANT)
+    for table in LOG_TABLES:
+        partition = f"{table}_p{datetime.now(timezone.utc):%Y%m}"
+        yield f"list_log_partition_agents ({table})", lambda partition=partition: list_log_partition_agents(partition)
+
+
+def capture(fn: Callable[[], Any]) -> List[Tuple[str, Any]]:
+    statements: List[Tuple[str, Any]] = []
+
+    def record(_conn, _cursor, statement, parameters, _context, _executemany) -> None:
+        if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            statements.append((statement, parameters))
+
+    engines = {id(engine): engine for engine in (get_engine(), get_read_engine())}.values()
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", record)
+    try:
+        fn()
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", record)
+    return statements
+
+
+def problems(plan: Dict[str, Any], sizes: Dict[str, float], min_rows: int) -> List[str]:
+    found = []
+    node = plan["Plan"] if "Plan" in plan else plan
+    kind = node.get("Node Type")
+    relation = node.get("Relation Name")
+    if kind == "Seq Scan" and sizes.get(relation, 0) >= min_rows:
+        found.append(f"Seq Scan on {relation} ({int(sizes[relation])} rows)")
+    if kind in ("Sort", "Incremental Sort"):
+        child_rows = max((child.get("Plan Rows", 0) for child in node.get("Plans", [])), default=0)
+        if child_rows > min_rows:
+            found.append(f"{kind} of ~{int(child_rows)} rows")
+    for child in node.get("Plans", []):
+        found.extend(problems(child, sizes, min_rows))
+    return found
+
+
+def scans(plan: Dict[str, Any]) -> List[str]:
+    node = plan["Plan"] if "Plan" in plan else plan
+    found = []
+    relation = node.get("Relation Name") or ""
+    partition = PARTITION.match(relation)
+    if partition:
+        found.append(f"{partition.group(1)} partitions")
+    elif "Index Name" in node:
+        found.append(node["Index Name"])
+    elif relation:
+        found.append(f"{node['Node Type']} {relation}")
+    for child in node.get("Plans", []):
+        found.extend(scans(child))
+    return found
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--agents", type=int, default=50)
+    parser.add_argument("--rows", type=int, default=2000, help="rows per agent in each seeded table")
+    parser.add_argument("--min-rows", type=int, default=1000, help="relations smaller than this may be seq scanned")
+    parser.add_argument("--keep", action="store_true", help="keep the seeded rows")
+    args = parser.parse_args()
+
+    cleanup()
+    seed(args.agents, args.rows)
+    failures = 0
+    try:
+        with get_engine().connect() as connection:
+            sizes = dict(connection.execute(text("SELECT relname, reltuples FROM pg_class WHERE relkind = 'r'")).all())
+            for name, fn in checks():
+                for statement, parameters in capture(fn):
+                    plan = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters).scalar()[0]
+                    found = problems(plan, sizes, args.min_rows)
+                    failures += bool(found)
+                    status = "FAIL" if found else "ok"
+                    used = sorted(set(scans(plan)))
+                    detail = "; ".join(found) if found else ", ".join(used)
+                    print(f"{status:4} {name:38} {detail}")
+            connection.rollback()
+    finally:
+        if not args.keep:
+            cleanup()
+    if failures:
+        print(f"{failures} statement(s) without an index-driven plan")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""Run one chat/trace log partition maintenance pass (for cron when the builder's own schedule is disabled).
+
+Usage: POSTGRES_DSN=... [LOG_RETENTION_MONTHS=12] [LOG_ARCHIVE_SCHEMA=log_archive] python scripts/maintain_log_partitions.py
+
+Creates the monthly partitions for the next LOG_PARTITION_MONTHS_AHEAD months and
+expires months past their retention, then prints what it did.
+"""
+
+import json
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+from app.log_retention import run_log_maintenance
+
+
+def main() -> None:
+    report = run_log_maintenance()
+    if report is None:
+        print("Another process is maintaining the log partitions.", file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
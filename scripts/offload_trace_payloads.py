@@ -0,0 +1,39 @@
+"""Move trace documents written before 0020_trace_payloads out of trace_logs into compressed trace_payloads.
+
+Usage: POSTGRES_DSN=... python scripts/offload_trace_payloads.py [--batch-size 500]
+
+Each batch is one transaction (rows locked by another run are skipped) and the
+walk continues from the last key of the previous batch, so a full run reads each
+row once; the script can be stopped and restarted at any point. Prints the number
+of traces moved.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+from app.storage import offload_trace_payloads
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    moved = 0
+    after = None
+    while True:
+        count, after = offload_trace_payloads(args.batch_size, after)
+        if after is None:
+            break
+        moved += count
+        print(f"moved {moved} traces", file=sys.stderr)
+    print(moved)
+
+
+if __name__ == "__main__":
+    main()